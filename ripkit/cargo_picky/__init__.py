@@ -21,6 +21,8 @@ from .cargo_builder import (
     build_crate,
     get_target_productions,
     is_executable,
+    clean_crate,
+    config_target_dir,
 )
 
 #from .cargo_reg_puller import (
@@ -38,6 +40,35 @@ from .cargo_builder import (
 #    get_file_type,
 #)
 
+from .build_scheduler import (
+    BuildJob,
+    BuildResult,
+    BuildScheduler,
+    build_crates,
+)
+
+from .build_matrix import (
+    build_matrix,
+    fetch_crate,
+    matrix_jobs,
+    read_manifest,
+    write_manifest,
+)
+
+from .vendor import (
+    vendor_crates,
+    vendor_config,
+    vendored_packages,
+    VENDOR_DIR,
+)
+
+from .rustc_cache import (
+    RustcCache,
+    install_wrapper,
+    RUSTC_CACHE_DIR,
+    DEFAULT_CACHE_SIZE,
+)
+
 from .cargo_types import (
     Cargodb,
     FileType,
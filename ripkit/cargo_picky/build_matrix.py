@@ -0,0 +1,180 @@
+"""
+Build crates at every combination of opt level, target and strip mode
+
+The dependencies of each crate are fetched once up front, or come from
+the vendored mirror, and then every configuration is built --offline.
+The builds run in parallel on the BuildScheduler, each in its own target
+dir, and can share compiled dependencies through the rustc cache.
+
+Every configuration gets a manifest.json in its target dir listing what
+it built:
+
+{
+    "crate": "exa",
+    "opt_lvl": "O3",
+    "target": "x86_64-unknown-linux-gnu",
+    "strip": "NOSTRIP",
+    "ok": true,
+    "seconds": 12.3,
+    "error": "",
+    "artifacts": [
+        {"path": ..., "size": ..., "sha256": ..., "executable": true},
+    ]
+}
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from .crates_io import LocalCratesIO
+from .cargo_types import RustcTarget, RustcStripFlags, RustcOptimization
+from .cargo_builder import config_target_dir, get_target_productions, \
+                           is_executable
+from .build_scheduler import BuildJob, BuildResult, build_crates, \
+                             DEFAULT_MEM_PER_BUILD
+
+
+MANIFEST_NAME = "manifest.json"
+
+
+def fetch_crate(crate: str)->tuple[bool, str]:
+    '''
+    Download the dependencies of the crate for every target so its
+    builds can run --offline. Returns if it worked and cargo's error
+    '''
+    crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(crate)
+    if not crate_path.exists():
+        return False, f"Crate {crate} has not been cloned"
+
+    res = subprocess.run(["cargo", "fetch"], cwd=crate_path,
+                         capture_output=True, text=True)
+    return res.returncode == 0, res.stderr.strip()
+
+
+def _sha256(path: Path)->str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def manifest_path(job: BuildJob)->Path:
+    crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(
+                                                                job.crate)
+    return config_target_dir(crate_path, job.target, job.opt_lvl,
+                             job.strip).joinpath(MANIFEST_NAME)
+
+
+def write_manifest(res: BuildResult)->Path:
+    '''
+    Write the manifest of the build's configuration, returns its path
+    '''
+    job = res.job
+    artifacts = []
+    if res.ok:
+        for path in get_target_productions(job.crate, job.target,
+                                           opt_lvl=job.opt_lvl,
+                                           strip=job.strip):
+            artifacts.append({
+                'path': str(path.resolve()),
+                'size': path.stat().st_size,
+                'sha256': _sha256(path),
+                'executable': is_executable(path),
+            })
+
+    manifest = {
+        'crate': job.crate,
+        'opt_lvl': job.opt_lvl.name,
+        'target': job.target.value,
+        'strip': job.strip.name,
+        'ok': res.ok,
+        'seconds': round(res.seconds, 3),
+        'error': res.error,
+        'artifacts': artifacts,
+    }
+
+    path = manifest_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{MANIFEST_NAME}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp, path)
+    return path
+
+
+def read_manifest(job: BuildJob)->Optional[dict]:
+    '''
+    The manifest of the job's configuration, None if it wasn't built
+    '''
+    path = manifest_path(job)
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def matrix_jobs(crates: Iterable[str],
+                opt_lvls: Iterable[RustcOptimization],
+                targets: Iterable[RustcTarget],
+                strips: Iterable[RustcStripFlags])->list[BuildJob]:
+    '''
+    A job for every combination, cargo builds the native target and
+    cross everything else like the other build commands
+    '''
+    return [BuildJob(crate, opt, target, strip,
+                     use_cargo=target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU,
+                     offline=True)
+            for crate, target, opt, strip in itertools.product(
+                crates, targets, opt_lvls, strips)]
+
+
+def build_matrix(crates: Iterable[str],
+                 opt_lvls: Iterable[RustcOptimization],
+                 targets: Iterable[RustcTarget],
+                 strips: Iterable[RustcStripFlags],
+                 parallel: Optional[int] = None,
+                 mem_per_build: Optional[int] = DEFAULT_MEM_PER_BUILD,
+                 on_done: Optional[Callable[[BuildResult], None]] = None,
+                 rustc_wrapper: Optional[Path] = None,
+                 vendor_config: Optional[Path] = None)->list[BuildResult]:
+    '''
+    Build every combination of the crates, opt levels, targets and strip
+    modes and write the manifest of each. on_done is called with every
+    result after its manifest is written.
+
+    With vendor_config the dependencies come from the vendored mirror
+    and nothing is fetched
+    '''
+    crates = list(crates)
+    jobs = matrix_jobs(crates, list(opt_lvls), list(targets), list(strips))
+    results = []
+
+    def done(res: BuildResult):
+        # No target dir to write to for a crate that isn't there
+        if Path(LocalCratesIO.CRATES_DIR.value).joinpath(res.job.crate).exists():
+            write_manifest(res)
+        results.append(res)
+        if on_done is not None:
+            on_done(res)
+
+    # A crate whose dependencies can't be fetched can't build offline
+    failed_fetch = {}
+    if vendor_config is None:
+        for crate in crates:
+            ok, error = fetch_crate(crate)
+            if not ok:
+                failed_fetch[crate] = f"cargo fetch failed: {error}"
+
+    for job in [x for x in jobs if x.crate in failed_fetch]:
+        done(BuildResult(job, False, 0, failed_fetch[job.crate]))
+
+    build_crates([x for x in jobs if x.crate not in failed_fetch],
+                 parallel, mem_per_build, done, rustc_wrapper,
+                 vendor_config)
+    return results
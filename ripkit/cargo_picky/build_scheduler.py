@@ -0,0 +1,252 @@
+"""
+Run many crate builds at once
+
+One cargo build of a small crate leaves most of a build host idle, so
+the scheduler keeps several builds running. Each build gets a share of
+the cores with cargo --jobs so together they use about all of them and
+not more.
+
+Big crates can take gigabytes each to link, so a new build is only
+started while /proc/meminfo says there is room for it. Builds that only
+just started haven't allocated much yet, they are counted as already
+using their share so a burst of starts can't overcommit.
+
+Every build runs in its own process group. If the scheduler stops early,
+ie Ctrl-C or an on_done that raised, the whole group of each running
+build is killed so no cargo or rustc outlives it.
+"""
+
+import os
+import signal
+import subprocess
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from .crates_io import LocalCratesIO
+from .cargo_types import RustcTarget, RustcStripFlags, RustcOptimization
+from .cargo_builder import gen_cargo_build_cmd, gen_cross_build_cmd
+
+
+# Memory assumed for one build until /proc/meminfo says otherwise
+DEFAULT_MEM_PER_BUILD = 2 << 30
+
+# Seconds a started build is assumed to not have allocated its memory
+_RAMP_SECS = 15
+
+# How often to check on the running builds
+_POLL_SECS = 0.2
+
+# Lines of stderr kept for a failed build
+_ERROR_LINES = 20
+
+
+@dataclass(frozen=True)
+class BuildJob:
+    crate: str
+    opt_lvl: RustcOptimization
+    target: RustcTarget
+    strip: RustcStripFlags = RustcStripFlags.NOSTRIP
+    use_cargo: bool = True
+    # Build with the already fetched dependencies only
+    offline: bool = False
+
+
+@dataclass
+class BuildResult:
+    job: BuildJob
+    ok: bool
+    seconds: float
+    error: str = ""
+
+
+def available_cores()->int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory()->Optional[int]:
+    '''
+    MemAvailable from /proc/meminfo in bytes, None where there isn't one
+    '''
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def build_command(job: BuildJob, jobs: Optional[int] = None,
+                  rustc_wrapper: Optional[Path] = None,
+                  vendor_config: Optional[Path] = None)->str:
+    '''
+    The shell command that builds the job. rustc_wrapper and
+    vendor_config are only used by cargo builds
+    '''
+    crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(
+                                                                job.crate)
+    if job.use_cargo:
+        return gen_cargo_build_cmd(crate_path, job.target, job.strip,
+                                   job.opt_lvl, jobs=jobs,
+                                   rustc_wrapper=rustc_wrapper,
+                                   offline=job.offline,
+                                   vendor_config=vendor_config)
+    return gen_cross_build_cmd(crate_path, job.target, job.strip,
+                               job.opt_lvl, jobs=jobs, offline=job.offline)
+
+
+@dataclass
+class _Running:
+    job: BuildJob
+    proc: subprocess.Popen
+    stderr: object
+    start: float
+
+
+class BuildScheduler():
+    '''
+    Run build jobs with at most parallel at once.
+
+    parallel defaults to about one build for every 4 cores and is at
+    most the number of cores. Each build gets cores // parallel cargo
+    jobs. mem_per_build is the memory to leave for every build, None
+    turns off the memory check. rustc_wrapper is the RUSTC_WRAPPER of
+    the builds, ie the compiled dependency cache, and vendor_config the
+    dependency mirror to build from
+    '''
+
+    def __init__(self, parallel: Optional[int] = None,
+                 mem_per_build: Optional[int] = DEFAULT_MEM_PER_BUILD,
+                 cores: Optional[int] = None,
+                 rustc_wrapper: Optional[Path] = None,
+                 vendor_config: Optional[Path] = None):
+        self.cores = cores if cores else available_cores()
+        self.parallel = parallel if parallel else max(1, self.cores // 4)
+        # Every build gets at least one core, more builds than cores
+        # would go over the --jobs budget
+        if self.parallel > self.cores:
+            print(f"Running {self.cores} builds at once, not {self.parallel}, "
+                  f"there are only {self.cores} cores")
+            self.parallel = self.cores
+        self.jobs_per_build = max(1, self.cores // self.parallel)
+        self.mem_per_build = mem_per_build
+        self.rustc_wrapper = rustc_wrapper
+        self.vendor_config = vendor_config
+
+    def _has_memory(self, running: list[_Running])->bool:
+        # Always let one build run, otherwise nothing would ever build on
+        # a box with less than mem_per_build free
+        if self.mem_per_build is None or running == []:
+            return True
+        free = available_memory()
+        if free is None:
+            return True
+        now = time.monotonic()
+        ramping = len([x for x in running if now - x.start < _RAMP_SECS])
+        return free - ramping * self.mem_per_build >= self.mem_per_build
+
+    def _start(self, job: BuildJob)->_Running:
+        crate_path = Path(LocalCratesIO.CRATES_DIR.value).joinpath(job.crate)
+        if not crate_path.exists():
+            raise FileNotFoundError(f"Crate {job.crate} has not been cloned")
+
+        stderr = tempfile.TemporaryFile()
+        proc = subprocess.Popen(build_command(job, self.jobs_per_build,
+                                              self.rustc_wrapper,
+                                              self.vendor_config),
+                                shell=True,
+                                stdout=subprocess.DEVNULL,
+                                stderr=stderr,
+                                start_new_session=True)
+        return _Running(job, proc, stderr, time.monotonic())
+
+    def _kill(self, run: _Running):
+        '''
+        Stop a build that is still running, with all its children
+        '''
+        try:
+            os.killpg(run.proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        try:
+            run.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(run.proc.pid, signal.SIGKILL)
+            run.proc.wait()
+        run.stderr.close()
+
+    def _finish(self, run: _Running)->BuildResult:
+        secs = time.monotonic() - run.start
+        error = ""
+        if run.proc.returncode != 0:
+            run.stderr.seek(0)
+            lines = run.stderr.read().decode(errors='replace').splitlines()
+            error = "\n".join(lines[-_ERROR_LINES:])
+        run.stderr.close()
+        return BuildResult(run.job, run.proc.returncode == 0, secs, error)
+
+    def run(self, jobs: Iterable[BuildJob],
+            on_done: Optional[Callable[[BuildResult], None]] = None
+            )->list[BuildResult]:
+        '''
+        Build every job. on_done is called in this process with the
+        result of each build as it finishes. Nothing is started or
+        polled while it runs, hand slow work like analyzing the binaries
+        off to another thread
+        '''
+
+        pending = deque(jobs)
+        running: list[_Running] = []
+        results = []
+
+        def done(res: BuildResult):
+            results.append(res)
+            if on_done is not None:
+                on_done(res)
+
+        try:
+            while pending or running:
+                # Start what the build slots and memory allow
+                while pending and len(running) < self.parallel and \
+                        self._has_memory(running):
+                    job = pending.popleft()
+                    try:
+                        running.append(self._start(job))
+                    except Exception as e:
+                        done(BuildResult(job, False, 0, str(e)))
+
+                finished = [x for x in running if x.proc.poll() is not None]
+                if finished == []:
+                    time.sleep(_POLL_SECS)
+                    continue
+
+                for run in finished:
+                    running.remove(run)
+                    done(self._finish(run))
+        finally:
+            for run in running:
+                self._kill(run)
+
+        return results
+
+
+def build_crates(jobs: Iterable[BuildJob], parallel: Optional[int] = None,
+                 mem_per_build: Optional[int] = DEFAULT_MEM_PER_BUILD,
+                 on_done: Optional[Callable[[BuildResult], None]] = None,
+                 rustc_wrapper: Optional[Path] = None,
+                 vendor_config: Optional[Path] = None
+                 )->list[BuildResult]:
+    '''
+    Build the jobs in parallel, see BuildScheduler
+    '''
+    return BuildScheduler(parallel, mem_per_build,
+                          rustc_wrapper=rustc_wrapper,
+                          vendor_config=vendor_config).run(jobs, on_done)
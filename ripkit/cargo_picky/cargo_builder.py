@@ -32,13 +32,44 @@ from pathlib import Path
 import subprocess
 from typing import Optional
 import os
+import shutil
 from .crates_io import LocalCratesIO
 from .cargo_types import RustcTarget, CargoVariables, RustcStripFlags,\
                         RustcOptimization, Cargodb, FileType
 
+def config_dir_name(target: RustcTarget, 
+                    opt_lvl: Optional[RustcOptimization] = None,
+                    strip_cmd: Optional[RustcStripFlags] = None)->str:
+    '''
+    Name of the target dir of a build configuration, ie 
+    x86_64-unknown-linux-gnu_O3_NOSTRIP
+    '''
+    # The names, and not the values, are the same in the cargo_picky and 
+    # ripbin optimization enums
+    opt = opt_lvl.name if opt_lvl is not None else "default"
+    strip = strip_cmd.name if strip_cmd is not None else "default"
+    return f"{target.value}_{opt}_{strip}"
+
+
+def config_target_dir(proj_path: Path, target: RustcTarget, 
+                      opt_lvl: Optional[RustcOptimization] = None,
+                      strip_cmd: Optional[RustcStripFlags] = None)->Path:
+    '''
+    The CARGO_TARGET_DIR of a build configuration of the crate. Every 
+    configuration has its own so they can all be built, and rebuilt
+    incrementally, without cleaning out each other's artifacts
+    '''
+    return Path(proj_path).joinpath("target", "ripkit", 
+                            config_dir_name(target, opt_lvl, strip_cmd))
+
+
 def gen_cargo_build_cmd(proj_path: Path, target: RustcTarget, 
                         strip_cmd: Optional[RustcStripFlags] = None, 
-                        opt_lvl: Optional[RustcOptimization] = None):
+                        opt_lvl: Optional[RustcOptimization] = None,
+                        jobs: Optional[int] = None,
+                        rustc_wrapper: Optional[Path] = None,
+                        offline: bool = False,
+                        vendor_config: Optional[Path] = None):
     # First build the environment variables,
     # the CARGO_ENCODED_RUSTC_FLAGS -otherwise called- 
     #   CargoVariables.RUSTC_FLAGS 
@@ -47,14 +78,35 @@ def gen_cargo_build_cmd(proj_path: Path, target: RustcTarget,
     # And CARGO_PROFILE_DEV_OPT_LEVEL -otherwise called-
     #   CargoVariables.DEV_PROF_SET_OPT_LEVEL 
     # Is being used to set the optimizaition level
-    substrs = [f"cd {proj_path} && cargo clean &&"]
+    #
+    # And CARGO_TARGET_DIR is the dir of this configuration, so there
+    # is no need to cargo clean before every build
+    #
+    # And RUSTC_WRAPPER, when given, is the compiled dependency cache 
+    # from rustc_cache.install_wrapper
+    #
+    # And vendor_config, when given, points cargo at the dependency 
+    # mirror from vendor.vendor_crates instead of the network
+    substrs = [f"cd {proj_path} &&"]
+    substrs.append(f"{CargoVariables.TARGET_DIR.value}="
+                   f"{config_target_dir(proj_path, target, opt_lvl, strip_cmd)}")
     if strip_cmd is not None:
         substrs.append(f"{CargoVariables.RUSTC_FLAGS.value}='{strip_cmd.value}'")
     if opt_lvl is not None:
         substrs.append(f" {CargoVariables.DEV_PROF_SET_OPT_LEVEL.value}={opt_lvl.value}")
+    if rustc_wrapper is not None:
+        substrs.append(f"{CargoVariables.RUSTC_WRAPPER.value}={rustc_wrapper}")
 
     #substrs.append(f"cd {proj_path} && cargo clean && cargo build --target={target.value}")
     substrs.append(f"cargo build --target={target.value}")
+    # Number of rustc jobs, so parallel builds share the cores
+    if jobs is not None:
+        substrs.append(f"--jobs={jobs}")
+    if vendor_config is not None:
+        substrs.append(f"--config={vendor_config}")
+    # The dependencies were already fetched, don't touch the network
+    if offline or vendor_config is not None:
+        substrs.append("--offline")
     #substrs.append(f"cd {proj_path} && cross build --manifest-path={proj_path.resolve()}/Cargo.toml --target={target.value}")
 
     full_build_str = " ".join(x for x in substrs)
@@ -64,7 +116,9 @@ def gen_cargo_build_cmd(proj_path: Path, target: RustcTarget,
 
 def gen_cross_build_cmd(proj_path: Path, target: RustcTarget, 
                         strip_cmd: Optional[RustcStripFlags] = None, 
-                        opt_lvl: Optional[RustcOptimization] = None):
+                        opt_lvl: Optional[RustcOptimization] = None,
+                        jobs: Optional[int] = None,
+                        offline: bool = False):
     # First build the environment variables,
     # the CARGO_ENCODED_RUSTC_FLAGS -otherwise called- 
     #   CargoVariables.RUSTC_FLAGS 
@@ -73,30 +127,72 @@ def gen_cross_build_cmd(proj_path: Path, target: RustcTarget,
     # And CARGO_PROFILE_DEV_OPT_LEVEL -otherwise called-
     #   CargoVariables.DEV_PROF_SET_OPT_LEVEL 
     # Is being used to set the optimizaition level
-    substrs = []
+    #
+    # The variables have to come after the cd to be set for cross
+    substrs = [f"cd {proj_path} &&"]
+    substrs.append(f"{CargoVariables.TARGET_DIR.value}="
+                   f"{config_target_dir(proj_path, target, opt_lvl, strip_cmd)}")
     if strip_cmd is not None:
         substrs.append(f"{CargoVariables.RUSTC_FLAGS.value}='{strip_cmd.value}'")
     if opt_lvl is not None:
         substrs.append(f" {CargoVariables.DEV_PROF_SET_OPT_LEVEL.value}={opt_lvl.value}")
 
-    substrs.append(f"cd {proj_path} && cross build --target={target.value}")
+    substrs.append(f"cross build --target={target.value}")
+    if jobs is not None:
+        substrs.append(f"--jobs={jobs}")
+    if offline:
+        substrs.append("--offline")
 
     full_build_str = " ".join(x for x in substrs)
     return full_build_str
 
 
+def clean_crate(crate: str, target: Optional[RustcTarget] = None,
+                opt_lvl: Optional[RustcOptimization] = None,
+                strip: Optional[RustcStripFlags] = None)->list[Path]:
+    '''
+    Remove the target dirs of the crate's build configurations that match
+    target, opt_lvl and strip, None matches any. With no filters the 
+    whole target dir goes, like cargo clean. Returns the dirs removed
+    '''
+
+    crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(crate)
+    if target is None and opt_lvl is None and strip is None:
+        dirs = [crate_path.joinpath("target")]
+    else:
+        pattern = "_".join([
+            target.value if target is not None else "*",
+            opt_lvl.name if opt_lvl is not None else "*",
+            strip.name if strip is not None else "*"])
+        dirs = list(crate_path.joinpath("target", "ripkit").glob(pattern))
+
+    removed = []
+    for dir in dirs:
+        if dir.is_dir():
+            shutil.rmtree(dir)
+            removed.append(dir)
+    return removed
+
+
 def build_crate(crate: str, 
                 opt_lvl: RustcOptimization = RustcOptimization.O0,
                 target: RustcTarget = RustcTarget.X86_64_UNKNOWN_LINUX_GNU, 
                 strip: RustcStripFlags = RustcStripFlags.NOSTRIP,
                 use_cargo=False,
-                debug=False)->None:
-    ''' Build the repo '''
+                debug=False,
+                rustc_wrapper: Optional[Path] = None,
+                vendor_config: Optional[Path] = None)->None:
+    ''' 
+    Build the repo. rustc_wrapper and vendor_config only apply to cargo
+    builds, cross builds in a container that can't see them
+    '''
 
     crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(crate)
 
     if use_cargo:
-        cmd = gen_cargo_build_cmd(crate_path,target,strip, opt_lvl)
+        cmd = gen_cargo_build_cmd(crate_path,target,strip, opt_lvl,
+                                  rustc_wrapper=rustc_wrapper,
+                                  vendor_config=vendor_config)
     else:
         cmd = gen_cross_build_cmd(crate_path,target,strip, opt_lvl)
 
@@ -248,21 +344,38 @@ def find_built_files(target_path:Path,
 
 def get_target_productions(crate: str, target: RustcTarget, 
                           target_suffixes: list[str] = [".rlib"],
-                          exclude_suffixes: list[str] = [".rmeta"]):
+                          exclude_suffixes: list[str] = [".rmeta"],
+                          opt_lvl: Optional[RustcOptimization] = None,
+                          strip: Optional[RustcStripFlags] = None):
     """
     Grab a specific target produced files
+
+    With opt_lvl or strip the files are from the target dir of that
+    build configuration. Otherwise they are from every configuration of
+    the target that was built, and from the crate's plain target dir
+    that builds used before each configuration got its own
     """
 
     # Target dir is the base target dir of the crate
     #target_dir = CLONED_DIR.joinpath(crate).joinpath("target")
 
-    target_dir = Path(LocalCratesIO.CRATES_DIR.value).joinpath(crate).joinpath("target")
+    crate_path = Path(LocalCratesIO.CRATES_DIR.value).joinpath(crate)
+    if opt_lvl is None and strip is None:
+        target_dirs = [crate_path.joinpath("target")]
+        target_dirs.extend(sorted(crate_path.joinpath("target", 
+                                  "ripkit").glob(f"{target.value}_*")))
+    else:
+        target_dirs = [config_target_dir(crate_path, target, opt_lvl, 
+                                         strip)]
 
     # If the specific target exists as a sub dir of the general target 
     # dir, grab the files of interest from it 
-    if (dir:=target_dir.joinpath(str(target.value))).exists():
-        return find_built_files(dir,target_suffixes,exclude_suffixes)
-    return []
+    files = []
+    for target_dir in target_dirs:
+        if (dir:=target_dir.joinpath(str(target.value))).exists():
+            files.extend(find_built_files(dir,target_suffixes,
+                                          exclude_suffixes))
+    return files
 
 
 
@@ -53,6 +53,8 @@ class CargoVariables(Enum):
     RUSTC_FLAGS = "CARGO_ENCODED_RUSTFLAGS"
     DEV_PROF_SET_OPT_LEVEL = "CARGO_PROFILE_DEV_OPT_LEVEL"
     RELEASE_PROF_SET_OPT_LEVEL = "CARGO_PROFILE_RELEASE_OPT_LEVEL"
+    TARGET_DIR = "CARGO_TARGET_DIR"
+    RUSTC_WRAPPER = "RUSTC_WRAPPER"
 
 
 
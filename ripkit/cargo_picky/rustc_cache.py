@@ -0,0 +1,418 @@
+"""
+Cache of compiled dependencies shared by every cloned crate
+
+Most crates pull in the same popular dependencies and every crate's
+build compiles them again in its own target dir. With the cache on,
+cargo runs rustc through this module (RUSTC_WRAPPER). Compiling a
+dependency from the registry, git or the vendored mirror is keyed by the
+crate, version, source dir, features, target, rustc version and the rest
+of the flags, and a hit copies the artifacts from the cache instead of
+running rustc. The source dir tells apart git revisions of the same
+version, cargo checks each one out to its own dir.
+
+The crates being built themselves, build scripts and path dependencies
+always go to rustc.
+
+rustc_cache
+| rustc_wrapper.sh
+| cache.sqlite      hit/miss counts and the size and last use of entries
+| entries
+  | ab
+    | <key>
+      | meta.json   the artifact names, stderr and stdout of rustc
+      | <artifacts>
+
+Paths into the target dir of the build that made an entry are stored
+as a placeholder and put back for the build that uses it. The cache is
+kept under a size cap by removing the least recently used entries.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+
+RUSTC_CACHE_DIR = Path("~/.crates_io/rustc_cache").expanduser()
+
+DEFAULT_CACHE_SIZE = 20 << 30
+
+# Set by the wrapper script, the cache dir and its size cap in bytes
+_CACHE_DIR_ENV = "RIPKIT_RUSTC_CACHE_DIR"
+_CACHE_SIZE_ENV = "RIPKIT_RUSTC_CACHE_SIZE"
+
+# Stands in for the out dir in the stored dep-info files and messages
+_OUT_DIR_TOKEN = "@RIPKIT_OUT_DIR@"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    crate TEXT,
+    size INTEGER,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    count INTEGER
+);
+"""
+
+
+class RustcCache():
+    '''
+    The compiled dependencies in cache_dir, kept under max_size bytes
+    '''
+
+    def __init__(self, cache_dir: Path = RUSTC_CACHE_DIR,
+                 max_size: int = DEFAULT_CACHE_SIZE):
+        self.root = Path(cache_dir)
+        self.entries = self.root.joinpath("entries")
+        self.max_size = max_size
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Parallel builds all write here, wait on the lock
+        self.conn = sqlite3.connect(self.root.joinpath("cache.sqlite"),
+                                    timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self)->None:
+        self.conn.close()
+
+    def entry_path(self, key: str)->Path:
+        return self.entries.joinpath(key[:2], key)
+
+    def count(self, name: str)->None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO stats VALUES (?, 1) ON CONFLICT(name) "
+                "DO UPDATE SET count = count + 1", (name,))
+
+    def stats(self)->dict[str, int]:
+        '''
+        hits, misses, uncacheable rustc runs, entries and bytes cached
+        '''
+        stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+        for name, count in self.conn.execute("SELECT * FROM stats"):
+            stats[name] = count
+        entries, size = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        stats['entries'] = entries
+        stats['bytes'] = size
+        return stats
+
+    def lookup(self, key: str)->Optional[Path]:
+        entry = self.entry_path(key)
+        if not entry.joinpath("meta.json").exists():
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE entries SET last_used=? WHERE key=?",
+                              (time.time(), key))
+        return entry
+
+    def store(self, key: str, crate: str, out_dir: Path,
+              artifacts: list[Path], stdout: str, stderr: str)->None:
+        '''
+        Add the artifacts of a rustc run to the cache
+        '''
+        entry = self.entry_path(key)
+        if entry.exists():
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+
+        # Built next to the entry and renamed in, a reader never sees
+        # part of one
+        work = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=entry.parent))
+        try:
+            for artifact in artifacts:
+                if artifact.suffix == ".d":
+                    # dep-info has the paths of the outputs in it
+                    text = artifact.read_text()
+                    work.joinpath(artifact.name).write_text(
+                        text.replace(str(out_dir), _OUT_DIR_TOKEN))
+                else:
+                    shutil.copyfile(artifact, work.joinpath(artifact.name))
+            meta = {
+                'crate': crate,
+                'artifacts': [x.name for x in artifacts],
+                'stdout': stdout.replace(str(out_dir), _OUT_DIR_TOKEN),
+                'stderr': stderr.replace(str(out_dir), _OUT_DIR_TOKEN),
+            }
+            with open(work.joinpath("meta.json"), 'w') as f:
+                json.dump(meta, f)
+            os.rename(work, entry)
+        except OSError:
+            # Another build stored the same entry first
+            shutil.rmtree(work, ignore_errors=True)
+            return
+
+        size = sum(x.stat().st_size for x in entry.iterdir())
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?,?,?,?)",
+                (key, crate, size, time.time()))
+        self.evict()
+
+    def restore(self, entry: Path, out_dir: Path)->tuple[str, str]:
+        '''
+        Copy the artifacts of the entry to out_dir, returns rustc's
+        stdout and stderr for them
+        '''
+        with open(entry.joinpath("meta.json"), 'r') as f:
+            meta = json.load(f)
+
+        for name in meta['artifacts']:
+            src = entry.joinpath(name)
+            dest = out_dir.joinpath(name)
+            # Copied, not linked, so the outputs are newer than the
+            # sources like cargo expects
+            tmp = out_dir.joinpath(f".{name}.ripkit")
+            if name.endswith(".d"):
+                tmp.write_text(src.read_text().replace(_OUT_DIR_TOKEN,
+                                                       str(out_dir)))
+            else:
+                shutil.copyfile(src, tmp)
+                shutil.copymode(src, tmp)
+            os.replace(tmp, dest)
+
+        return (meta['stdout'].replace(_OUT_DIR_TOKEN, str(out_dir)),
+                meta['stderr'].replace(_OUT_DIR_TOKEN, str(out_dir)))
+
+    def evict(self)->int:
+        '''
+        Remove the least recently used entries until the cache is under
+        its size cap. Returns the number removed
+        '''
+        total = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        removed = 0
+        if total <= self.max_size:
+            return removed
+
+        rows = self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(self.entry_path(key), ignore_errors=True)
+            with self.conn:
+                self.conn.execute("DELETE FROM entries WHERE key=?", (key,))
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self)->None:
+        shutil.rmtree(self.entries, ignore_errors=True)
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM stats")
+
+
+def install_wrapper(cache_dir: Path = RUSTC_CACHE_DIR,
+                    max_size: int = DEFAULT_CACHE_SIZE)->Path:
+    '''
+    Write the script to use as RUSTC_WRAPPER, cargo wants one executable
+    and no arguments. Returns its path. This module only uses the stdlib
+    so the script runs it as a plain file
+    '''
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    wrapper = cache_dir.joinpath("rustc_wrapper.sh")
+    script = "\n".join([
+        "#!/bin/sh",
+        f"export {_CACHE_DIR_ENV}='{cache_dir}'",
+        f"export {_CACHE_SIZE_ENV}={max_size}",
+        # The file and not -m, ripkit doesn't have to be installed
+        f"exec '{sys.executable}' '{Path(__file__).resolve()}' \"$@\"",
+        ""])
+
+    # Parallel builds may install it at the same time
+    tmp = cache_dir.joinpath(f".rustc_wrapper.{os.getpid()}")
+    tmp.write_text(script)
+    tmp.chmod(0o755)
+    os.replace(tmp, wrapper)
+    return wrapper
+
+
+def _arg_value(args: list[str], flag: str)->Optional[str]:
+    '''
+    Value of a flag passed as '<flag> <value>' or '<flag>=<value>'
+    '''
+    for i, arg in enumerate(args):
+        if arg == flag and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith(f"{flag}="):
+            return arg[len(flag) + 1:]
+    return None
+
+
+def _codegen_value(args: list[str], option: str)->Optional[str]:
+    # -C <option>=<value>
+    for i, arg in enumerate(args):
+        if arg == "-C" and i + 1 < len(args) and \
+                args[i + 1].startswith(f"{option}="):
+            return args[i + 1][len(option) + 1:]
+    return None
+
+
+def _is_cacheable(args: list[str])->bool:
+    '''
+    Only registry, git and vendored dependencies are cached, path
+    crates can change without their version changing
+    '''
+    if os.environ.get("CARGO_PRIMARY_PACKAGE") is not None:
+        return False
+    if _arg_value(args, "--out-dir") is None or \
+            _arg_value(args, "--crate-name") is None:
+        return False
+    if _arg_value(args, "--crate-type") == "bin":
+        return False
+    if _arg_value(args, "--crate-name") == "build_script_build":
+        return False
+
+    # cargo caps the lints of exactly the crates that aren't local paths
+    return _arg_value(args, "--cap-lints") is not None
+
+
+def _normalized_args(args: list[str])->list[str]:
+    '''
+    The flags without the paths that differ between the target dirs of
+    the crates that use a dependency
+    '''
+    norm = []
+    skip = False
+    for i, arg in enumerate(args):
+        if skip:
+            skip = False
+            continue
+        if arg in ["--out-dir", "-L"]:
+            skip = True
+            if arg == "-L" and not args[i + 1].startswith("dependency="):
+                norm.extend([arg, args[i + 1]])
+            continue
+        if arg == "--extern" and i + 1 < len(args):
+            # The dep's file name has its metadata hash, that's what
+            # matters and not where it is
+            name, _, path = args[i + 1].partition("=")
+            norm.extend([arg, f"{name}={Path(path).name}"])
+            skip = True
+            continue
+        if arg == "-C" and i + 1 < len(args) and \
+                args[i + 1].startswith("incremental="):
+            skip = True
+            continue
+        norm.append(arg)
+    return norm
+
+
+def _out_dir_digest()->str:
+    '''
+    Hash of what the dependency's build script generated, the source can
+    include!() it
+    '''
+    out_dir = os.environ.get("OUT_DIR")
+    hasher = hashlib.sha256()
+    if out_dir is None or not Path(out_dir).is_dir():
+        return ""
+    for path in sorted(Path(out_dir).rglob("*")):
+        if path.is_file():
+            hasher.update(str(path.relative_to(out_dir)).encode())
+            hasher.update(path.read_bytes())
+    return hasher.hexdigest()
+
+
+def cache_key(rustc: str, args: list[str])->str:
+    '''
+    Key of a rustc run, the crate, version, source dir, features,
+    target, rustc version and flags
+    '''
+    version = subprocess.run([rustc, "-vV"], capture_output=True,
+                             text=True).stdout
+    hasher = hashlib.sha256()
+    for part in [version,
+                 os.environ.get("CARGO_PKG_NAME", ""),
+                 os.environ.get("CARGO_PKG_VERSION", ""),
+                 # Git deps keep their version across commits
+                 os.environ.get("CARGO_MANIFEST_DIR", ""),
+                 _out_dir_digest(),
+                 *_normalized_args(args)]:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _outputs(out_dir: Path, crate_name: str, extra: str)->list[Path]:
+    # rustc names every output <crate><extra> with a lib prefix and a
+    # suffix for its kind
+    stem = f"{crate_name}{extra}"
+    return [x for x in out_dir.iterdir() if x.is_file() and
+            (x.name.startswith(f"lib{stem}.") or x.name.startswith(f"{stem}."))]
+
+
+def run_wrapper(argv: list[str])->int:
+    '''
+    Run as RUSTC_WRAPPER, argv is rustc and its arguments
+    '''
+    rustc, args = argv[0], argv[1:]
+
+    if not _is_cacheable(args):
+        # Only worth counting the real compiles, not cargo's probes
+        if os.environ.get("CARGO_PKG_NAME") is not None:
+            with _open_cache() as cache:
+                cache.count('uncacheable')
+        # Become rustc, it keeps cargo's jobserver fds and its signals
+        os.execvp(rustc, [rustc, *args])
+
+    out_dir = Path(_arg_value(args, "--out-dir")).resolve()
+    crate_name = _arg_value(args, "--crate-name")
+    extra = _codegen_value(args, "extra-filename") or ""
+    key = cache_key(rustc, args)
+
+    with _open_cache() as cache:
+        entry = cache.lookup(key)
+        if entry is not None:
+            try:
+                stdout, stderr = cache.restore(entry, out_dir)
+            except OSError:
+                # Evicted by another build while copying, just compile
+                entry = None
+        if entry is not None:
+            cache.count('hits')
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            return 0
+
+        # rustc takes its job tokens from the fds in CARGO_MAKEFLAGS,
+        # which close_fds would close
+        res = subprocess.run([rustc, *args], capture_output=True, text=True,
+                             close_fds=False)
+        sys.stdout.write(res.stdout)
+        sys.stderr.write(res.stderr)
+        cache.count('misses')
+        if res.returncode == 0:
+            cache.store(key, crate_name, out_dir,
+                        _outputs(out_dir, crate_name, extra),
+                        res.stdout, res.stderr)
+        return res.returncode
+
+
+def _open_cache()->RustcCache:
+    return RustcCache(Path(os.environ.get(_CACHE_DIR_ENV, RUSTC_CACHE_DIR)),
+                      int(os.environ.get(_CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE)))
+
+
+if __name__ == "__main__":
+    sys.exit(run_wrapper(sys.argv[1:]))
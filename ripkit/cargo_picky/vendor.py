@@ -0,0 +1,128 @@
+"""
+Local mirror of the dependencies of every cloned crate
+
+cargo vendor copies the sources of the dependencies of all the cloned
+crates into one directory, every version of a package once no matter
+how many crates use it. Builds given the mirror read their dependencies
+from it with --offline and never touch the network, so they work on
+hosts without any and build the same thing every time.
+
+vendor
+| config.toml           the source replacement for cargo --config
+| serde-1.0.193
+| libc-0.2.150
+| ...
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .crates_io import LocalCratesIO, CRATES_IO_DIR
+
+
+VENDOR_DIR = CRATES_IO_DIR / "vendor"
+
+VENDOR_CONFIG = "config.toml"
+
+
+def vendor_config(vendor_dir: Path = VENDOR_DIR)->Optional[Path]:
+    '''
+    The config to pass cargo to build from the mirror, None if nothing
+    has been vendored
+    '''
+    config = Path(vendor_dir).joinpath(VENDOR_CONFIG)
+    return config if config.exists() else None
+
+
+def _run_vendor(manifests: list[Path], vendor_dir: Path,
+                no_delete: bool)->subprocess.CompletedProcess:
+    cmd = ["cargo", "vendor", "--versioned-dirs",
+           "--manifest-path", str(manifests[0])]
+    for manifest in manifests[1:]:
+        cmd.extend(["--sync", str(manifest)])
+    if no_delete:
+        cmd.append("--no-delete")
+    cmd.append(str(vendor_dir))
+    return subprocess.run(cmd, capture_output=True, text=True)
+
+
+def _config_blocks(config: str)->dict[str, str]:
+    '''
+    Split the config cargo vendor prints into its [source] tables
+    '''
+    blocks = {}
+    header = None
+    for line in config.splitlines():
+        if line.startswith("["):
+            header = line.strip()
+            blocks[header] = line + "\n"
+        elif header is not None and line.strip() != "":
+            blocks[header] += line + "\n"
+    return blocks
+
+
+def vendor_crates(crates: Optional[Iterable[str]] = None,
+                  vendor_dir: Path = VENDOR_DIR)->list[str]:
+    '''
+    Vendor the dependencies of the crates, every cloned crate by
+    default, into vendor_dir. Returns the crates whose dependencies
+    couldn't be vendored.
+
+    All the crates go to cargo vendor at once. With every cloned crate
+    it drops the packages that nothing uses anymore, a subset only adds
+    to the mirror so the other crates keep their dependencies. If that
+    fails because of a broken crate they are vendored one at a time to
+    find it
+    '''
+    crates_dir = Path(LocalCratesIO.CRATES_DIR.value)
+    prune = crates is None
+    if crates is None:
+        crates = [x.name for x in crates_dir.iterdir() if x.is_dir()]
+    manifests = {crate: crates_dir.joinpath(crate, "Cargo.toml").resolve()
+                 for crate in crates}
+    failed = [x for x, path in manifests.items() if not path.exists()]
+    for crate in failed:
+        del manifests[crate]
+    if manifests == {}:
+        return failed
+
+    vendor_dir = Path(vendor_dir).resolve()
+    vendor_dir.mkdir(parents=True, exist_ok=True)
+    # The crates share sources, keep the tables of every run. cargo
+    # vendor prints nothing for crates without dependencies, so always
+    # start with the crates.io replacement
+    blocks = _config_blocks("\n".join([
+        '[source.crates-io]',
+        'replace-with = "vendored-sources"',
+        '[source.vendored-sources]',
+        f'directory = "{vendor_dir}"']))
+    if vendor_config(vendor_dir) is not None:
+        blocks.update(_config_blocks(
+            vendor_dir.joinpath(VENDOR_CONFIG).read_text()))
+
+    res = _run_vendor(list(manifests.values()), vendor_dir,
+                      no_delete=not prune)
+    if res.returncode == 0:
+        blocks.update(_config_blocks(res.stdout))
+    else:
+        for crate, manifest in manifests.items():
+            res = _run_vendor([manifest], vendor_dir, no_delete=True)
+            if res.returncode != 0:
+                failed.append(crate)
+                continue
+            blocks.update(_config_blocks(res.stdout))
+
+    config = vendor_dir.joinpath(f".{VENDOR_CONFIG}.tmp")
+    config.write_text("\n".join(blocks.values()))
+    config.replace(vendor_dir.joinpath(VENDOR_CONFIG))
+    return failed
+
+
+def vendored_packages(vendor_dir: Path = VENDOR_DIR)->list[str]:
+    '''
+    The name-version of every package in the mirror
+    '''
+    if not Path(vendor_dir).exists():
+        return []
+    return sorted(x.name for x in Path(vendor_dir).iterdir() if x.is_dir())
@@ -1,8 +1,12 @@
 import typer
 import math
+import time
 import json
 import pandas as pd
+import polars as pl
 from typing_extensions import Annotated
+from typing import Optional, Union
+from concurrent.futures import ThreadPoolExecutor
 from alive_progress import alive_bar, alive_it
 from pathlib import Path
 
@@ -19,6 +23,17 @@ from ripkit.cargo_picky import (
     is_remote_crate_exe,
     LocalCratesIO,
     build_crate,
+    BuildJob,
+    build_crates,
+    clean_crate,
+    build_matrix as build_crate_matrix,
+    vendor_crates,
+    vendor_config,
+    vendored_packages,
+    VENDOR_DIR,
+    RustcCache,
+    install_wrapper as install_rustc_wrapper,
+    RUSTC_CACHE_DIR,
     RustcStripFlags,
     RustcOptimization,
     RustcTarget
@@ -29,10 +44,36 @@ from ripkit.ripbin import (
     get_functions,
     save_analysis,
     calculate_md5,
+    is_analysis_cached,
+    get_ripped_bins,
+    count_ripped_bins,
+    get_codec,
+    available_codecs,
+    bench_codecs as bench_payload_codecs,
+    get_catalog,
+    rebuild_catalog as ripbin_rebuild_catalog,
+    migrate_store as ripbin_migrate_store,
+    recover_store as ripbin_recover_store,
+    BLOBS,
+    pack_analyses,
+    export_feature_store,
+    scan_bytes,
+    label_balance,
     RustFileBundle,
     generate_minimal_labeled_features,
+    generate_minimal_labeled_features_array,
+    benchmark_labeled_features,
+    generate_analysis,
+    BinaryContext,
+    ingest_files,
+    normalize_opt_lvl,
+    find_binaries,
+    iter_stored_analyses,
+    export_windows as ripbin_export_windows,
+    BYTE_ENCODERS,
     DB_PATH,
     AnalysisType,
+    AnalysisFormat,
     FileType,
     Compiler,
     ProgLang,
@@ -52,6 +93,15 @@ def build_analyze_crate(crate, opt, target, filetype,
     build_crate(crate, opt, target, strip,
                         use_cargo=use_cargo)
 
+    return analyze_built_crate(crate, opt, target, filetype, strip)
+
+
+def analyze_built_crate(crate, opt, target, filetype,
+                        strip = RustcStripFlags.NOSTRIP):
+    '''
+    Analyze the binary of a crate that has been built
+    '''
+
     # Need this to get the build command 
     crate_path = Path(LocalCratesIO.CRATES_DIR.value).resolve().joinpath(crate)
 
@@ -60,7 +110,8 @@ def build_analyze_crate(crate, opt, target, filetype,
 
 
     # Get files of interest from the crate at the target <target>
-    files_of_interest = [x for x in get_target_productions(crate, target) 
+    files_of_interest = [x for x in get_target_productions(crate, target,
+                                                opt_lvl=opt, strip=strip) 
                             if is_executable(x)]
 
     if files_of_interest == []:
@@ -72,8 +123,11 @@ def build_analyze_crate(crate, opt, target, filetype,
     # The only file in the list should be the binary
     binary = files_of_interest[0]
 
+    # Parse the binary once for the hash and the analysis
+    ctx = BinaryContext(binary)
+
     # Create the file info
-    binHash = calculate_md5(binary)
+    binHash = calculate_md5(ctx)
 
     # Create the file info
     info = RustFileBundle(binary.name,
@@ -83,17 +137,24 @@ def build_analyze_crate(crate, opt, target, filetype,
                           opt.value,
                           binary.name,
                           "",
-                          build_cmd)
+                          build_cmd,
+                          strip.value)
 
 
+    # Nothing to do if this exact binary was already analyzed by the 
+    # current extractor
+    if is_analysis_cached(binHash, AnalysisType.ONEHOT_PLUS_FUNC_LABELS):
+        print(f"Crate {crate} binary {binHash} already analyzed")
+        return 0
+
     # Generate analysis
-    data = generate_minimal_labeled_features(binary)
+    data = generate_minimal_labeled_features_array(ctx)
 
     # TODO: Anlysis not being saved with target or ELF vs PE?
 
     try:
         # Save analyiss
-        save_analysis(binary,
+        save_analysis(ctx,
                         data,
                         AnalysisType.ONEHOT_PLUS_FUNC_LABELS,
                         info,
@@ -145,30 +206,10 @@ def generate_lief_ground_truth(
         return
 
     # List of all binaries to generate ground truth for 
-    files = []
-    for parent in Path("/home/ryan/.ripbin/ripped_bins/").iterdir():
-        info_file = parent / 'info.json'
-        info = {}
-        try:
-            with open(info_file, 'r') as f:
-                info = json.load(f)
-        except FileNotFoundError:
-            print(f"File not found: {info_file}")
-            continue
-        except json.JSONDecodeError as e:
-            print(f"JSON decoding error: {e}")
-            continue
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            continue
-
-
-        if info['optimization'].upper() in opt.value.upper():
-            #npz_file = parent / "onehot_plus_func_labels.npz"
-
-            # Append the binary to files 
-            bin_path = parent / info['binary_name']
-            files.append(bin_path)
+    with get_catalog() as catalog:
+        files = [Path(x['bin_path']) for x in 
+                    catalog.find(optimization=opt.value) 
+                        if x['bin_path'] != ""]
 
     for file in alive_it(files):
         save_lief_ground_truth(file)
@@ -299,6 +340,8 @@ def build(
     bit: Annotated[str, typer.Argument(help="32 or 64")],
     filetype: Annotated[str, typer.Argument(help="pe or elf")],
     strip: Annotated[bool, typer.Option()] = False,
+    vendor: Annotated[bool, typer.Option(
+        help="Build offline from the vendored dependencies, cargo builds only")] = False,
     ):
     '''
     Build a crate for a specific target
@@ -353,9 +396,14 @@ def build(
         strip_lvl = RustcStripFlags.SYM_TABLE
 
 
+    vendor_cfg = vendor_config() if vendor else None
+    if vendor and vendor_cfg is None:
+        print("Nothing is vendored, run vendor first")
+        return
+
     if target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU:
         build_crate(crate, opt, target, strip_lvl,
-                    use_cargo=True, debug=True)
+                    use_cargo=True, debug=True, vendor_config=vendor_cfg)
     else:
         build_crate(crate, opt, target, strip_lvl,debug=True)
 
@@ -363,12 +411,34 @@ def build(
     return
 
 
+def _mem_per_build(gb: float)->Union[int, None]:
+    # The scheduler takes bytes, None to not check the memory
+    return int(gb * (1 << 30)) if gb > 0 else None
+
+
+def _rustc_wrapper(rustc_cache: bool, cache_gb: float)->Union[Path, None]:
+    # The RUSTC_WRAPPER of the builds, None when the cache isn't wanted
+    if not rustc_cache:
+        return None
+    return install_rustc_wrapper(RUSTC_CACHE_DIR, int(cache_gb * (1 << 30)))
+
+
 @app.command()
 def build_all(
     opt_lvl: Annotated[str, typer.Argument(help="O0, O1, O2, O3, Oz, Os")],
     bit: Annotated[str, typer.Argument(help="32 or 64")],
     filetype: Annotated[str, typer.Argument(help="pe or elf")],
     strip: Annotated[bool, typer.Option()] = False,
+    parallel: Annotated[int, typer.Option(
+        help="Number of crates to build at once, defaults to one for every 4 cores")] = 0,
+    mem_per_build: Annotated[float, typer.Option(
+        help="GB of free memory needed to start another build, 0 to not check")] = 2,
+    rustc_cache: Annotated[bool, typer.Option(
+        help="Reuse dependencies compiled for other crates, cargo builds only")] = False,
+    rustc_cache_gb: Annotated[float, typer.Option(
+        help="GB the rustc cache is kept under")] = 20,
+    vendor: Annotated[bool, typer.Option(
+        help="Build offline from the vendored dependencies, cargo builds only")] = False,
     ):
     '''
     Build all the installed crates
@@ -425,18 +495,174 @@ def build_all(
 
 
 
+    vendor_cfg = vendor_config() if vendor else None
+    if vendor and vendor_cfg is None:
+        print("Nothing is vendored, run vendor first")
+        return
+
     # List of crate current installed
     installed_crates = [x.name for x in Path(LocalCratesIO.CRATES_DIR.value).iterdir() if x.is_dir()
     ]
 
-    for crate in alive_it(installed_crates):
+    jobs = [BuildJob(crate, opt, target, strip_lvl,
+                     use_cargo=target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU)
+            for crate in installed_crates]
+
+    with alive_bar(len(jobs)) as bar:
+        def on_done(res):
+            if not res.ok:
+                print(f"Crate {res.job.crate} failed to build: {res.error}")
+            bar()
+        results = build_crates(jobs, parallel if parallel else None,
+                               _mem_per_build(mem_per_build), on_done,
+                               _rustc_wrapper(rustc_cache, rustc_cache_gb),
+                               vendor_cfg)
+
+    print(f"Built {len([x for x in results if x.ok])} of {len(jobs)} crates")
+
+
+
+# The opt lvls the way the commands take them
+_OPT_LVLS = {"O0": RustcOptimization.O0, "O1": RustcOptimization.O1,
+             "O2": RustcOptimization.O2, "O3": RustcOptimization.O3,
+             "Oz": RustcOptimization.OZ, "Os": RustcOptimization.OS}
+
+
+@app.command()
+def clean(
+    crate: Annotated[str, typer.Argument(help="crate name, every cloned crate if not given")] = "",
+    opt_lvl: Annotated[str, typer.Option(help="O0, O1, O2, O3, Oz, Os")] = "",
+    target: Annotated[str, typer.Option(help="rustc target triple")] = "",
+    strip: Annotated[str, typer.Option(help="NOSTRIP, DEBUG_INFO, or SYM_TABLE")] = "",
+    ):
+    '''
+    Remove the build artifacts of crates. Only the configurations that
+    match the options are removed, with none the whole target dir goes
+    '''
+
+    if opt_lvl != "" and opt_lvl not in _OPT_LVLS:
+        print(f"Unknown opt lvl {opt_lvl}")
+        return
+    try:
+        rust_target = RustcTarget(target) if target != "" else None
+        strip_lvl = RustcStripFlags[strip] if strip != "" else None
+    except (ValueError, KeyError):
+        print(f"Unknown target {target} or strip {strip}")
+        return
+
+    if crate != "":
+        crates = [crate]
+    else:
+        crates = [x.name for x in Path(LocalCratesIO.CRATES_DIR.value).iterdir() if x.is_dir()]
+
+    removed = 0
+    for name in crates:
+        removed += len(clean_crate(name, rust_target, 
+                                   _OPT_LVLS.get(opt_lvl), strip_lvl))
+    print(f"Removed {removed} target dirs")
+    return
+
+
+@app.command()
+def build_matrix(
+    crates: Annotated[Optional[list[str]], typer.Argument(help="crate names, every cloned crate if not given")] = None,
+    opt_lvl: Annotated[Optional[list[str]], typer.Option(help="O0, O1, O2, O3, Oz, Os, repeat for more, all if not given")] = None,
+    target: Annotated[Optional[list[str]], typer.Option(help="rustc target triple, repeat for more")] = None,
+    strip: Annotated[Optional[list[str]], typer.Option(help="NOSTRIP, DEBUG_INFO, or SYM_TABLE, repeat for more")] = None,
+    parallel: Annotated[int, typer.Option(
+        help="Number of configurations to build at once, defaults to one for every 4 cores")] = 0,
+    mem_per_build: Annotated[float, typer.Option(
+        help="GB of free memory needed to start another build, 0 to not check")] = 2,
+    rustc_cache: Annotated[bool, typer.Option(
+        help="Reuse dependencies compiled for other crates, cargo builds only")] = False,
+    rustc_cache_gb: Annotated[float, typer.Option(
+        help="GB the rustc cache is kept under")] = 20,
+    vendor: Annotated[bool, typer.Option(
+        help="Build offline from the vendored dependencies, cargo builds only")] = False,
+    ):
+    '''
+    Build crates at every combination of the opt lvls, targets and strip
+    modes. Each configuration gets a manifest.json of its artifacts
+    '''
+
+    opts = opt_lvl if opt_lvl else list(_OPT_LVLS.keys())
+    targets = target if target else [RustcTarget.X86_64_UNKNOWN_LINUX_GNU.value]
+    strips = strip if strip else [RustcStripFlags.NOSTRIP.name]
+    try:
+        opt_lvls = [_OPT_LVLS[x] for x in opts]
+        rust_targets = [RustcTarget(x) for x in targets]
+        strip_lvls = [RustcStripFlags[x] for x in strips]
+    except (ValueError, KeyError) as e:
+        print(f"Unknown opt lvl, target or strip: {e}")
+        return
+
+    vendor_cfg = vendor_config() if vendor else None
+    if vendor and vendor_cfg is None:
+        print("Nothing is vendored, run vendor first")
+        return
+
+    if not crates:
+        crates = [x.name for x in Path(LocalCratesIO.CRATES_DIR.value).iterdir() if x.is_dir()]
+
+    num_configs = len(crates) * len(opt_lvls) * len(rust_targets) * len(strip_lvls)
+    start = time.time()
+    with alive_bar(num_configs) as bar:
+        def on_done(res):
+            if not res.ok:
+                print(f"{res.job.crate} {res.job.opt_lvl.name} "
+                      f"{res.job.target.value} {res.job.strip.name} "
+                      f"failed: {res.error}")
+            bar()
+        results = build_crate_matrix(crates, opt_lvls, rust_targets, strip_lvls,
+                        parallel if parallel else None,
+                        _mem_per_build(mem_per_build), on_done,
+                        _rustc_wrapper(rustc_cache, rustc_cache_gb),
+                        vendor_cfg)
+
+    print(f"Built {len([x for x in results if x.ok])} of {num_configs} "
+          f"configurations in {time.time() - start:.1f}s")
+    return
+
+
+@app.command()
+def vendor(
+    crates: Annotated[Optional[list[str]], typer.Argument(help="crate names, every cloned crate if not given")] = None,
+    ):
+    '''
+    Vendor the dependencies of the cloned crates into one local mirror
+    so builds with --vendor run offline
+    '''
+
+    start = time.time()
+    failed = vendor_crates(crates if crates else None, VENDOR_DIR)
+    for crate in failed:
+        print(f"Failed to vendor the dependencies of {crate}")
+    print(f"Vendored {len(vendored_packages(VENDOR_DIR))} packages to "
+          f"{VENDOR_DIR} in {time.time() - start:.1f}s")
+    return
 
-        if target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU:
-            build_crate(crate, opt, target, strip_lvl,
-                        use_cargo=True, debug=True)
-        else:
-            build_crate(crate, opt, target, strip_lvl)
 
+@app.command()
+def rustc_cache(
+    clear: Annotated[bool, typer.Option(help="Remove every cached dependency")] = False,
+    ):
+    '''
+    Show the hits, misses and size of the compiled dependency cache
+    '''
+
+    with RustcCache(RUSTC_CACHE_DIR) as cache:
+        if clear:
+            cache.clear()
+            print("Cleared the rustc cache")
+            return
+        stats = cache.stats()
+
+    lookups = stats['hits'] + stats['misses']
+    for key, value in stats.items():
+        print(f"{key} = {value}")
+    if lookups > 0:
+        print(f"hit_rate = {stats['hits'] / lookups:.2%}")
+    return
 
 
 @app.command()
@@ -454,6 +680,24 @@ def list_cloned():
                         
 
 
+def _storage_format(mmap: bool, codec: str)->Union[AnalysisFormat, None]:
+    '''
+    The format to save analyses in from the --mmap and --codec options,
+    None when the codec is bad
+    '''
+    if codec == "":
+        return AnalysisFormat.NPY if mmap else AnalysisFormat.NPZ
+    if mmap:
+        print("Only one of --mmap and --codec can be used")
+        return None
+    try:
+        get_codec(codec)
+    except ValueError as e:
+        print(e)
+        return None
+    return AnalysisFormat.NPC
+
+
 @app.command()
 def analyze(bin_path: Annotated[str, typer.Argument()],
             language: Annotated[str, typer.Argument()],
@@ -461,6 +705,14 @@ def analyze(bin_path: Annotated[str, typer.Argument()],
             bit: Annotated[str, typer.Argument(help="32 or 64")],
             filetype: Annotated[str, typer.Argument(help="pe or elf")],
             save: Annotated[bool, typer.Option()] = True,
+            analysis_type: Annotated[str, typer.Option(
+                help="onehot_plus_func_labels, dec_repr_byte_plus_func_labels, bytes_plus_func_bounds, insn_plus_func_labels")] = AnalysisType.ONEHOT_PLUS_FUNC_LABELS.value,
+            mmap: Annotated[bool, typer.Option(
+                help="Save uncompressed .npy files that can be memory mapped")] = False,
+            codec: Annotated[str, typer.Option(
+                help="Save an npc compressed with this codec, ie zstd:9, lz4, zlib:1, none")] = "",
+            encoder: Annotated[str, typer.Option(
+                help=f"Byte encoder of the labeled feature types, one of {', '.join(BYTE_ENCODERS)}")] = "",
             ):
     '''
     Analyze binary file 
@@ -471,15 +723,40 @@ def analyze(bin_path: Annotated[str, typer.Argument()],
         print(f"Binary {binary} doesn't exist")
         return
 
+    try:
+        analysis = AnalysisType(analysis_type)
+    except ValueError:
+        print(f"Unknown analysis type {analysis_type}")
+        return
+
+    storage = _storage_format(mmap, codec)
+    if storage is None:
+        return
+
+    if encoder != "" and encoder not in BYTE_ENCODERS:
+        print(f"Unknown encoder {encoder}")
+        return
+
+    # Parse the binary once for every stage
+    ctx = BinaryContext(binary)
+
+    if save and is_analysis_cached(calculate_md5(ctx), analysis):
+        print(f"Binary {binary} is already analyzed")
+        return
+
     # Generate analysis
     print("Generating Tensors...")
-    data = generate_minimal_labeled_features(binary)
+    try:
+        data = generate_analysis(ctx, analysis, encoder if encoder else None)
+    except ValueError as e:
+        print(e)
+        return
     print("Tensors generated")
 
 
     # Create the file info
     print("Calculating bin hash...")
-    binHash = calculate_md5(binary)
+    binHash = calculate_md5(ctx)
     print("bin hash calculated...")
 
 
@@ -498,14 +775,365 @@ def analyze(bin_path: Annotated[str, typer.Argument()],
 
     print("Saving Tensor and binary")
     # Save analyiss
-    save_analysis(binary,
+    save_analysis(ctx,
                     data,
-                    AnalysisType.ONEHOT_PLUS_FUNC_LABELS,
+                    analysis,
                     info,
-                    overwrite_existing=False)
+                    overwrite_existing=False,
+                    storage_format=storage,
+                    codec=codec,
+                    encoder=encoder if encoder else None)
     print("Done!")
 
 
+@app.command()
+def ingest(
+    path: Annotated[str, typer.Argument(
+        help="Directory to search for binaries, or a file listing binaries")],
+    workers: Annotated[int, typer.Option(
+        help="Number of worker processes, defaults to the number of cores")] = 0,
+    analysis_type: Annotated[str, typer.Option(
+        help="onehot_plus_func_labels, dec_repr_byte_plus_func_labels, bytes_plus_func_bounds, insn_plus_func_labels")] = AnalysisType.ONEHOT_PLUS_FUNC_LABELS.value,
+    opt_lvl: Annotated[str, typer.Option(help="O0, O1, O2, O3, Oz, Os")] = "",
+    target: Annotated[str, typer.Option()] = "",
+    mmap: Annotated[bool, typer.Option(
+        help="Save uncompressed .npy files that can be memory mapped")] = False,
+    codec: Annotated[str, typer.Option(
+        help="Save an npc compressed with this codec, ie zstd:9, lz4, zlib:1, none")] = "",
+    encoder: Annotated[str, typer.Option(
+        help=f"Byte encoder of the labeled feature types, one of {', '.join(BYTE_ENCODERS)}")] = "",
+    ):
+    '''
+    Analyze and save every binary in a directory tree or file list, 
+    in parallel
+    '''
+
+    try:
+        analysis = AnalysisType(analysis_type)
+    except ValueError:
+        print(f"Unknown analysis type {analysis_type}")
+        return
+
+    # Saved like the builds save it, "2" and not "O2"
+    opt_lvl = normalize_opt_lvl(opt_lvl)
+    if opt_lvl != "" and opt_lvl not in [x.value for x in RustcOptimization]:
+        print("Invalid opt lvl")
+        return
+
+    storage = _storage_format(mmap, codec)
+    if storage is None:
+        return
+
+    if encoder != "" and encoder not in BYTE_ENCODERS:
+        print(f"Unknown encoder {encoder}")
+        return
+    if encoder != "" and analysis not in [AnalysisType.ONEHOT_PLUS_FUNC_LABELS,
+                            AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS]:
+        print(f"Analysis type {analysis.value} doesn't take a byte encoder")
+        return
+
+    src = Path(path).resolve()
+    if src.is_dir():
+        files = find_binaries(src)
+    elif src.is_file():
+        with open(src, 'r') as f:
+            files = [Path(x.strip()) for x in f if x.strip() != ""]
+    else:
+        print(f"Path {src} doesn't exist")
+        return
+
+    print(f"Ingesting {len(files)} files...")
+    summary = ingest_files(files, analysis, workers,
+                           opt_lvl, target, storage, codec,
+                           encoder=encoder if encoder else None)
+
+    # Summary of the ingest
+    mb = summary.bytes_ingested / (1024*1024)
+    secs = max(summary.seconds, 1e-9)
+    print(f"ingested = {summary.count('ok')}")
+    print(f"existing = {summary.count('exists')}")
+    print(f"failed = {summary.count('failed')}")
+    print(f"seconds = {summary.seconds:.2f}")
+    print(f"files/sec = {len(summary.results)/secs:.2f}")
+    print(f"MB/sec = {mb/secs:.2f}")
+
+    for res in summary.failures:
+        print(f"FAILED {res.path}: {res.error}")
+    return
+
+
+@app.command()
+def recover_store(
+    deep: Annotated[bool, typer.Option(
+        help="Also remove the temp files in every package and the blob store")] = False,
+    ):
+    '''
+    Remove what crashed writers left in the db, safe to run during an ingest
+    '''
+    removed = ripbin_recover_store(deep)
+    print(f"Removed {removed} temp dirs and files")
+    return
+
+
+@app.command()
+def migrate_store():
+    '''
+    Move the ripped binaries into the sharded ab/cd/<hash> layout
+    '''
+    moved, left = ripbin_migrate_store()
+    print(f"Moved {moved} packages, {left} left in place")
+    return
+
+
+@app.command()
+def pack(
+    out_dir: Annotated[str, typer.Argument()],
+    analysis_type: Annotated[str, typer.Option(
+        help="onehot_plus_func_labels, dec_repr_byte_plus_func_labels, bytes_plus_func_bounds, insn_plus_func_labels")] = AnalysisType.ONEHOT_PLUS_FUNC_LABELS.value,
+    opt_lvl: Annotated[str, typer.Option(help="O0, O1, O2, O3, Oz, Os")] = "",
+    target: Annotated[str, typer.Option()] = "",
+    filetype: Annotated[str, typer.Option(help="ie elf_x86_64")] = "",
+    shard_mb: Annotated[int, typer.Option()] = 1024,
+    ):
+    '''
+    Pack the analyses of the selected binaries into large shard files
+    '''
+
+    try:
+        analysis = AnalysisType(analysis_type)
+    except ValueError:
+        print(f"Unknown analysis type {analysis_type}")
+        return
+
+    with get_catalog() as catalog:
+        binaries = catalog.find(analysis_type=analysis.value,
+                                optimization=opt_lvl if opt_lvl else None,
+                                target=target if target else None,
+                                filetype=filetype if filetype else None)
+
+    index = pack_analyses(binaries, analysis, Path(out_dir),
+                          shard_bytes=shard_mb * (1 << 20))
+
+    total = sum(x['bytes'] for x in index['shards'])
+    print(f"records = {len(index['records'])}")
+    print(f"shards = {len(index['shards'])}")
+    print(f"MB = {total / (1 << 20):.2f}")
+    return
+
+
+@app.command()
+def export_features(
+    overwrite: Annotated[bool, typer.Option()] = False,
+    ):
+    '''
+    Write the parquet feature store for the binaries in the catalog
+    '''
+    start = time.time()
+    written = export_feature_store(overwrite=overwrite)
+    print(f"Wrote {written} binaries in {time.time()-start:.2f}s")
+    return
+
+
+@app.command()
+def feature_balance(
+    target: Annotated[str, typer.Option()] = "",
+    opt_lvl: Annotated[str, typer.Option(help="O0, O1, O2, O3, Oz, Os")] = "",
+    filetype: Annotated[str, typer.Option(help="ie elf_x86_64")] = "",
+    ):
+    '''
+    Print the label balance of the bytes in the feature store
+    '''
+
+    lf = scan_bytes(target if target else None, 
+                    opt_lvl if opt_lvl else None)
+    if filetype:
+        lf = lf.filter(pl.col('filetype') == filetype)
+    print(label_balance(lf))
+    return
+
+
+@app.command()
+def gc_blobs():
+    '''
+    Remove stored file contents that no package uses anymore
+    '''
+    print(f"Removed {BLOBS.gc()} blobs")
+    return
+
+
+@app.command()
+def rebuild_catalog():
+    '''
+    Rebuild the catalog of ripped binaries from the info.json files
+    '''
+    start = time.time()
+    count = ripbin_rebuild_catalog()
+    print(f"Cataloged {count} binaries in {time.time()-start:.2f}s")
+    return
+
+
+@app.command()
+def export_windows(
+    out_dir: Annotated[str, typer.Argument()],
+    length: Annotated[int, typer.Argument(help="Window length in bytes")],
+    stride: Annotated[int, typer.Argument(help="Bytes between window starts")],
+    analysis_type: Annotated[str, typer.Option(
+        help="onehot_plus_func_labels or dec_repr_byte_plus_func_labels")] = AnalysisType.ONEHOT_PLUS_FUNC_LABELS.value,
+    pad_tail: Annotated[bool, typer.Option()] = False,
+    shard_mb: Annotated[int, typer.Option()] = 256,
+    encoder: Annotated[str, typer.Option(
+        help=f"Re-encode the bytes from the bytes_plus_func_bounds analysis, one of {', '.join(BYTE_ENCODERS)}")] = "",
+    ):
+    '''
+    Export the stored analyses as fixed length windows in shard files
+    '''
+
+    try:
+        analysis = AnalysisType(analysis_type)
+    except ValueError:
+        print(f"Unknown analysis type {analysis_type}")
+        return
+
+    if encoder != "" and encoder not in BYTE_ENCODERS:
+        print(f"Unknown encoder {encoder}")
+        return
+
+    analyses = iter_stored_analyses(analysis, encoder if encoder else None)
+    index = ripbin_export_windows(analyses,
+                                  Path(out_dir), length, stride,
+                                  pad_tail=pad_tail,
+                                  shard_bytes=shard_mb * (1 << 20))
+
+    print(f"binaries = {len(index['binaries'])}")
+    print(f"shards = {len(index['shards'])}")
+    print(f"windows = {sum(x['windows'] for x in index['shards'])}")
+    return
+
+
+@app.command()
+def bench_features(
+    bin_path: Annotated[str, typer.Argument()],
+    one_hot: Annotated[bool, typer.Option()] = True,
+    repeat: Annotated[int, typer.Option()] = 3,
+    skip_generator: Annotated[bool, typer.Option()] = False,
+    encoder: Annotated[str, typer.Option(
+        help=f"Byte encoder for the vectorized version, one of {', '.join(BYTE_ENCODERS)}")] = "",
+    ):
+    '''
+    Benchmark the labeled feature generation throughput for a binary
+    '''
+
+    binary = Path(bin_path).resolve()
+    if not binary.exists():
+        print(f"Binary {binary} doesn't exist")
+        return
+
+    if encoder != "" and encoder not in BYTE_ENCODERS:
+        print(f"Unknown encoder {encoder}")
+        return
+
+    res = benchmark_labeled_features(binary, one_hot, repeat,
+                                     include_generator=not skip_generator,
+                                     encoder=encoder if encoder else None)
+
+    print(f"text bytes = {res['text_bytes']}")
+    print(f"vectorized = {res['vectorized_bytes_per_sec']:,.0f} bytes/sec")
+    if not skip_generator:
+        print(f"generator = {res['generator_bytes_per_sec']:,.0f} bytes/sec")
+        print(f"speedup = {res['speedup']:.1f}x")
+    return
+
+
+@app.command()
+def bench_codecs(
+    codecs: Annotated[str, typer.Option(
+        help="Comma separated codec specs, defaults to every installed codec at a few levels")] = "",
+    analysis_type: Annotated[str, typer.Option(
+        help="onehot_plus_func_labels, dec_repr_byte_plus_func_labels, bytes_plus_func_bounds, insn_plus_func_labels")] = AnalysisType.ONEHOT_PLUS_FUNC_LABELS.value,
+    sample: Annotated[int, typer.Option(
+        help="Number of stored analyses to benchmark on")] = 20,
+    ):
+    '''
+    Benchmark the payload codecs on a sample of the stored analyses
+    '''
+
+    try:
+        analysis = AnalysisType(analysis_type)
+    except ValueError:
+        print(f"Unknown analysis type {analysis_type}")
+        return
+
+    if codecs == "":
+        specs = ['none', 'zlib:1', 'zlib:6']
+        if 'zstd' in available_codecs():
+            specs += ['zstd:1', 'zstd:3', 'zstd:9', 'zstd:19']
+        if 'lz4' in available_codecs():
+            specs += ['lz4:0', 'lz4:9']
+    else:
+        specs = [x.strip() for x in codecs.split(',') if x.strip() != ""]
+
+    def payloads():
+        for ripped in get_ripped_bins(analysis_type=analysis, limit=sample):
+            arrays = ripped.analysis(analysis, mmap_mode=None)
+            if isinstance(arrays, dict):
+                yield from arrays.values()
+            else:
+                yield arrays
+
+    try:
+        results = bench_payload_codecs(payloads(), specs)
+    except ValueError as e:
+        print(e)
+        return
+
+    if results == [] or results[0].raw_bytes == 0:
+        print(f"No {analysis.value} analyses in the db")
+        return
+
+    print(f"{results[0].raw_bytes / (1024*1024):.1f} MB of {analysis.value}")
+    print(f"{'codec':<10} {'ratio':>8} {'write MB/s':>12} {'read MB/s':>12}")
+    for res in results:
+        print(f"{res.codec:<10} {res.ratio:>8.1f} {res.compress_mbps:>12.1f} "
+              f"{res.decompress_mbps:>12.1f}")
+    return
+
+
+@app.command()
+def list_bins(
+    opt_lvl: Annotated[str, typer.Option(help="O0, O1, O2, O3, Oz, Os")]="",
+    target: Annotated[str, typer.Option()]="",
+    filetype: Annotated[str, typer.Option()]="",
+    crate: Annotated[str, typer.Option()]="",
+    analysis: Annotated[str, typer.Option(help="Only binaries with this analysis")]="",
+    limit: Annotated[int, typer.Option()]=50,
+    offset: Annotated[int, typer.Option()]=0,
+    ):
+    '''
+    List the ripped binaries matching the filters
+    '''
+
+    try:
+        analysis_type = AnalysisType(analysis) if analysis != "" else None
+    except ValueError:
+        print(f"Unknown analysis type {analysis}")
+        return
+
+    filters = {
+        'opt_lvl': opt_lvl if opt_lvl != "" else None,
+        'target': target if target != "" else None,
+        'filetype': filetype if filetype != "" else None,
+        'crate': crate if crate != "" else None,
+        'analysis_type': analysis_type,
+    }
+
+    total = count_ripped_bins(**filters)
+    bins = get_ripped_bins(limit=limit, offset=offset, **filters)
+    for ripped in bins:
+        print(f"{ripped.bin_hash} {ripped.optimization:>2} {ripped.target} "
+              f"{ripped.crate_name} {ripped.binary_name}")
+    print(f"{offset}-{offset+len(bins)} of {total}")
+    return
+
 @app.command()
 def stats():
     '''
@@ -522,36 +1150,10 @@ def stats():
         'num_opts': 0,
     }
 
-    for parent in Path("/home/ryan/.ripbin/ripped_bins/").iterdir():
-        info_file = parent / 'info.json'
-        info = {}
-        try:
-            with open(info_file, 'r') as f:
-                info = json.load(f)
-        except FileNotFoundError:
-            print(f"File not found: {info_file}")
-            continue
-        except json.JSONDecodeError as e:
-            print(f"JSON decoding error: {e}")
-            continue
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            continue
-
-        if '0' in info['optimization']:
-            stats['num_opt0']+=1
-        if '1' in info['optimization']:
-            stats['num_opt1']+=1
-        if '2' in info['optimization']:
-            stats['num_opt2']+=1
-        if '3' in info['optimization']:
-            stats['num_opt3']+=1
-        if 'z' in info['optimization']:
-            stats['num_optz']+=1
-        if 's' in info['optimization']:
-            stats['num_opts']+=1
-
-        stats['total'] +=1
+    # Counted in the catalog, no need to open every info.json
+    stats['total'] = count_ripped_bins()
+    for opt in RustcOptimization:
+        stats[f'num_opt{opt.value}'] = count_ripped_bins(opt_lvl=opt)
 
     for key, value in stats.items():
         print(f"{key} = {value}")
@@ -565,6 +1167,16 @@ def build_analyze_all(
     filetype: Annotated[str, typer.Argument()],
     stop_on_fail: Annotated[bool,typer.Option()]=False,
     force_build_all: Annotated[bool,typer.Option()]=False,
+    parallel: Annotated[int, typer.Option(
+        help="Number of crates to build at once, defaults to one for every 4 cores")] = 0,
+    mem_per_build: Annotated[float, typer.Option(
+        help="GB of free memory needed to start another build, 0 to not check")] = 2,
+    rustc_cache: Annotated[bool, typer.Option(
+        help="Reuse dependencies compiled for other crates, cargo builds only")] = False,
+    rustc_cache_gb: Annotated[float, typer.Option(
+        help="GB the rustc cache is kept under")] = 20,
+    vendor: Annotated[bool, typer.Option(
+        help="Build offline from the vendored dependencies, cargo builds only")] = False,
     ):
     '''
     Build and analyze pkgs
@@ -605,32 +1217,23 @@ def build_analyze_all(
         print(f"Invlaid bit lvl {bit}")
         return
 
+    vendor_cfg = vendor_config() if vendor else None
+    if vendor and vendor_cfg is None:
+        print("Nothing is vendored, run vendor first")
+        return
+
     # List of crate current installed
     installed_crates = [x.name for x in Path(LocalCratesIO.CRATES_DIR.value).iterdir() if x.is_dir()
     ]
 
 
     if not force_build_all:
-        for parent in Path("/home/ryan/.ripbin/ripped_bins/").iterdir():
-            info_file = parent / 'info.json'
-            info = {}
-            try:
-                with open(info_file, 'r') as f:
-                    info = json.load(f)
-            except FileNotFoundError:
-                print(f"File not found: {info_file}")
-                continue
-            except json.JSONDecodeError as e:
-                print(f"JSON decoding error: {e}")
-                continue
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                continue
-
-            if info['optimization'].upper() in opt_lvl:
-                # Remove this file from the installed crates list 
-                if (x:=info['binary_name']) in installed_crates:
-                    installed_crates.remove(x)
+        with get_catalog() as catalog:
+            built = catalog.find(optimization=opt.value)
+        for info in built:
+            # Remove this file from the installed crates list 
+            if (x:=info['binary_name']) in installed_crates:
+                installed_crates.remove(x)
 
     # Any crates that are already built with the same target don't rebuild or analyze
 
@@ -656,25 +1259,49 @@ def build_analyze_all(
             installed_crates.remove(x)
 
 
-    # Build and analyze each crate
-    for crate in alive_it(installed_crates):
-        #TODO: the following conditional is here because when building for 
-        #       x86_64 linux I know that cargo will work, and I know 
-        #       cargo's toolchain version 
-        res = 0
-        if target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU:
-            res = build_analyze_crate(crate, opt, target, filetype,
-                            RustcStripFlags.NOSTRIP,
-                            use_cargo=True)
-        else:
-            res = build_analyze_crate(crate, opt, target, filetype,
-                            RustcStripFlags.NOSTRIP)
+    #TODO: the following conditional is here because when building for 
+    #       x86_64 linux I know that cargo will work, and I know 
+    #       cargo's toolchain version 
+    jobs = [BuildJob(crate, opt, target, RustcStripFlags.NOSTRIP,
+                     use_cargo=target == RustcTarget.X86_64_UNKNOWN_LINUX_GNU)
+            for crate in installed_crates]
+
+    def analyze(crate: str):
+        res = analyze_built_crate(crate, opt, target, filetype,
+                                  RustcStripFlags.NOSTRIP)
         if res == 99:
             boring_crates.append(crate)
             print(f"Adding crate {crate} to boring crates")
             with open(crates_with_no_interest, 'w') as f:
                 json.dump({'names' : boring_crates}, f)
 
+    # Build the crates in parallel and analyze each one as its build
+    # finishes. The analysis runs on its own thread so the scheduler keeps
+    # starting builds meanwhile, one at a time so the boring crates file
+    # has one writer
+    analyses = []
+    with alive_bar(len(jobs)) as bar, \
+            ThreadPoolExecutor(max_workers=1) as analyzer:
+        def on_done(build_res):
+            bar()
+            if not build_res.ok:
+                print(f"Error: {build_res.error} Failed to rustc compile command.")
+                return
+            analyses.append(analyzer.submit(analyze, build_res.job.crate))
+
+        try:
+            build_crates(jobs, parallel if parallel else None,
+                         _mem_per_build(mem_per_build), on_done,
+                         _rustc_wrapper(rustc_cache, rustc_cache_gb),
+                         vendor_cfg)
+        except BaseException:
+            # Don't analyze what is still queued after ie a Ctrl-C
+            analyzer.shutdown(cancel_futures=True)
+            raise
+
+    for future in analyses:
+        future.result()
+
 
     # Build the crate, add the binary to a list of binaries
     #bins = []
@@ -4,6 +4,60 @@
 #import analyzer_types
 #import binary_analyzer
 
+from .binary_context import (
+    BinaryContext,
+)
+
+from .ingest import (
+    ingest_files,
+    find_binaries,
+)
+
+from .byte_encoders import (
+    ByteEncoder,
+    BYTE_ENCODERS,
+    register_byte_encoder,
+    get_byte_encoder,
+)
+
+from .pack import (
+    pack_analyses,
+    PackedDataset,
+)
+
+from .feature_store import (
+    export_feature_store,
+    scan_bytes,
+    scan_functions,
+    label_balance,
+)
+
+from .blob_store import (
+    BlobStore,
+)
+
+from .hashing import (
+    hash_file,
+    FileHashes,
+    FAST_DIGEST_NAME,
+)
+
+from .catalog import (
+    RipbinCatalog,
+    normalize_opt_lvl,
+)
+
+from .window_export import (
+    strided_windows,
+    padded_tail_window,
+    iter_stored_analyses,
+    export_windows,
+)
+
+from .sparse_analysis import (
+    SparseFuncBoundsAnalysis,
+)
+
 #from .ripbin_db import (.to(x.device)
 #)
 
@@ -15,6 +69,13 @@ from ..bin_types import (
 
 from .binary_analyzer import (
     generate_minimal_labeled_features,
+    generate_minimal_labeled_features_array,
+    generate_bytes_plus_func_bounds,
+    generate_insn_plus_func_labels,
+    get_instruction_bounds,
+    generate_analysis,
+    EXTRACTOR_VERSIONS,
+    benchmark_labeled_features,
     generate_minimal_unlabeled_features,
     POLARS_generate_minimal_unlabeled_features,
     get_functions,
@@ -26,6 +87,21 @@ from .ripbin_deterministic_db import (
     calculate_md5,
     DB_PATH,
     save_lief_ground_truth,
+    load_analysis,
+    get_package_path,
+    find_package,
+    package_path_for,
+    migrate_store,
+    BLOBS,
+    is_analysis_cached,
+    get_catalog,
+    rebuild_catalog,
+    read_analysis_manifest,
+    get_ripped_bins,
+    count_ripped_bins,
+    RippedBinary,
+    recover_store,
+    STAGING_PATH,
 )
 
 #from .ripbin_db import (
@@ -35,6 +111,7 @@ from .ripbin_deterministic_db import (
 
 from .analyzer_types import (
     AnalysisType,
+    AnalysisFormat,
     FileType,
     Compiler,
     ProgLang,
@@ -42,3 +119,19 @@ from .analyzer_types import (
     GoOptimization,
     Coptimization,
 )
+
+from .payload_codecs import (
+    PayloadCodec,
+    CODECS,
+    DEFAULT_CODEC,
+    get_codec,
+    available_codecs,
+    bench_codecs,
+    read_npc,
+    write_npc,
+)
+
+from .store_lock import (
+    hash_lock,
+    LOCKS_PATH,
+)
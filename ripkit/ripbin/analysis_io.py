@@ -0,0 +1,291 @@
+"""
+Reading and writing of the analysis payload files
+
+The analysis generators yield one row per byte, and turning them into
+one big array with np.array(list(gen)) keeps every row around as its
+own python object. The writer here drains the generator in fixed size
+blocks instead so memory use doesn't grow with the size of the binary.
+
+Analyses can either be stored in a compressed npz, as plain npy files
+that np.load can memory map so a reader only pages in what it touches,
+or in an npc file compressed with one of the payload_codecs.
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Iterator, Union
+
+from .analyzer_types import AnalysisType, AnalysisFormat
+from .payload_codecs import get_codec, write_npc, write_npc_stream, read_npc, DEFAULT_CODEC
+
+
+# Number of rows to hold in memory at once when draining a generator
+DEFAULT_CHUNK_ROWS = 1 << 16
+
+# Size of the reads when copying the spooled rows into the npz
+_COPY_BUF_SIZE = 1 << 22
+
+
+def _spool_rows(rows: Iterator[np.ndarray], spool,
+                chunk_rows: int)->tuple[int, tuple, np.dtype]:
+    '''
+    Write the rows to the spool file in blocks of chunk_rows rows
+
+    Returns the number of rows, the shape of a row, and the dtype
+    '''
+
+    num_rows = 0
+    row_shape = None
+    dtype = None
+    block = None
+    filled = 0
+
+    for row in rows:
+        row = np.asarray(row)
+
+        # The first row decides the shape and dtype of the array
+        if block is None:
+            row_shape = row.shape
+            dtype = row.dtype
+            block = np.empty((chunk_rows, *row_shape), dtype=dtype)
+
+        block[filled] = row
+        filled += 1
+
+        # Flush the block when its full
+        if filled == chunk_rows:
+            spool.write(block.tobytes())
+            num_rows += filled
+            filled = 0
+
+    if filled:
+        spool.write(block[:filled].tobytes())
+        num_rows += filled
+
+    return num_rows, row_shape, dtype
+
+
+def _npy_header(num_rows: int, row_shape: tuple, dtype: np.dtype)->dict:
+    '''
+    Header for an npy holding num_rows rows of the passed shape
+    '''
+    return {
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (num_rows, *row_shape),
+    }
+
+
+def _temp_file(analysis_file: Path, suffix: str)->str:
+    '''
+    Make a temp file next to analysis_file so it can be renamed over it
+    '''
+    fd, name = tempfile.mkstemp(dir=analysis_file.parent,
+                                prefix=f".{analysis_file.name}.",
+                                suffix=suffix)
+    os.close(fd)
+    return name
+
+
+def write_generator_npz(rows: Iterator[np.ndarray], analysis_file: Path,
+                        key: str = 'data',
+                        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                        compress: bool = True)->int:
+    '''
+    Stream the rows of a generator into an npz file that np.load reads
+    the same as one written with np.savez_compressed(analysis_file,
+    key=np.array(list(rows)))
+
+    Only chunk_rows rows are in memory at a time. The rows are spooled to
+    a temp file next to analysis_file, copied into a temp npz, and the
+    npz is renamed over analysis_file once it is complete, so a crash
+    never leaves a partial analysis file behind.
+
+    Returns the number of rows written
+    '''
+    return _write_generator(rows, Path(analysis_file), chunk_rows,
+                            AnalysisFormat.NPZ, key, compress)
+
+
+def write_generator_npy(rows: Iterator[np.ndarray], analysis_file: Path,
+                        chunk_rows: int = DEFAULT_CHUNK_ROWS)->int:
+    '''
+    Same as write_generator_npz but writes a plain .npy that can be
+    memory mapped
+
+    Returns the number of rows written
+    '''
+    return _write_generator(rows, Path(analysis_file), chunk_rows,
+                            AnalysisFormat.NPY)
+
+
+def write_generator_npc(rows: Iterator[np.ndarray], analysis_file: Path,
+                        codec: str = DEFAULT_CODEC,
+                        chunk_rows: int = DEFAULT_CHUNK_ROWS)->int:
+    '''
+    Same as write_generator_npz but writes an npc compressed with the
+    codec spec. The rows are spooled in blocks like the others and the
+    spool is compressed a block at a time too
+
+    Returns the number of rows written
+    '''
+    return _write_generator(rows, Path(analysis_file), chunk_rows,
+                            AnalysisFormat.NPC, codec=codec)
+
+
+def _write_generator(rows: Iterator[np.ndarray], analysis_file: Path,
+                     chunk_rows: int, fmt: AnalysisFormat,
+                     key: str = 'data', compress: bool = True,
+                     codec: str = DEFAULT_CODEC)->int:
+    '''
+    Spool the rows and then write them, with a header for the final
+    shape, to a temp file that is renamed over analysis_file
+    '''
+
+    spool_name = _temp_file(analysis_file, ".rows")
+    out_name = _temp_file(analysis_file, ".tmp")
+
+    try:
+        with open(spool_name, 'w+b') as spool:
+            num_rows, row_shape, dtype = _spool_rows(rows, spool, chunk_rows)
+
+            # Match np.array([]) for an empty generator
+            if dtype is None:
+                row_shape, dtype = (), np.dtype(np.float64)
+
+            header = _npy_header(num_rows, row_shape, dtype)
+            spool.seek(0)
+
+            if fmt == AnalysisFormat.NPC:
+                write_npc_stream(out_name, key, spool, dtype,
+                                 header['shape'], get_codec(codec))
+            elif fmt == AnalysisFormat.NPZ:
+                compression = zipfile.ZIP_DEFLATED if compress \
+                                    else zipfile.ZIP_STORED
+
+                # Same layout np.savez uses, <key>.npy inside of a zip
+                with zipfile.ZipFile(out_name, 'w', compression=compression,
+                                     allowZip64=True) as zf:
+                    with zf.open(f"{key}.npy", 'w', force_zip64=True) as npy:
+                        np.lib.format.write_array_header_2_0(npy, header)
+                        shutil.copyfileobj(spool, npy, _COPY_BUF_SIZE)
+            else:
+                with open(out_name, 'wb') as npy:
+                    np.lib.format.write_array_header_2_0(npy, header)
+                    shutil.copyfileobj(spool, npy, _COPY_BUF_SIZE)
+
+        # Publish the finished file
+        os.replace(out_name, analysis_file)
+    except BaseException:
+        if os.path.exists(out_name):
+            os.unlink(out_name)
+        raise
+    finally:
+        if os.path.exists(spool_name):
+            os.unlink(spool_name)
+
+    return num_rows
+
+
+def analysis_file_path(pkg_path: Path, analysis_type: AnalysisType,
+                       fmt: AnalysisFormat = AnalysisFormat.NPZ,
+                       key: str = 'data')->Path:
+    '''
+    Path of the analysis file in the package.
+
+    npz and npc analyses are one file, <analysis>.npz or <analysis>.npc.
+    npy analyses are one file per array, <analysis>.npy for the 'data'
+    array and <analysis>.<key>.npy for analyses that save more than one
+    array
+    '''
+    if fmt in [AnalysisFormat.NPZ, AnalysisFormat.NPC]:
+        return pkg_path.joinpath(f"{analysis_type.value}.{fmt.value}")
+    elif key == 'data':
+        return pkg_path.joinpath(f"{analysis_type.value}.npy")
+    return pkg_path.joinpath(f"{analysis_type.value}.{key}.npy")
+
+
+def save_arrays(pkg_path: Path, analysis_type: AnalysisType,
+                arrays: dict[str, np.ndarray],
+                fmt: AnalysisFormat = AnalysisFormat.NPZ,
+                codec: str = DEFAULT_CODEC)->None:
+    '''
+    Save the named arrays of an analysis in the passed format, codec is
+    the codec spec for AnalysisFormat.NPC
+    '''
+
+    if fmt in [AnalysisFormat.NPZ, AnalysisFormat.NPC]:
+        files = [(analysis_file_path(pkg_path, analysis_type, fmt), arrays)]
+    else:
+        files = [(analysis_file_path(pkg_path, analysis_type, fmt, key), 
+                  array) for key, array in arrays.items()]
+
+    for analysis_file, data in files:
+        # Write to a temp file first so readers that have the old file 
+        # mapped never see a partial array. The old file may also be
+        # linked from the blob store so it must never be written in place
+        tmp_name = _temp_file(analysis_file, ".tmp")
+        try:
+            if fmt == AnalysisFormat.NPC:
+                write_npc(tmp_name, data, get_codec(codec))
+            elif fmt == AnalysisFormat.NPZ:
+                with open(tmp_name, 'wb') as f:
+                    np.savez_compressed(f, **data)
+            else:
+                with open(tmp_name, 'wb') as f:
+                    np.save(f, np.asarray(data, order='C'))
+            os.replace(tmp_name, analysis_file)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+    return
+
+
+def remove_other_formats(pkg_path: Path, analysis_type: AnalysisType,
+                         fmt: AnalysisFormat)->None:
+    '''
+    Remove the files of the analysis saved in any format but fmt, so an
+    old copy never shadows the new one in load_arrays
+    '''
+    for payload in pkg_path.glob(f"{analysis_type.value}.*"):
+        if payload.suffix in [f".{x.value}" for x in AnalysisFormat] and \
+                payload.suffix != f".{fmt.value}":
+            payload.unlink()
+
+
+def load_arrays(pkg_path: Path, analysis_type: AnalysisType,
+                mmap_mode: Union[str, None] = 'r')->dict[str, np.ndarray]:
+    '''
+    Load the named arrays of an analysis from the package.
+
+    npy analyses are memory mapped with mmap_mode, so the arrays are
+    zero-copy views of the page cache. npz and npc analyses have to be 
+    read into memory
+    '''
+
+    # Prefer the npy files, they don't need to be inflated
+    prefix = f"{analysis_type.value}."
+    npy_files = [x for x in pkg_path.iterdir() 
+                 if x.name.startswith(prefix) and x.suffix == ".npy"]
+    if npy_files != []:
+        arrays = {}
+        for npy in npy_files:
+            key = npy.name[len(prefix):-len(".npy")]
+            key = 'data' if key == '' else key
+            arrays[key] = np.load(npy, mmap_mode=mmap_mode)
+        return arrays
+
+    npc_file = analysis_file_path(pkg_path, analysis_type, AnalysisFormat.NPC)
+    if npc_file.exists():
+        return read_npc(npc_file)
+
+    npz_file = analysis_file_path(pkg_path, analysis_type)
+    if not npz_file.exists():
+        raise FileNotFoundError(f"No {analysis_type.value} analysis in {pkg_path}")
+
+    with np.load(npz_file) as data:
+        return {key: data[key] for key in data.files}
@@ -20,6 +20,26 @@ from pathlib import Path
 class AnalysisType(Enum):
     ONEHOT_PLUS_FUNC_LABELS = "onehot_plus_func_labels"
     DEC_REPR_BYTE_PLUS_FUNC_LABELS = 'dec_repr_byte_plus_func_labels'
+    # Only the raw bytes and the function start / end offsets are 
+    # saved, the above two can be rebuilt from it on read
+    BYTES_PLUS_FUNC_BOUNDS = 'bytes_plus_func_bounds'
+    # Decimal byte plus function labels, instruction start label and
+    # the capstone instruction id of the instruction covering the byte
+    INSN_PLUS_FUNC_LABELS = 'insn_plus_func_labels'
+
+class AnalysisFormat(Enum):
+    '''
+    How the analysis arrays are stored on disk
+    '''
+    # np.savez_compressed archive, smallest but has to be inflated 
+    # completely on every read
+    NPZ = "npz"
+    # Plain .npy per array that np.load(mmap_mode='r') can open 
+    # without reading the whole file
+    NPY = "npy"
+    # All the arrays in one file, each compressed with a selectable 
+    # codec, see payload_codecs
+    NPC = "npc"
 
 class Coptimization(Enum):
     O0 = "0"
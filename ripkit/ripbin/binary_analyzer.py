@@ -6,10 +6,13 @@ import numpy as np
 import polars as pl
 
 import sys
+import functools
+import time
 from pathlib import Path
 import magic
 import pefile
 from elftools.elf.elffile import ELFFile
+from capstone import x86_const, arm_const
 from capstone import Cs, CS_ARCH_X86, CS_ARCH_ARM, CS_MODE_ARM, CS_MODE_32, CS_MODE_64, CsInsn
 
 import pandas as pd
@@ -17,7 +20,7 @@ from dataclasses import dataclass, asdict, fields
 from enum import Enum
 import warnings
 
-from typing import Tuple, Union, Generator
+from typing import Tuple, Union, Generator, Optional
 
 import lief
 import sqlite3
@@ -27,7 +30,11 @@ import sqlite3
 from .analyzer_types import FunctionInfo, binaryFileExecSectionOnly, \
                         FileType, ProgLang, ByteInfo, RustcOptimization,\
                         KnownByteInfo_verbose_sql, KnownByteInfo_verbose,\
-                        RustcTarget, Compiler
+                        RustcTarget, Compiler, AnalysisType
+
+from .byte_encoders import get_byte_encoder
+from .binary_context import BinaryContext, as_context, elf_functions, \
+                            pe_functions
 
 from alive_progress import alive_bar
 
@@ -37,47 +44,9 @@ def lief_get_file_type(path: Path):
     return bin.header.machine_type
 
 
-def get_file_type(file_path: Path)->FileType:
+def get_file_type(file_path: Union[Path, BinaryContext])->FileType:
     ''' Detect the FileType of the file'''
-
-    # Use the absoltue path
-    file_path = file_path.resolve()
-
-    # Load the info for the file 
-    file_info = magic.from_file(file_path)
-
-    # Check for PE vs ELF
-    if 'PE' in file_info:
-        # Load the 
-        pe = pefile.PE(file_path)
-
-        # Check the header for the machine type
-        # - NOTICE: The below lines will give a type error about machine but its ok
-        if pe.FILE_HEADER.Machine == pefile.MACHINE_TYPE['IMAGE_FILE_MACHINE_I386']:
-            return FileType.PE_X86
-        elif pe.FILE_HEADER.Machine == pefile.MACHINE_TYPE['IMAGE_FILE_MACHINE_AMD64']:
-            return FileType.PE_X86_64
-        else:
-            raise Exception(f"No filetype for {file_info}")
-
-    elif 'ELF' in file_info:
-        # Open the file and read the file header using ELFFile obj
-        with open(file_path, 'rb') as f:
-            elf_file = ELFFile(f)
-            header = elf_file.header
-
-            # 'e_machine' will indicate 32bit vs 64bit
-            if header['e_machine'].lower() == 'em_386':
-                return FileType.ELF_X86
-            elif header['e_machine'].lower() == 'em_x86_64':
-                return FileType.ELF_X86_64
-            else:
-                raise Exception(f"No filetype for {header['e_machine']}")
-    elif 'MACH':
-        #TODO: Handle MACH files 
-        raise Exception("TODO: Implement MACHO files")
-    else:
-        raise Exception("File type unknown")
+    return as_context(file_path).file_type
 
 
 
@@ -115,73 +84,59 @@ def get_capstone_arch_mode(file_type:FileType)-> Tuple[int,int]:
         case _:
             raise Exception(f"No capstone arch and mode for file of type {file_type}")
 
-def lief_disassemble_text_section(path: Path) -> list[CsInsn]:
+def lief_disassemble_text_section(path: Union[Path, BinaryContext]) -> list[CsInsn]:
     '''Disasm the file path'''
 
     # Use lief for parsing!
-    parsed_bin = lief.parse(str(path.resolve()))
+    ctx = as_context(path)
+    parsed_bin = ctx.lief_bin
 
     if parsed_bin.format is lief.EXE_FORMATS.UNKNOWN:
         estr = f"Cannot parse file format {parsed_bin.format}" 
         raise Exception(estr)
 
-    # Get information about the file type
-    file_type = get_file_type(path)
-
     # Get the corresponding modes for the disasembler
-    cs_mode, cs_arch = get_capstone_arch_mode(file_type)
-    print(f"File type: {file_type} mode {cs_mode} arch {cs_arch}")
-
+    cs_mode, cs_arch = get_capstone_arch_mode(ctx.file_type)
+    print(f"File type: {ctx.file_type} mode {cs_mode} arch {cs_arch}")
 
     md = Cs(cs_arch, cs_mode)
 
-    text_section = parsed_bin.get_section(".text")
-    file_type = get_file_type(path)
-    cs_mode, cs_arch = get_capstone_arch_mode(file_type)
-
-    return list(md.disasm(text_section.content, parsed_bin.entrypoint))
-
-    #if parsed_bin.format == lief.EXE_FORMATS.ELF:
-    #    text_section = parsed_bin.get_section(".text")
-    #elif parsed_bin.format == lief.EXE_FORMATS.PE:
-    #else:
-    #    raise Exception("File is neither PE or ELF")
-    return res
+    return list(md.disasm(ctx.text_section.content, parsed_bin.entrypoint))
 
 
-def disassemble_text_section(file_path:Path)->list[CsInsn]:
+def disassemble_text_section(file_path: Union[Path, BinaryContext])->list[CsInsn]:
     '''Disasm the file path'''
 
+    ctx = as_context(file_path)
+
     # Get information about the file type
-    file_type = get_file_type(file_path)
+    file_type = ctx.file_type
 
     # Get the corresponding modes for the disasembler
     cs_mode, cs_arch = get_capstone_arch_mode(file_type)
 
     # Check file type
     if file_type in [FileType.ELF_X86, FileType.ELF_X86_64]:
-        with open(file_path, 'rb') as f:
-            # Load the text section of the file
-            if (text_section:=ELFFile(f)
-                    .get_section_by_name('.text')):
+        # Load the text section of the file
+        if (text_section:=ctx.elf.get_section_by_name('.text')):
 
-                # Define the disasmbler
-                disasm = Cs(cs_arch, cs_mode)
+            # Define the disasmbler
+            disasm = Cs(cs_arch, cs_mode)
 
-                # Get the bytes in the .text section
-                code = text_section.data()
+            # Get the bytes in the .text section
+            code = text_section.data()
 
-                # Disasmble the code and return a a list
-                disasm_res = disasm.disasm(code, 
-                                    text_section['sh_addr'])
-                return list(disasm_res)
-            else:
-                raise Exception("Error could not find .text section")
+            # Disasmble the code and return a a list
+            disasm_res = disasm.disasm(code, 
+                                text_section['sh_addr'])
+            return list(disasm_res)
+        else:
+            raise Exception("Error could not find .text section")
 
     elif file_type in [FileType.PE_X86, FileType.PE_X86_64]:
 
         # Load the pe fle
-        pe = pefile.PE(file_path)
+        pe = ctx.pe
 
         # Find the text section 
         text_section = None
@@ -214,20 +169,11 @@ def disassemble_text_section(file_path:Path)->list[CsInsn]:
     else:
         raise Exception(f"Unknown file type: {file_type}")
 
-def get_functions(path:Path):
+def get_functions(path: Union[Path, BinaryContext]):
     """
         Get the functions in the passed bin file
     """
-
-    parsed_bin = lief.parse(str(path.resolve()))
-
-    if parsed_bin.format == lief.EXE_FORMATS.ELF:
-        res = get_elf_functions(path)
-    elif parsed_bin.format == lief.EXE_FORMATS.PE:
-        res = get_pe_functions(path)
-    else:
-        raise Exception("File is neither PE or ELF")
-    return res
+    return as_context(path).functions
 
 def pretty_print_functions(path):
 
@@ -242,19 +188,7 @@ def pretty_print_functions(path):
 
 def get_pe_functions(path:Path)->list:
 # Iterate over the PE file's exported functions
-
-    warnings.warn("PE files generated by go sometimes are automatically stripped! Beware!")
-
-    pe = pefile.PE(path)
-
-    function_names = []
-    if hasattr(pe, 'DIRECTORY_ENTRY_EXPORT'):
-        for exp in pe.DIRECTORY_ENTRY_EXPORT.symbols:
-            if exp.name:
-                function_names.append(exp.name.decode())
-    else:
-        raise Exception("Error getting symbol information! File may be stripped!")
-    return function_names
+    return pe_functions(pefile.PE(path))
 
 def get_elf_functions(path:Path, warn_if_stripped: bool = False)->list[FunctionInfo]:
     """
@@ -266,27 +200,12 @@ def get_elf_functions(path:Path, warn_if_stripped: bool = False)->list[FunctionI
     """
 
     with open(path, 'rb') as f:
-        elf = ELFFile(f)
-
-        # Get the symbol table
-        symbol_table = elf.get_section_by_name('.symtab')
-
-        # Get the .text section
-        text_section = elf.get_section_by_name('.text')
+        functionInfo = elf_functions(ELFFile(f), path)
 
-        if symbol_table is None or text_section is None:
-            raise Exception(f"Cannot get functions in file {path}")
-
-        # Create a list of functionInfo objects... symbol_table will give a 
-        # list of symbols, grab the function sybols and get there name, 
-        # their 'st_value' which is start addr and size 
-        functionInfo = [FunctionInfo(x.name, x['st_value'], f"0x{x['st_value']:x}",x['st_size']) 
-            for x in symbol_table.iter_symbols() if x['st_info']['type'] == 'STT_FUNC']
-
-        if functionInfo == [] and warn_if_stripped:
-            # TODO: This warning wont make sense when someone is analyzing an 
-            #   file without knowing if its stripped or not, maybe take out?
-            warnings.warn("There is no function info, and expect stripped is off")
+    if functionInfo == [] and warn_if_stripped:
+        # TODO: This warning wont make sense when someone is analyzing an 
+        #   file without knowing if its stripped or not, maybe take out?
+        warnings.warn("There is no function info, and expect stripped is off")
 
     return functionInfo
 
@@ -372,7 +291,8 @@ def generate_minimal_labeled_features(path: Path, use_one_hot=True):
     Generate npy matrix with vectors:
         <isStart, isMiddle, isEnd, byte>
     '''
-    functions = get_functions(path)
+    ctx = as_context(path)
+    functions = ctx.functions
 
     func_start_addrs = {x.addr : (x.name, x.size) for x in functions}
 
@@ -384,7 +304,7 @@ def generate_minimal_labeled_features(path: Path, use_one_hot=True):
             func_end_addrs[start+info[1]] = info[0]
 
 
-    parsed_bin = lief.parse(str(path.resolve()))
+    parsed_bin = ctx.lief_bin
     text_section = parsed_bin.get_section(".text")
 
     # Get the bytes in the .text section
@@ -409,6 +329,295 @@ def generate_minimal_labeled_features(path: Path, use_one_hot=True):
                             dtype=np.uint16)
 
 
+def get_text_bytes_and_func_bounds(path: Union[Path, BinaryContext]
+                                   )->Tuple[np.ndarray, np.ndarray,
+                                            np.ndarray, int]:
+    '''
+    Get the .text bytes of the binary and the sorted offsets, relative 
+    to the start of .text, of every function start and end 
+
+    Returns (text_bytes, start_offsets, end_offsets, text_base)
+    '''
+    ctx = as_context(path)
+    functions = ctx.functions
+
+    # NOTE: Built the same way as the generator so duplicate addrs 
+    #       resolve the same way
+    func_start_addrs = {x.addr : (x.name, x.size) for x in functions}
+
+    # Ignoring functions that are of zero length
+    func_end_addrs = [start+info[1] for start, info 
+                        in func_start_addrs.items() if info[1] > 0]
+
+    text_bytes = ctx.text_bytes
+    num_bytes = text_bytes.shape[0]
+
+    # Address of the first byte in the .text section
+    text_base = ctx.text_base
+
+    # Turn the addresses into offsets in the section, dropping the 
+    # ones that land outside of it
+    start_offsets = np.fromiter(func_start_addrs.keys(), dtype=np.int64,
+                                count=len(func_start_addrs)) - text_base
+    start_offsets = start_offsets[(start_offsets >= 0) & 
+                                  (start_offsets < num_bytes)]
+    end_offsets = np.array(func_end_addrs, dtype=np.int64) - text_base
+    end_offsets = end_offsets[(end_offsets >= 0) & 
+                              (end_offsets < num_bytes)]
+
+    return (text_bytes, np.unique(start_offsets), np.unique(end_offsets),
+            text_base)
+
+
+def labeled_features_from_bounds(text_bytes: np.ndarray,
+                                 start_offsets: np.ndarray,
+                                 end_offsets: np.ndarray,
+                                 use_one_hot=True,
+                                 legacy_one_hot=True,
+                                 encoder: Optional[str] = None)->np.ndarray:
+    '''
+    Build the labeled feature matrix from the bytes and function bound 
+    offsets:
+        <isStart, isMiddle, isEnd, *encoded byte>
+
+    The byte is encoded with the named encoder from byte_encoders. When
+    no encoder is passed, use_one_hot picks a one hot bool matrix and
+    otherwise the decimal uint16 one. legacy_one_hot keeps the 255 wide
+    encoding from one_hot_encoding so the output is identical to the 
+    generator, otherwise a 256 wide encoding is used where 0x00 and 0xFF
+    no longer share a column
+    '''
+    if encoder is None:
+        if use_one_hot:
+            encoder = "onehot_legacy" if legacy_one_hot else "onehot"
+        else:
+            encoder = "decimal"
+    byte_encoder = get_byte_encoder(encoder)
+
+    num_bytes = text_bytes.shape[0]
+    data = np.zeros((num_bytes, 3+byte_encoder.width), 
+                    dtype=byte_encoder.dtype)
+    byte_encoder.encode(text_bytes, out=data[:, 3:])
+
+    # Scatter the labels, middle is anything not a start or end
+    data[start_offsets, 0] = 1
+    data[end_offsets, 2] = 1
+    data[:, 1] = ~(data[:, 0].astype(np.bool_) | data[:, 2].astype(np.bool_))
+    return data
+
+
+def generate_minimal_labeled_features_array(path: Union[Path, BinaryContext],
+                                            use_one_hot=True,
+                                            legacy_one_hot=True,
+                                            encoder: Optional[str] = None
+                                            )->np.ndarray:
+    '''
+    Vectorized version of generate_minimal_labeled_features. Instead of 
+    yielding a row per byte, the whole .text section is labeled at once 
+    and returned as a single matrix, see labeled_features_from_bounds
+    '''
+    text_bytes, starts, ends, _ = get_text_bytes_and_func_bounds(path)
+    return labeled_features_from_bounds(text_bytes, starts, ends, 
+                                        use_one_hot, legacy_one_hot,
+                                        encoder)
+
+
+# One past the last capstone instruction id of each arch
+_CAPSTONE_INS_ENDING = {
+    CS_ARCH_X86: x86_const.X86_INS_ENDING,
+    CS_ARCH_ARM: arm_const.ARM_INS_ENDING,
+}
+
+
+@functools.cache
+def _capstone_insn_ids(cs_arch: int, cs_mode: int)->dict[str, int]:
+    '''
+    Map the mnemonics capstone prints to its instruction ids, 
+    disasm_lite only returns the mnemonic
+    '''
+    if cs_arch not in _CAPSTONE_INS_ENDING:
+        raise ValueError(f"No instruction ids for capstone arch {cs_arch}")
+    md = Cs(cs_arch, cs_mode)
+    ids = {}
+    for insn_id in range(1, _CAPSTONE_INS_ENDING[cs_arch]):
+        name = md.insn_name(insn_id)
+        if name is not None and name not in ids:
+            ids[name] = insn_id
+    return ids
+
+
+def get_instruction_bounds(path: Union[Path, BinaryContext]
+                           )->Tuple[np.ndarray, np.ndarray]:
+    '''
+    Linear sweep of the .text section with capstone's disasm_lite
+
+    Returns a bool array marking the bytes that start an instruction 
+    and a uint16 array with the capstone instruction id of the 
+    instruction covering each byte, 0 for bytes that didn't disassemble
+    '''
+    ctx = as_context(path)
+    text_bytes = ctx.text_bytes
+    num_bytes = text_bytes.shape[0]
+
+    cs_mode, cs_arch = get_capstone_arch_mode(ctx.file_type)
+    insn_ids = _capstone_insn_ids(cs_arch, cs_mode)
+
+    md = Cs(cs_arch, cs_mode)
+    # Step over bytes that don't decode instead of stopping the sweep
+    md.skipdata = True
+
+    # Every instruction is at least a byte, so there are at most 
+    # num_bytes of them
+    offsets = np.empty(num_bytes, dtype=np.int64)
+    sizes = np.empty(num_bytes, dtype=np.int64)
+    ids = np.empty(num_bytes, dtype=np.uint16)
+    # Id of every distinct mnemonic, .text only has a few hundred
+    mnemonic_ids = {}
+    count = 0
+    for offset, size, mnemonic, _ in md.disasm_lite(text_bytes.tobytes(), 0):
+        # Skipped data shows up as a .byte pseudo instruction
+        if mnemonic == ".byte":
+            continue
+        insn_id = mnemonic_ids.get(mnemonic)
+        if insn_id is None:
+            # Prefixes like rep and lock are part of the mnemonic
+            insn_id = insn_ids.get(mnemonic.rsplit(' ', 1)[-1], 0)
+            mnemonic_ids[mnemonic] = insn_id
+        offsets[count] = offset
+        sizes[count] = size
+        ids[count] = insn_id
+        count += 1
+    offsets = offsets[:count]
+    sizes = sizes[:count]
+    ids = ids[:count]
+
+    insn_starts = np.zeros(num_bytes, dtype=np.bool_)
+    insn_starts[offsets] = True
+
+    # Every byte of an instruction gets the instruction's id
+    opcode_ids = np.zeros(num_bytes, dtype=np.uint16)
+    covered = np.repeat(offsets, sizes) + \
+        (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+    opcode_ids[covered] = np.repeat(ids, sizes)
+
+    return insn_starts, opcode_ids
+
+
+def generate_insn_plus_func_labels(path: Union[Path, BinaryContext]
+                                   )->np.ndarray:
+    '''
+    Generate the uint16 matrix for AnalysisType.INSN_PLUS_FUNC_LABELS:
+        <isStart, isMiddle, isEnd, isInsnStart, insnId, byte>
+    '''
+    ctx = as_context(path)
+    text_bytes, starts, ends, _ = get_text_bytes_and_func_bounds(ctx)
+    insn_starts, opcode_ids = get_instruction_bounds(ctx)
+
+    func_labels = labeled_features_from_bounds(text_bytes, starts, ends,
+                                               encoder="decimal")
+    data = np.empty((text_bytes.shape[0], 6), dtype=np.uint16)
+    data[:, :3] = func_labels[:, :3]
+    data[:, 3] = insn_starts
+    data[:, 4] = opcode_ids
+    data[:, 5] = text_bytes
+    return data
+
+
+def generate_bytes_plus_func_bounds(path: Union[Path, BinaryContext]
+                                    )->dict[str, np.ndarray]:
+    '''
+    Generate the sparse analysis for AnalysisType.BYTES_PLUS_FUNC_BOUNDS,
+    the raw .text bytes plus the sorted function start and end offsets.
+
+    The one hot and decimal matrices can be rebuilt from this with 
+    SparseFuncBoundsAnalysis
+    '''
+    text_bytes, starts, ends, text_base = get_text_bytes_and_func_bounds(path)
+    return {
+        'bytes' : text_bytes,
+        'func_starts' : starts.astype(np.uint64),
+        'func_ends' : ends.astype(np.uint64),
+        'text_base' : np.array(text_base, dtype=np.uint64),
+    }
+
+
+# Version of the code that generates each analysis type. Bump the 
+# version when a generator changes its output so the cached analyses 
+# of that type, and only that type, are regenerated
+EXTRACTOR_VERSIONS = {
+    AnalysisType.ONEHOT_PLUS_FUNC_LABELS: 1,
+    AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS: 1,
+    AnalysisType.BYTES_PLUS_FUNC_BOUNDS: 1,
+    AnalysisType.INSN_PLUS_FUNC_LABELS: 1,
+}
+
+
+def generate_analysis(path: Union[Path, BinaryContext],
+                      analysis_type: AnalysisType,
+                      encoder: Optional[str] = None):
+    '''
+    Generate the data for the passed analysis type. encoder picks the
+    byte encoder of the labeled feature matrix types, the types that
+    store the raw bytes can't take one
+    '''
+
+    if encoder is not None and analysis_type not in [
+                    AnalysisType.ONEHOT_PLUS_FUNC_LABELS,
+                    AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS]:
+        raise ValueError(f"Analysis type {analysis_type.value} "
+                         f"doesn't take a byte encoder")
+
+    match analysis_type:
+        case AnalysisType.ONEHOT_PLUS_FUNC_LABELS:
+            return generate_minimal_labeled_features_array(path, True,
+                                                           encoder=encoder)
+        case AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS:
+            return generate_minimal_labeled_features_array(path, False,
+                                                           encoder=encoder)
+        case AnalysisType.BYTES_PLUS_FUNC_BOUNDS:
+            return generate_bytes_plus_func_bounds(path)
+        case AnalysisType.INSN_PLUS_FUNC_LABELS:
+            return generate_insn_plus_func_labels(path)
+        case _:
+            raise Exception(f"No generator for analysis type {analysis_type}")
+
+
+def benchmark_labeled_features(path: Path, use_one_hot=True,
+                               repeat: int = 3,
+                               include_generator=True,
+                               encoder: Optional[str] = None)->dict:
+    '''
+    Time the labeled feature generation for the passed binary and 
+    return the throughput in bytes per second. The generator is always
+    timed with its own one hot or decimal encoding
+    '''
+
+    num_bytes = BinaryContext(path).text_bytes.shape[0]
+
+    res = {'text_bytes': num_bytes}
+
+    # Best of repeat runs for the vectorized version
+    best = min(_time_call(generate_minimal_labeled_features_array,
+                          path, use_one_hot, True, encoder) 
+                    for _ in range(repeat))
+    res['vectorized_bytes_per_sec'] = num_bytes / best
+
+    if include_generator:
+        # The generator is slow enough that a single run will do
+        gen_time = _time_call(lambda p, o: np.array(list(
+                        generate_minimal_labeled_features(p, o))),
+                              path, use_one_hot)
+        res['generator_bytes_per_sec'] = num_bytes / gen_time
+        res['speedup'] = gen_time / best
+    return res
+
+
+def _time_call(func, *args)->float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
 def generate_minimal_unlabeled_features(path: Path, use_one_hot=True, 
                                         disp_bar=False):
     '''
@@ -416,7 +625,7 @@ def generate_minimal_unlabeled_features(path: Path, use_one_hot=True,
         <addr, byte, >
     '''
 
-    parsed_bin = lief.parse(str(path.resolve()))
+    parsed_bin = as_context(path).lief_bin
     text_section = parsed_bin.get_section(".text")
 
     # Get the bytes in the .text section
@@ -447,7 +656,7 @@ def POLARS_generate_minimal_unlabeled_features(path: Path,
         <addr, byte, >
     '''
 
-    parsed_bin = lief.parse(str(path.resolve()))
+    parsed_bin = as_context(path).lief_bin
     text_section = parsed_bin.get_section(".text")
 
     # Get the bytes in the .text section
@@ -0,0 +1,222 @@
+"""
+A parse once view of a binary file
+
+Analyzing a binary used to parse it over and over, lief for the
+functions, then pyelftools or pefile for the symbols, libmagic for the
+file type, lief again for the features, and a full read for the hash.
+BinaryContext reads the file once through an mmap and lazily caches
+everything the analysis stages ask for, so they can share one object.
+"""
+
+import mmap
+import warnings
+from functools import cached_property
+from pathlib import Path
+from typing import Union
+
+import lief
+import numpy as np
+import pefile
+from elftools.elf.elffile import ELFFile
+
+from .analyzer_types import FileType, FunctionInfo
+from .hashing import hash_file
+
+
+# The cached properties that keep pointing into the mapped file
+_MAPPED_PROPERTIES = ['elf', 'pe']
+
+
+class BinaryContext():
+    '''
+    Lazily parsed, cached, information about a binary file
+    '''
+
+    def __init__(self, path: Path):
+        self.path = Path(path).resolve()
+
+        if not self.path.exists():
+            raise FileNotFoundError(f"No binary {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self)->None:
+        '''
+        Unmap the file. The parses that read from the map, elf and pe,
+        are dropped with it, using them after close maps the file again.
+        Arrays that were already handed out stay valid
+        '''
+        for name in _MAPPED_PROPERTIES:
+            self.__dict__.pop(name, None)
+        if 'data' in self.__dict__:
+            self.data.close()
+            del self.__dict__['data']
+
+    @cached_property
+    def data(self)->mmap.mmap:
+        '''
+        The bytes of the file, mapped read only
+        '''
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @cached_property
+    def md5(self)->str:
+        # Memoized by the file's stat so an unchanged file is hashed once
+        return hash_file(self.path, data=self.data).md5
+
+    @cached_property
+    def fast_digest(self)->str:
+        '''
+        Non-cryptographic digest of the file for internal dedup, see 
+        hashing.FAST_DIGEST_NAME
+        '''
+        return hash_file(self.path, fast=True, data=self.data).fast
+
+    @cached_property
+    def lief_bin(self)->lief.Binary:
+        '''
+        The lief parse of the file. lief reads the file itself, it can't
+        parse from the map without a copy of all of it
+        '''
+        parsed_bin = lief.parse(str(self.path))
+        if parsed_bin is None:
+            raise Exception(f"Cannot parse file {self.path}")
+        return parsed_bin
+
+    @cached_property
+    def format(self)->lief.EXE_FORMATS:
+        # The magic bytes are enough for the format, no need for lief
+        # or libmagic
+        if self.data[:4] == b'\x7fELF':
+            return lief.EXE_FORMATS.ELF
+        elif self.data[:2] == b'MZ':
+            return lief.EXE_FORMATS.PE
+        return lief.EXE_FORMATS.UNKNOWN
+
+    @cached_property
+    def elf(self)->ELFFile:
+        if self.format != lief.EXE_FORMATS.ELF:
+            raise Exception(f"File {self.path} is not an ELF")
+        return ELFFile(self.data)
+
+    @cached_property
+    def pe(self)->pefile.PE:
+        if self.format != lief.EXE_FORMATS.PE:
+            raise Exception(f"File {self.path} is not a PE")
+        return pefile.PE(data=self.data)
+
+    @cached_property
+    def file_type(self)->FileType:
+        ''' Detect the FileType of the file'''
+
+        if self.format == lief.EXE_FORMATS.PE:
+            # NOTICE: The below lines will give a type error about machine but its ok
+            machine = self.pe.FILE_HEADER.Machine
+            if machine == pefile.MACHINE_TYPE['IMAGE_FILE_MACHINE_I386']:
+                return FileType.PE_X86
+            elif machine == pefile.MACHINE_TYPE['IMAGE_FILE_MACHINE_AMD64']:
+                return FileType.PE_X86_64
+            raise Exception(f"No filetype for PE machine {machine}")
+
+        elif self.format == lief.EXE_FORMATS.ELF:
+            # 'e_machine' will indicate 32bit vs 64bit
+            machine = self.elf.header['e_machine'].lower()
+            if machine == 'em_386':
+                return FileType.ELF_X86
+            elif machine == 'em_x86_64':
+                return FileType.ELF_X86_64
+            raise Exception(f"No filetype for {machine}")
+
+        #TODO: Handle MACH files
+        raise Exception("File type unknown")
+
+    @cached_property
+    def text_section(self)->lief.Section:
+        text_section = self.lief_bin.get_section(".text")
+        if text_section is None:
+            raise Exception("Error could not find .text section")
+        return text_section
+
+    @cached_property
+    def text_bytes(self)->np.ndarray:
+        '''
+        The bytes of the .text section as a uint8 array
+        '''
+        # NOTICE: content is a view into memory owned by lief_bin, copy
+        #         it so the array doesn't outlive the lief binary
+        return np.frombuffer(self.text_section.content,
+                             dtype=np.uint8).copy()
+
+    @cached_property
+    def text_base(self)->int:
+        '''
+        Address of the first byte in the .text section
+        '''
+        return self.lief_bin.imagebase + self.text_section.virtual_address
+
+    @cached_property
+    def functions(self)->Union[list[FunctionInfo], list[str]]:
+        '''
+        Functions of the binary, FunctionInfo for ELF files and the
+        exported names for PE files
+        '''
+
+        if self.format == lief.EXE_FORMATS.ELF:
+            return elf_functions(self.elf, self.path)
+        elif self.format == lief.EXE_FORMATS.PE:
+            return pe_functions(self.pe)
+        raise Exception("File is neither PE or ELF")
+
+
+def as_context(path: Union[Path, BinaryContext])->BinaryContext:
+    '''
+    Use the context if one was passed, otherwise make one for the path
+    '''
+    if isinstance(path, BinaryContext):
+        return path
+    return BinaryContext(path)
+
+
+def elf_functions(elf: ELFFile, path: Path)->list[FunctionInfo]:
+    '''
+    Get the function symbols of a parsed ELF
+    '''
+
+    # Get the symbol table
+    symbol_table = elf.get_section_by_name('.symtab')
+
+    # Get the .text section
+    text_section = elf.get_section_by_name('.text')
+
+    if symbol_table is None or text_section is None:
+        raise Exception(f"Cannot get functions in file {path}")
+
+    # Create a list of functionInfo objects... symbol_table will give a
+    # list of symbols, grab the function sybols and get there name,
+    # their 'st_value' which is start addr and size
+    return [FunctionInfo(x.name, x['st_value'], f"0x{x['st_value']:x}",
+                         x['st_size'])
+        for x in symbol_table.iter_symbols()
+            if x['st_info']['type'] == 'STT_FUNC']
+
+
+def pe_functions(pe: pefile.PE)->list[str]:
+    '''
+    Get the exported function names of a parsed PE
+    '''
+
+    warnings.warn("PE files generated by go sometimes are automatically stripped! Beware!")
+
+    function_names = []
+    if hasattr(pe, 'DIRECTORY_ENTRY_EXPORT'):
+        for exp in pe.DIRECTORY_ENTRY_EXPORT.symbols:
+            if exp.name:
+                function_names.append(exp.name.decode())
+    else:
+        raise Exception("Error getting symbol information! File may be stripped!")
+    return function_names
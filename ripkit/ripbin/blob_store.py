@@ -0,0 +1,188 @@
+"""
+Content addressed store for the files in the ripbin db
+
+The same binary bytes used to be copied into every package that had
+them. Now every file's content is kept once, as blobs/<ab>/<digest>,
+and the package files are hard links to the blob.
+
+Getting a file into the store tries, in order, a reflink (copy on
+write clone, no data is copied), a hard link, and then a plain copy
+that the kernel streams with sendfile. Only files the store wrote
+itself, the blobs and the payloads of a package, are hard linked. A
+file from outside, ie the binary being saved, is reflinked or copied so
+the caller changing it later can't change the blob. Package files are
+only ever replaced with a rename, never written in place, so sharing
+the inode between packages is safe.
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from .hashing import hash_file
+
+
+# linux/fs.h FICLONE, clone all of src_fd into the file of the ioctl
+_FICLONE = 0x40049409
+
+
+def reflink(src: Path, dest: Path)->bool:
+    '''
+    Clone src to dest on filesystems that support it (btrfs, xfs, ...).
+    Returns False, leaving no dest behind, when it isn't supported
+    '''
+    try:
+        with open(src, 'rb') as s, open(dest, 'xb') as d:
+            try:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+                return True
+            except OSError:
+                pass
+    except OSError:
+        return False
+    os.unlink(dest)
+    return False
+
+
+def place(src: Path, dest: Path, hardlink: bool = True)->str:
+    '''
+    Make dest have the content of src with the least I/O possible.
+    dest must not exist. Returns how it was placed, 'reflink', 'hardlink'
+    or 'copy'. hardlink=False for a src the store doesn't own
+    '''
+    if reflink(src, dest):
+        return 'reflink'
+    if hardlink:
+        try:
+            os.link(src, dest)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK,
+                               errno.ENOTSUP]:
+                raise
+    shutil.copyfile(src, dest)
+    return 'copy'
+
+
+class BlobStore():
+    '''
+    Files stored once by their md5 under root
+    '''
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def blob_path(self, digest: str)->Path:
+        return self.root.joinpath(digest[:2], digest)
+
+    def add(self, src: Path, digest: Optional[str] = None)->Path:
+        '''
+        Put the content of src in the store, if it isn't already there,
+        and return the path of the blob. src is reflinked or copied, never
+        hard linked, the blob must not share an inode with a file the
+        store doesn't own
+        '''
+        if digest is None:
+            digest = hash_file(src).md5
+        blob = self.blob_path(digest)
+        if blob.exists():
+            return blob
+
+        blob.parent.mkdir(parents=True, exist_ok=True)
+
+        # Place under a temp name and rename, so a blob that exists is
+        # always complete
+        fd, tmp_name = tempfile.mkstemp(dir=blob.parent, prefix=".blob.")
+        os.close(fd)
+        os.unlink(tmp_name)
+        try:
+            place(src, Path(tmp_name), hardlink=False)
+            os.replace(tmp_name, blob)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return blob
+
+    def link(self, src: Path, dest: Path,
+             digest: Optional[str] = None)->Path:
+        '''
+        Make dest a file with the content of src, sharing the blob of the
+        content instead of writing another copy
+        '''
+        blob = self.add(src, digest)
+        dest = Path(dest)
+
+        # Already linked, renaming a link over another link of the same 
+        # file is a no-op that would leave the temp link behind
+        if dest.exists() and os.path.samefile(blob, dest):
+            return dest
+
+        # Link next to dest and rename over it, dest may already exist
+        tmp_name = dest.parent.joinpath(f".{dest.name}.link")
+        if tmp_name.exists():
+            tmp_name.unlink()
+        place(blob, tmp_name)
+        os.replace(tmp_name, dest)
+        return dest
+
+    def dedup(self, path: Path, digest: Optional[str] = None)->Path:
+        '''
+        Swap a file that was written in place for a link to its blob
+        '''
+        path = Path(path)
+        if digest is None:
+            digest = hash_file(path).md5
+        blob = self.blob_path(digest)
+
+        if not blob.exists():
+            # First time this content is seen, the file becomes the blob
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, blob)
+                return path
+            except FileExistsError:
+                pass
+            except OSError:
+                return path
+        if os.path.samefile(path, blob):
+            return path
+        return self.link(path, path, digest)
+
+    def remove_stale_temp(self, min_age: float = 3600)->int:
+        '''
+        Remove the temp files of blobs that were never renamed into place
+        and haven't been touched in min_age seconds. Returns the number
+        removed
+        '''
+        removed = 0
+        now = time.time()
+        for tmp in self.root.glob("*/.blob.*"):
+            try:
+                if now - tmp.stat().st_mtime >= min_age:
+                    tmp.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def gc(self)->int:
+        '''
+        Remove blobs that no package hard links to anymore. Packages 
+        that got a reflink or a copy have their own data, so removing 
+        the blob only costs the dedup of the next identical file. 
+        Returns the number removed
+        '''
+        removed = 0
+        for blob in self.root.glob("*/*"):
+            if blob.name.startswith("."):
+                continue
+            if blob.stat().st_nlink == 1:
+                blob.unlink()
+                removed += 1
+        return removed
@@ -0,0 +1,115 @@
+"""
+Vectorized byte encoders
+
+Every encoder is a 256 row lookup table, row b is the encoding of the
+byte b. Encoding a whole .text section is then a single np.take of the
+table with the byte array, there is no per byte python work.
+
+Encoders are registered by name so the feature generators and the cli
+can pick one with a string.
+"""
+
+import numpy as np
+from dataclasses import dataclass
+
+
+# Rows encoded at a time into an out that isn't contiguous
+_ENCODE_BLOCK_ROWS = 1 << 16
+
+
+@dataclass(frozen=True)
+class ByteEncoder():
+    name: str
+    # (256, width) table, row b is the encoding of byte b
+    table: np.ndarray
+    description: str = ""
+
+    @property
+    def width(self)->int:
+        return self.table.shape[1]
+
+    @property
+    def dtype(self)->np.dtype:
+        return self.table.dtype
+
+    def encode(self, data: np.ndarray, out=None)->np.ndarray:
+        '''
+        Encode a uint8 array into a (len(data), width) matrix. out can
+        be a preallocated (len(data), width) array, ie the columns of a
+        bigger feature matrix
+        '''
+        data = np.asarray(data, dtype=np.uint8)
+        if out is None:
+            return self.table[data]
+        # uint8 indices are always in range, and mode='raise' would
+        # buffer the whole result before copying it to out
+        if out.flags.c_contiguous:
+            np.take(self.table, data, axis=0, out=out, mode='clip')
+            return out
+        # take() buffers into any out that isn't contiguous too, ie a
+        # column slice, so fill it a block of rows at a time
+        for start in range(0, data.shape[0], _ENCODE_BLOCK_ROWS):
+            end = start + _ENCODE_BLOCK_ROWS
+            out[start:end] = self.table[data[start:end]]
+        return out
+
+
+BYTE_ENCODERS: dict[str, ByteEncoder] = {}
+
+
+def register_byte_encoder(encoder: ByteEncoder)->ByteEncoder:
+    '''
+    Add the encoder to the registry
+    '''
+    if encoder.table.shape[0] != 256 or encoder.table.ndim != 2:
+        raise ValueError(f"Encoder {encoder.name} table must be (256, width)")
+    encoder.table.setflags(write=False)
+    BYTE_ENCODERS[encoder.name] = encoder
+    return encoder
+
+
+def get_byte_encoder(name: str)->ByteEncoder:
+    '''
+    Look up a registered encoder by name
+    '''
+    try:
+        return BYTE_ENCODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown byte encoder {name}, "
+                         f"options are {', '.join(BYTE_ENCODERS)}") from None
+
+
+def _legacy_onehot_table()->np.ndarray:
+    # one_hot_encoding sets index byte-1, so 0x00 wraps around to the
+    # last index and shares it with 0xFF
+    table = np.zeros((256, 255), dtype=np.bool_)
+    table[np.arange(256), (np.arange(256) - 1) % 255] = True
+    return table
+
+
+register_byte_encoder(ByteEncoder(
+    "onehot",
+    np.eye(256, dtype=np.bool_),
+    "256 wide one hot"))
+
+register_byte_encoder(ByteEncoder(
+    "onehot_legacy",
+    _legacy_onehot_table(),
+    "255 wide one hot from one_hot_encoding, 0x00 and 0xFF collide"))
+
+register_byte_encoder(ByteEncoder(
+    "decimal",
+    np.arange(256, dtype=np.uint16).reshape(256, 1),
+    "The byte value as one column"))
+
+register_byte_encoder(ByteEncoder(
+    "nibble",
+    np.stack([np.arange(256) >> 4, np.arange(256) & 0xF],
+             axis=1).astype(np.uint8),
+    "High and low nibble, two columns"))
+
+register_byte_encoder(ByteEncoder(
+    "bitplanes",
+    np.unpackbits(np.arange(256, dtype=np.uint8).reshape(256, 1),
+                  axis=1).astype(np.bool_),
+    "The 8 bits of the byte, most significant first"))
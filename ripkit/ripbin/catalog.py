@@ -0,0 +1,244 @@
+"""
+SQLite catalog of the ripped binaries
+
+Filtering the db used to mean opening every info.json in ripped_bins.
+The catalog keeps the same information in an indexed sqlite table that
+save_analysis keeps up to date, so filters and counts don't have to
+touch the packages at all. The info.json files are still the source of
+truth, the catalog can always be rebuilt from them.
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS binaries (
+    bin_hash TEXT PRIMARY KEY,
+    binary_name TEXT,
+    crate_name TEXT,
+    target TEXT,
+    filetype TEXT,
+    optimization TEXT,
+    strip_level TEXT,
+    pkg_path TEXT,
+    bin_path TEXT
+);
+CREATE INDEX IF NOT EXISTS binaries_optimization ON binaries(optimization);
+CREATE INDEX IF NOT EXISTS binaries_target ON binaries(target);
+CREATE INDEX IF NOT EXISTS binaries_filetype ON binaries(filetype);
+CREATE INDEX IF NOT EXISTS binaries_crate_name ON binaries(crate_name);
+CREATE INDEX IF NOT EXISTS binaries_strip_level ON binaries(strip_level);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    bin_hash TEXT,
+    analysis_type TEXT,
+    extractor_version INTEGER,
+    format TEXT,
+    path TEXT,
+    PRIMARY KEY (bin_hash, analysis_type)
+);
+CREATE INDEX IF NOT EXISTS analyses_type ON analyses(analysis_type);
+"""
+
+# The columns of binaries that can be filtered on
+FILTER_COLUMNS = ['bin_hash', 'binary_name', 'crate_name', 'target',
+                  'filetype', 'optimization', 'strip_level']
+
+# The columns of binaries an update with an empty value doesn't clear
+_KEEP_COLUMNS = ['binary_name', 'crate_name', 'target', 'filetype',
+                 'optimization', 'strip_level', 'bin_path']
+
+
+def normalize_opt_lvl(opt_lvl: str)->str:
+    '''
+    Optimization levels are saved as "0".."3", "s", "z" but are passed
+    around as "O0", "Oz", ... too, store and filter on one form
+    '''
+    opt_lvl = opt_lvl.strip()
+    if len(opt_lvl) == 2 and opt_lvl[0] in "oO":
+        opt_lvl = opt_lvl[1:]
+    return opt_lvl.lower()
+
+
+class RipbinCatalog():
+    '''
+    Indexed catalog of the binaries and analyses in the ripbin db
+    '''
+
+    def __init__(self, catalog_path: Path):
+        self.path = Path(catalog_path)
+        # Several ingest workers can write at once, wait on the lock
+        # instead of failing
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self)->None:
+        self.conn.close()
+
+    def add_binary(self, info: dict, pkg_path: Path,
+                   bin_path: Optional[Path] = None)->None:
+        '''
+        Add or update a binary from its info.json dict. Empty values,
+        and a missing bin_path, keep the ones already recorded, saving
+        another analysis without the metadata or the binary doesn't
+        lose them
+        '''
+        keep = ", ".join(f"{x}=CASE WHEN excluded.{x} = '' THEN binaries.{x} "
+                         f"ELSE excluded.{x} END"
+                         for x in _KEEP_COLUMNS)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO binaries VALUES (?,?,?,?,?,?,?,?,?) "
+                f"ON CONFLICT(bin_hash) DO UPDATE SET {keep}, "
+                "pkg_path=excluded.pkg_path",
+                (info['binary_hash'],
+                 info.get('binary_name', ""),
+                 info.get('crate_name', ""),
+                 info.get('target', ""),
+                 info.get('filetype', ""),
+                 normalize_opt_lvl(info.get('optimization', "")),
+                 info.get('strip_level', ""),
+                 str(pkg_path),
+                 str(bin_path) if bin_path is not None else ""))
+
+    def add_analysis(self, bin_hash: str, analysis_type: str,
+                     extractor_version: int, fmt: str,
+                     path: Path)->None:
+        '''
+        Add or update the record of an analysis of a binary
+        '''
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?,?,?,?,?)",
+                (bin_hash, analysis_type, extractor_version, fmt,
+                 str(path)))
+
+    def is_empty(self)->bool:
+        return self.conn.execute(
+            "SELECT 1 FROM binaries LIMIT 1").fetchone() is None
+
+    def remove_binary(self, bin_hash: str)->None:
+        with self.conn:
+            self.conn.execute("DELETE FROM binaries WHERE bin_hash=?",
+                              (bin_hash,))
+            self.conn.execute("DELETE FROM analyses WHERE bin_hash=?",
+                              (bin_hash,))
+
+    def _where(self, filters: dict,
+               analysis_type: Optional[str])->tuple[str, list]:
+        '''
+        Build the where clause for the filters, None values are ignored
+        '''
+        clauses = []
+        params = []
+        for col, val in filters.items():
+            if val is None:
+                continue
+            if col not in FILTER_COLUMNS:
+                raise ValueError(f"Can't filter on {col}")
+            if col == 'optimization':
+                val = normalize_opt_lvl(val)
+            clauses.append(f"b.{col} = ?")
+            params.append(val)
+
+        if analysis_type is not None:
+            clauses.append("EXISTS (SELECT 1 FROM analyses a WHERE "
+                           "a.bin_hash = b.bin_hash AND a.analysis_type = ?)")
+            params.append(analysis_type)
+
+        if clauses == []:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def find(self, analysis_type: Optional[str] = None,
+             limit: Optional[int] = None, offset: int = 0,
+             **filters)->list[dict]:
+        '''
+        Get the binaries matching the filters, ie
+        find(optimization="O2", target="x86_64-unknown-linux-gnu"),
+        ordered by hash. limit and offset page through the results
+        '''
+        where, params = self._where(filters, analysis_type)
+        page = ""
+        if limit is not None or offset:
+            page = " LIMIT ? OFFSET ?"
+            params = params + [limit if limit is not None else -1, offset]
+        rows = self.conn.execute(f"SELECT * FROM binaries b{where} "
+                                 f"ORDER BY b.bin_hash{page}", params)
+        return [dict(x) for x in rows]
+
+    def count(self, analysis_type: Optional[str] = None, **filters)->int:
+        where, params = self._where(filters, analysis_type)
+        return self.conn.execute(f"SELECT COUNT(*) FROM binaries b{where}",
+                                 params).fetchone()[0]
+
+    def count_by(self, column: str, analysis_type: Optional[str] = None,
+                 **filters)->dict[str, int]:
+        '''
+        Number of binaries for each value of column
+        '''
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Can't group by {column}")
+        where, params = self._where(filters, analysis_type)
+        rows = self.conn.execute(f"SELECT b.{column}, COUNT(*) FROM "
+                                 f"binaries b{where} GROUP BY b.{column}",
+                                 params)
+        return {x[0]: x[1] for x in rows}
+
+    def analyses(self, bin_hash: str)->list[dict]:
+        rows = self.conn.execute("SELECT * FROM analyses WHERE bin_hash=?",
+                                 (bin_hash,))
+        return [dict(x) for x in rows]
+
+    def rebuild(self, packages: Iterable[Path])->int:
+        '''
+        Drop the catalog and rebuild it from the info.json and
+        analyses.json of the packages. Returns the number of binaries
+        '''
+
+        with self.conn:
+            self.conn.execute("DELETE FROM binaries")
+            self.conn.execute("DELETE FROM analyses")
+
+        count = 0
+        for pkg in packages:
+            try:
+                with open(pkg.joinpath("info.json"), 'r') as f:
+                    info = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping {pkg}: {e}")
+                continue
+
+            bin_path = pkg.joinpath(info.get('binary_name', ""))
+            self.add_binary(info, pkg,
+                            bin_path if bin_path.is_file() else None)
+
+            try:
+                with open(pkg.joinpath("analyses.json"), 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                manifest = {}
+
+            # Analyses from before the manifest are version 1
+            for analysis_file in pkg.iterdir():
+                if analysis_file.suffix not in ['.npz', '.npy', '.npc']:
+                    continue
+                analysis_type = analysis_file.name.split('.')[0]
+                entry = manifest.get(analysis_type, {})
+                self.add_analysis(info['binary_hash'], analysis_type,
+                                  entry.get('extractor_version', 1),
+                                  analysis_file.suffix[1:],
+                                  analysis_file)
+            count += 1
+        return count
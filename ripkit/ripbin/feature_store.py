@@ -0,0 +1,245 @@
+"""
+Corpus wide columnar feature store
+
+Answering a question about the whole corpus used to mean loading the
+npz of every binary. The feature store keeps one parquet file per
+binary, with one row per byte or per function, in hive partitions of
+target and optimization level:
+
+feature_store
+| bytes
+  | target=x86_64-unknown-linux-gnu
+    | optimization=3
+      | <bin_hash>.parquet
+| functions
+  | ...
+
+pl.scan_parquet over the store prunes the partitions and row groups
+that a query's filters rule out, so only the bytes a query needs are
+read. The partition columns are only in the paths, polars adds them
+back from there.
+"""
+
+import numpy as np
+import polars as pl
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .analyzer_types import AnalysisType
+from .analysis_io import load_arrays
+from .binary_analyzer import get_text_bytes_and_func_bounds
+from .catalog import normalize_opt_lvl
+from .ripbin_deterministic_db import DB_PATH, get_catalog, find_package
+
+
+FEATURE_STORE_PATH = DB_PATH.joinpath('feature_store')
+
+# Rows per parquet row group, the unit that the statistics can skip
+_ROW_GROUP_SIZE = 1 << 17
+
+
+def _partition(kind: str, target: Optional[str] = None,
+               optimization: Optional[str] = None,
+               store: Path = FEATURE_STORE_PATH)->str:
+    '''
+    Glob of the parquet files in the partitions, None matches every
+    value
+    '''
+    target = "*" if target is None else _partition_value(target)
+    optimization = "*" if optimization is None \
+                    else _partition_value(normalize_opt_lvl(optimization))
+    return str(store.joinpath(kind, f"target={target}",
+                              f"optimization={optimization}", "*.parquet"))
+
+
+def _partition_value(value: str)->str:
+    # Empty strings can't be a partition, ie binaries added without a
+    # target
+    return value if value != "" else "unknown"
+
+
+def _nearest_start_distance(num_bytes: int,
+                            starts: np.ndarray)->np.ndarray:
+    '''
+    Distance from each byte to the closest function start
+    '''
+    offsets = np.arange(num_bytes, dtype=np.int64)
+    if starts.shape[0] == 0:
+        return np.full(num_bytes, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+    # The closest start is either the one at or before the byte or the
+    # next one after it
+    idx = np.searchsorted(starts, offsets, side='right')
+    before = starts[np.clip(idx - 1, 0, len(starts) - 1)]
+    after = starts[np.clip(idx, 0, len(starts) - 1)]
+    dist = np.minimum(np.abs(offsets - before), np.abs(after - offsets))
+    return np.minimum(dist, np.iinfo(np.uint32).max).astype(np.uint32)
+
+
+def _with_constants(frame: pl.DataFrame, bin_hash: str,
+                    info: dict)->pl.DataFrame:
+    '''
+    Add the columns that are the same on every row of a binary. They are
+    literals broadcast by polars, no per row python list is built
+    '''
+    return frame.select(
+        pl.lit(bin_hash, dtype=pl.Utf8).alias('bin_hash'),
+        pl.all(),
+        pl.lit(info.get('crate_name', ""), dtype=pl.Utf8).alias('crate'),
+        pl.lit(info.get('filetype', ""), dtype=pl.Utf8).alias('filetype'),
+    )
+
+
+def byte_frame(bin_hash: str, text_bytes: np.ndarray, starts: np.ndarray,
+               ends: np.ndarray, text_base: int, info: dict)->pl.DataFrame:
+    '''
+    One row per .text byte of the binary
+    '''
+    num_bytes = text_bytes.shape[0]
+    starts = starts.astype(np.int64)
+    ends = ends.astype(np.int64)
+
+    is_start = np.zeros(num_bytes, dtype=np.bool_)
+    is_start[starts] = True
+    is_end = np.zeros(num_bytes, dtype=np.bool_)
+    is_end[ends] = True
+
+    # Repeated strings are dictionary encoded in the parquet file
+    return _with_constants(pl.DataFrame({
+        'offset': np.arange(num_bytes, dtype=np.uint64),
+        'address': np.arange(num_bytes, dtype=np.uint64) + np.uint64(text_base),
+        'byte': text_bytes,
+        'is_start': is_start,
+        'is_middle': ~(is_start | is_end),
+        'is_end': is_end,
+        'start_dist': _nearest_start_distance(num_bytes, starts),
+    }), bin_hash, info)
+
+
+def function_frame(bin_hash: str, starts: np.ndarray, ends: np.ndarray,
+                   text_base: int, info: dict)->pl.DataFrame:
+    '''
+    One row per function start, with the end that follows it
+    '''
+    starts = starts.astype(np.int64)
+    ends = ends.astype(np.int64)
+
+    # Pair each start with the first end after it that comes before the
+    # next start, -1 when there is none, ie zero sized functions
+    if len(ends):
+        next_start = np.append(starts[1:], np.iinfo(np.int64).max)
+        idx = np.searchsorted(ends, starts, side='right')
+        end = ends[np.minimum(idx, len(ends) - 1)]
+        has_end = (idx < len(ends)) & (end <= next_start)
+        end = np.where(has_end, end, -1)
+    else:
+        has_end = np.zeros(len(starts), dtype=np.bool_)
+        end = np.full(len(starts), -1, dtype=np.int64)
+
+    return _with_constants(pl.DataFrame({
+        'start': starts.astype(np.uint64),
+        'address': starts.astype(np.uint64) + np.uint64(text_base),
+        'end': end,
+        'size': np.where(has_end, end - starts, -1),
+    }), bin_hash, info)
+
+
+def _bytes_and_bounds(pkg: Path, info: dict):
+    '''
+    The bytes and function bounds of a package, from the sparse analysis
+    when it was saved, otherwise from the binary in the package
+    '''
+    try:
+        arrays = load_arrays(pkg, AnalysisType.BYTES_PLUS_FUNC_BOUNDS)
+        return (np.asarray(arrays['bytes']), np.asarray(arrays['func_starts']),
+                np.asarray(arrays['func_ends']),
+                int(np.asarray(arrays['text_base']).item()))
+    except FileNotFoundError:
+        pass
+    return get_text_bytes_and_func_bounds(Path(info['bin_path']))
+
+
+def export_feature_store(store: Path = FEATURE_STORE_PATH,
+                         binaries: Optional[Iterable[dict]] = None,
+                         overwrite: bool = False)->int:
+    '''
+    Write the byte and function parquet files of the binaries, catalog
+    rows, defaulting to every binary in the catalog. Binaries that are
+    already in the store are skipped unless overwrite.
+
+    Returns the number of binaries written
+    '''
+
+    if binaries is None:
+        with get_catalog() as catalog:
+            binaries = catalog.find()
+
+    written = 0
+    for info in binaries:
+        bin_hash = info['bin_hash']
+        target = _partition_value(info.get('target', ""))
+        opt = _partition_value(normalize_opt_lvl(info.get('optimization', "")))
+        part = Path(f"target={target}", f"optimization={opt}")
+
+        byte_file = store.joinpath("bytes", part, f"{bin_hash}.parquet")
+        func_file = store.joinpath("functions", part, f"{bin_hash}.parquet")
+        if byte_file.exists() and func_file.exists() and not overwrite:
+            continue
+
+        pkg = find_package(bin_hash)
+        if pkg is None:
+            continue
+        try:
+            text_bytes, starts, ends, text_base = _bytes_and_bounds(pkg, info)
+        except Exception as e:
+            print(f"Skipping {bin_hash}: {e}")
+            continue
+
+        for out, frame in [
+                (byte_file, byte_frame(bin_hash, text_bytes, starts, ends,
+                                       text_base, info)),
+                (func_file, function_frame(bin_hash, starts, ends,
+                                           text_base, info))]:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            # Written next to the final name and renamed, a reader never
+            # scans a partial file
+            tmp = out.with_suffix(".parquet.tmp")
+            frame.write_parquet(tmp, statistics=True,
+                                row_group_size=_ROW_GROUP_SIZE)
+            tmp.replace(out)
+        written += 1
+    return written
+
+
+def scan_bytes(target: Optional[str] = None,
+               optimization: Optional[str] = None,
+               store: Path = FEATURE_STORE_PATH)->pl.LazyFrame:
+    '''
+    Lazy frame of the byte rows. target and optimization select the
+    partitions to read, other filters are pushed down to the row groups
+    '''
+    return pl.scan_parquet(_partition("bytes", target, optimization, store),
+                           hive_partitioning=True)
+
+
+def scan_functions(target: Optional[str] = None,
+                   optimization: Optional[str] = None,
+                   store: Path = FEATURE_STORE_PATH)->pl.LazyFrame:
+    '''
+    Lazy frame of the function rows, see scan_bytes
+    '''
+    return pl.scan_parquet(_partition("functions", target, optimization,
+                                      store),
+                           hive_partitioning=True)
+
+
+def label_balance(lf: pl.LazyFrame)->pl.DataFrame:
+    '''
+    Number of start, middle and end bytes in the lazy frame of bytes
+    '''
+    return lf.select(
+        pl.count().alias('bytes'),
+        pl.col('is_start').sum().alias('starts'),
+        pl.col('is_middle').sum().alias('middles'),
+        pl.col('is_end').sum().alias('ends'),
+    ).collect()
@@ -0,0 +1,184 @@
+"""
+Hashing of binaries
+
+Hashing the same binary over and over is a big part of ingesting a
+corpus, so the digests are memoized by the file's (device, inode, size,
+mtime_ns). The memo lives in memory and in a sqlite file in the db so a
+re-run never rehashes a file that hasn't changed. sqlite connections
+can't cross threads or a fork, so every thread opens its own and a
+forked worker starts a new memo.
+
+Besides the md5 that names the packages, a fast non-cryptographic
+digest can be computed in the same pass for internal dedup. It is
+xxh3_128 when xxhash is installed, otherwise blake2b.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# Where the digests are remembered between runs, only used when the
+# ripbin db exists
+HASH_MEMO_PATH = Path("~/.ripbin/hash_memo.sqlite").expanduser()
+
+# Name of the fast digest, stored with it so switching implementations
+# doesn't mix digests
+FAST_DIGEST_NAME = "xxh3_128" if xxhash is not None else "blake2b_128"
+
+# Files smaller than this are read instead of mapped
+_MMAP_MIN_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class FileHashes:
+    md5: str
+    fast: Optional[str] = None
+
+
+def _fast_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_bytes(data, fast: bool = False)->FileHashes:
+    '''
+    Hash a bytes like object, ie an mmap of the file
+    '''
+    md5 = hashlib.md5(data).hexdigest()
+    if not fast:
+        return FileHashes(md5)
+    hasher = _fast_hasher()
+    hasher.update(data)
+    return FileHashes(md5, hasher.hexdigest())
+
+
+def _stat_key(st: os.stat_result)->tuple[int, int, int, int]:
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class HashMemo():
+    '''
+    Digests of files keyed by (device, inode, size, mtime_ns)
+    '''
+
+    def __init__(self, memo_path: Optional[Path] = HASH_MEMO_PATH):
+        self._mem: dict[tuple, FileHashes] = {}
+        self.pid = os.getpid()
+        self._local = threading.local()
+
+        # Without a db only remember digests for this process
+        self._path = None
+        if memo_path is not None and Path(memo_path).parent.exists():
+            self._path = Path(memo_path)
+
+    @property
+    def _conn(self)->Optional[sqlite3.Connection]:
+        '''
+        The connection of the calling thread, opened on first use
+        '''
+        if self._path is None:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hashes (
+                    dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,
+                    md5 TEXT, fast TEXT, fast_name TEXT,
+                    PRIMARY KEY (dev, ino, size, mtime_ns))""")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: tuple)->Optional[FileHashes]:
+        if key in self._mem:
+            return self._mem[key]
+        conn = self._conn
+        if conn is None:
+            return None
+
+        row = conn.execute(
+            "SELECT md5, fast, fast_name FROM hashes WHERE dev=? AND ino=? "
+            "AND size=? AND mtime_ns=?", key).fetchone()
+        if row is None:
+            return None
+
+        # Drop a fast digest that came from a different implementation
+        hashes = FileHashes(row[0], row[1] if row[2] == FAST_DIGEST_NAME
+                                            else None)
+        self._mem[key] = hashes
+        return hashes
+
+    def put(self, key: tuple, hashes: FileHashes)->None:
+        self._mem[key] = hashes
+        conn = self._conn
+        if conn is None:
+            return
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?,?,?,?,?,?,?)",
+                (*key, hashes.md5, hashes.fast,
+                 FAST_DIGEST_NAME if hashes.fast else None))
+
+
+_memo: Optional[HashMemo] = None
+
+# Memos a forked worker inherited from its parent. Kept referenced so
+# they are never closed in the child, closing the parent's connections
+# there could checkpoint or drop its WAL
+_inherited: list[HashMemo] = []
+
+
+def _get_memo()->HashMemo:
+    # One memo per process, a forked worker opens its own
+    global _memo
+    if _memo is not None and _memo.pid != os.getpid():
+        _inherited.append(_memo)
+        _memo = None
+    if _memo is None:
+        _memo = HashMemo()
+    return _memo
+
+
+def hash_file(path: Path, fast: bool = False,
+              data=None)->FileHashes:
+    '''
+    Get the md5, and with fast the fast digest, of a file.
+
+    Unchanged files are only ever hashed once. data can be the already
+    mapped bytes of the file so it isn't read again
+    '''
+
+    memo = _get_memo()
+    key = _stat_key(os.stat(path))
+
+    cached = memo.get(key)
+    if cached is not None and (cached.fast is not None or not fast):
+        return cached
+
+    if data is not None:
+        hashes = hash_bytes(data, fast)
+    elif key[2] < _MMAP_MIN_SIZE:
+        with open(path, 'rb') as f:
+            hashes = hash_bytes(f.read(), fast)
+    else:
+        # hashlib releases the GIL for big buffers, so hash the whole
+        # mapped file in one call
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            hashes = hash_bytes(mapped, fast)
+
+    memo.put(key, hashes)
+    return hashes
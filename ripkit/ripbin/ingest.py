@@ -0,0 +1,195 @@
+"""
+Bulk ingest of existing binaries into the ripbin db
+
+Hashing, type detection, feature generation and saving are all done in
+worker processes so ingesting a corpus uses every core. Each file is
+handled on its own, a bad file is recorded as a failure and the rest
+of the ingest carries on. Workers that get copies of the same binary
+are serialized by save_analysis, the later ones find it as 'exists'.
+
+A worker that dies outright, ie lief segfaulting, breaks the whole pool
+and takes the files it hadn't finished with it. Those files are split in
+half and each half ingested again in a new pool, until the file that
+kills its worker is alone and recorded as failed.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+from alive_progress import alive_bar
+
+from .analyzer_types import AnalysisType, AnalysisFormat
+from .payload_codecs import DEFAULT_CODEC
+from .binary_analyzer import generate_analysis
+from .binary_context import BinaryContext
+from .catalog import normalize_opt_lvl
+from .ripbin_deterministic_db import save_analysis, RustFileBundle, \
+                        is_analysis_cached, recover_store
+from .ripbin_exceptions import AnalysisExistsError
+
+
+@dataclass
+class IngestResult:
+    path: str
+    status: str  # 'ok', 'exists', or 'failed'
+    num_bytes: int = 0
+    seconds: float = 0
+    error: str = ""
+
+
+@dataclass
+class IngestSummary:
+    results: list[IngestResult] = field(default_factory=list)
+    seconds: float = 0
+
+    def count(self, status: str)->int:
+        return len([x for x in self.results if x.status == status])
+
+    @property
+    def failures(self)->list[IngestResult]:
+        return [x for x in self.results if x.status == 'failed']
+
+    @property
+    def bytes_ingested(self)->int:
+        return sum(x.num_bytes for x in self.results if x.status == 'ok')
+
+
+def looks_like_binary(path: Path)->bool:
+    '''
+    Cheap check of the magic bytes for ELF and PE files
+    '''
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+    except OSError:
+        return False
+    return magic == b'\x7fELF' or magic[:2] == b'MZ'
+
+
+def find_binaries(root: Path)->list[Path]:
+    '''
+    Find the ELF and PE files under root
+    '''
+    return [x for x in root.rglob('*')
+            if x.is_file() and not x.is_symlink() and looks_like_binary(x)]
+
+
+def ingest_binary(path: Path, analysis_type: AnalysisType,
+                  optimization: str = "", target: str = "",
+                  storage_format: AnalysisFormat = AnalysisFormat.NPZ,
+                  codec: str = DEFAULT_CODEC,
+                  encoder: Optional[str] = None)->IngestResult:
+    '''
+    Analyze and save one binary. Never raises, errors are returned in
+    the result so one bad file doesn't stop the ingest
+    '''
+
+    start = time.perf_counter()
+    try:
+        with BinaryContext(path) as ctx:
+            info = RustFileBundle(ctx.path.name,
+                                  ctx.md5,
+                                  target,
+                                  ctx.file_type.value,
+                                  optimization,
+                                  ctx.path.name,
+                                  "",
+                                  "")
+
+            # Skip the analysis when the db already has it
+            if is_analysis_cached(ctx.md5, analysis_type):
+                return IngestResult(str(path), 'exists', 0,
+                                    time.perf_counter() - start,
+                                    f"Binary with hash {ctx.md5} exists")
+
+            data = generate_analysis(ctx, analysis_type, encoder)
+
+            save_analysis(ctx, data, analysis_type, info,
+                          overwrite_existing=False,
+                          storage_format=storage_format, codec=codec,
+                          encoder=encoder)
+            num_bytes = ctx.path.stat().st_size
+    except AnalysisExistsError as e:
+        return IngestResult(str(path), 'exists', 0,
+                            time.perf_counter() - start, str(e))
+    except Exception as e:
+        return IngestResult(str(path), 'failed', 0,
+                            time.perf_counter() - start,
+                            f"{type(e).__name__}: {e}")
+
+    return IngestResult(str(path), 'ok', num_bytes,
+                        time.perf_counter() - start)
+
+
+def _ingest_batch(files: list[Path], analysis_type: AnalysisType,
+                  workers: int, optimization: str, target: str,
+                  storage_format: AnalysisFormat, codec: str,
+                  encoder: Optional[str], summary: IngestSummary,
+                  bar)->list[Path]:
+    '''
+    Ingest the files in one pool. Returns the files left unfinished when
+    a worker died and broke the pool
+    '''
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(ingest_binary, x, analysis_type,
+                               optimization, target, storage_format,
+                               codec, encoder): x for x in files}
+        for future in as_completed(futures):
+            try:
+                summary.results.append(future.result())
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            bar()
+    return broken
+
+
+def ingest_files(files: Iterable[Path], analysis_type: AnalysisType,
+                 workers: Optional[int] = None,
+                 optimization: str = "", target: str = "",
+                 storage_format: AnalysisFormat = AnalysisFormat.NPZ,
+                 codec: str = DEFAULT_CODEC,
+                 show_bar: bool = True,
+                 encoder: Optional[str] = None)->IngestSummary:
+    '''
+    Ingest the files across a pool of worker processes. encoder is the
+    byte encoder for the labeled feature matrix types. optimization is
+    saved in the form builds save it, ie "O2" is saved as "2"
+    '''
+
+    files = list(files)
+    optimization = normalize_opt_lvl(optimization)
+    workers = workers if workers else os.cpu_count()
+    summary = IngestSummary()
+
+    # Clear out the staging dirs of any ingest that crashed
+    recover_store()
+
+    start = time.perf_counter()
+    batches = deque([files])
+    with alive_bar(len(files), disable=not show_bar) as bar:
+        while batches:
+            batch = batches.popleft()
+            if batch == []:
+                continue
+            broken = _ingest_batch(batch, analysis_type, workers,
+                                   optimization, target, storage_format,
+                                   codec, encoder, summary, bar)
+            if len(broken) == 1:
+                summary.results.append(IngestResult(
+                    str(broken[0]), 'failed', 0, 0,
+                    "BrokenProcessPool: the worker died on this file"))
+                bar()
+            elif broken != []:
+                half = len(broken) // 2
+                batches.extend([broken[:half], broken[half:]])
+    summary.seconds = time.perf_counter() - start
+
+    return summary
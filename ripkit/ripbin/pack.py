@@ -0,0 +1,200 @@
+"""
+Pack analyses into a few large shard files for training
+
+Reading the db directly means opening and inflating one small npz per
+binary. A pack is the selected analyses concatenated, uncompressed,
+into fixed size shard files plus an index.json with where each record
+is. Reading a pack is then sequential reads of big files, or one
+memory mapped slice for a single record.
+
+pack
+| index.json
+| shard_00000.bin
+| shard_00001.bin
+"""
+
+import json
+import mmap
+import numpy as np
+from pathlib import Path
+from typing import Generator, Iterable, Union
+
+from .analyzer_types import AnalysisType
+from .analysis_io import load_arrays
+from .ripbin_deterministic_db import find_package
+
+
+# Records start on this alignment so the arrays can be viewed in place
+_ALIGN = 64
+
+PACK_INDEX = "index.json"
+
+
+def _shard_name(num: int)->str:
+    return f"shard_{num:05d}.bin"
+
+
+def pack_analyses(binaries: Iterable[dict], analysis_type: AnalysisType,
+                  out_dir: Path, shard_bytes: int = 1 << 30)->dict:
+    '''
+    Pack the analysis of every binary, catalog rows, into shards of
+    about shard_bytes in out_dir. A record is never split between shards,
+    so a record bigger than shard_bytes gets a shard of its own.
+
+    Returns the index that is also saved to out_dir/index.json
+    '''
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    index = {
+        'analysis_type': analysis_type.value,
+        'shards': [],
+        'records': [],
+    }
+
+    shard = None
+    shard_pos = 0
+
+    def next_shard():
+        nonlocal shard, shard_pos
+        if shard is not None:
+            shard.close()
+            index['shards'].append({'file': Path(shard.name).name,
+                                    'bytes': shard_pos})
+        shard = open(out_dir.joinpath(_shard_name(len(index['shards']))),
+                     'wb')
+        shard_pos = 0
+
+    next_shard()
+    for info in binaries:
+        pkg = find_package(info['bin_hash'])
+        if pkg is None:
+            continue
+        try:
+            arrays = load_arrays(pkg, analysis_type)
+        except FileNotFoundError:
+            continue
+
+        arrays = {k: np.asarray(v, order='C') for k, v in arrays.items()}
+        record_bytes = sum(v.nbytes + _ALIGN for v in arrays.values())
+        if shard_pos > 0 and shard_pos + record_bytes > shard_bytes:
+            next_shard()
+
+        record = {
+            'bin_hash': info['bin_hash'],
+            'shard': len(index['shards']),
+            'arrays': {},
+            'metadata': {k: info.get(k, "") for k in
+                         ['binary_name', 'crate_name', 'target', 'filetype',
+                          'optimization', 'strip_level']},
+        }
+
+        for key, array in arrays.items():
+            # Pad to the alignment
+            pad = -shard_pos % _ALIGN
+            shard.write(b'\0' * pad)
+            shard_pos += pad
+
+            record['arrays'][key] = {
+                'offset': shard_pos,
+                'length': array.nbytes,
+                'dtype': np.lib.format.dtype_to_descr(array.dtype),
+                'shape': list(array.shape),
+            }
+            shard.write(array.tobytes())
+            shard_pos += array.nbytes
+
+        index['records'].append(record)
+
+    shard.close()
+    index['shards'].append({'file': Path(shard.name).name, 'bytes': shard_pos})
+
+    with open(out_dir.joinpath(PACK_INDEX), 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+class PackedDataset():
+    '''
+    Reader for a pack made by pack_analyses. Records are read only numpy
+    views of the memory mapped shards, nothing is copied
+    '''
+
+    def __init__(self, pack_dir: Path):
+        self.path = Path(pack_dir)
+        with open(self.path.joinpath(PACK_INDEX), 'r') as f:
+            self.index = json.load(f)
+        self.records = self.index['records']
+        self._maps: dict[int, mmap.mmap] = {}
+
+    def __len__(self)->int:
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self)->None:
+        for num in list(self._maps.keys()):
+            self._release(num)
+
+    def _release(self, num: int)->None:
+        m = self._maps.pop(num)
+        try:
+            m.close()
+        except BufferError:
+            # Records from the shard are still in use, the map is closed
+            # when the last of them is freed
+            pass
+
+    def _shard(self, num: int, sequential: bool = False)->mmap.mmap:
+        if num not in self._maps:
+            shard_file = self.path.joinpath(self.index['shards'][num]['file'])
+            with open(shard_file, 'rb') as f:
+                self._maps[num] = mmap.mmap(f.fileno(), 0,
+                                            access=mmap.ACCESS_READ)
+            if sequential and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                # Read ahead aggressively, the shard is read front to back
+                self._maps[num].madvise(mmap.MADV_SEQUENTIAL)
+        return self._maps[num]
+
+    def _read(self, record: dict, sequential: bool = False
+              )->Union[np.ndarray, dict[str, np.ndarray]]:
+        shard = self._shard(record['shard'], sequential)
+        arrays = {}
+        for key, spec in record['arrays'].items():
+            count = int(np.prod(spec['shape']))
+            arrays[key] = np.frombuffer(shard, dtype=np.dtype(spec['dtype']),
+                                        count=count,
+                                        offset=spec['offset']
+                                        ).reshape(tuple(spec['shape']))
+        if list(arrays.keys()) == ['data']:
+            return arrays['data']
+        return arrays
+
+    def __getitem__(self, i: int)->Union[np.ndarray, dict[str, np.ndarray]]:
+        '''
+        The analysis of record i, an array or a dict of arrays for
+        analyses with more than one
+        '''
+        return self._read(self.records[i])
+
+    def metadata(self, i: int)->dict:
+        return {'bin_hash': self.records[i]['bin_hash'],
+                **self.records[i]['metadata']}
+
+    def iter_records(self)->Generator[tuple[dict, Union[np.ndarray, dict]],
+                                      None, None]:
+        '''
+        Stream (metadata, analysis) over the records in shard order. Each
+        shard is unmapped once it has been read
+        '''
+        cur_shard = None
+        for i, record in enumerate(self.records):
+            if cur_shard is not None and record['shard'] != cur_shard:
+                self._release(cur_shard)
+            cur_shard = record['shard']
+            yield self.metadata(i), self._read(record, sequential=True)
@@ -0,0 +1,323 @@
+"""
+Compression codecs for the analysis payloads
+
+np.savez_compressed is single threaded zlib at one level, slow to write
+and read and not the best fit for the very repetitive label matrices.
+The AnalysisFormat.NPC format compresses each array with a selectable
+codec instead:
+
+none        stored as is
+zlib[:lvl]  the same deflate npz uses
+zstd[:lvl]  zstandard, multithreaded, needs the zstandard package
+lz4[:lvl]   lz4 frames, needs the lz4 package
+
+A codec is passed around as a spec, '<name>' or '<name>:<level>', and
+the spec is saved with the payload so it can always be read back.
+
+Every codec can also compress a stream a block at a time, so an array
+spooled to disk is written without ever being in memory at once.
+"""
+
+import json
+import struct
+import time
+import zlib
+import numpy as np
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+# Start of every .npc file, followed by the length of the json header
+_NPC_MAGIC = b"RIPNPC1\n"
+_HEADER_LEN = struct.Struct("<Q")
+
+DEFAULT_CODEC = "zstd:3" if zstandard is not None else "zlib:6"
+
+# Bytes of a spooled array compressed at a time
+_STREAM_BLOCK_SIZE = 8 << 20
+
+# Room kept for the header of a streamed npc, it's only known once the
+# payload is written
+_HEADER_PAD = 64
+
+
+class _StoreStream():
+    # Stream 'compressor' of the none codec
+    def compress(self, data: bytes)->bytes:
+        return bytes(data)
+
+    def flush(self)->bytes:
+        return b""
+
+
+class _Lz4Stream():
+    # lz4 frames need begin() with the size first
+    def __init__(self, level: int, size: int):
+        self.compressor = lz4_frame.LZ4FrameCompressor(
+                                            compression_level=level)
+        self.header = self.compressor.begin(source_size=size)
+
+    def compress(self, data: bytes)->bytes:
+        out = self.header + self.compressor.compress(data)
+        self.header = b""
+        return out
+
+    def flush(self)->bytes:
+        return self.header + self.compressor.flush()
+
+
+@dataclass(frozen=True)
+class PayloadCodec:
+    name: str
+    level: Optional[int]
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+    # Takes the total size to compress, returns an object with
+    # compress(block) and flush() like zlib.compressobj. The output is
+    # the same format compress makes, decompress reads it
+    compressobj: Callable[[int], object]
+
+    @property
+    def spec(self)->str:
+        if self.level is None:
+            return self.name
+        return f"{self.name}:{self.level}"
+
+
+def _none_codec(level: Optional[int])->PayloadCodec:
+    return PayloadCodec("none", None, bytes, bytes,
+                        lambda size: _StoreStream())
+
+
+def _zlib_codec(level: Optional[int])->PayloadCodec:
+    level = 6 if level is None else level
+    return PayloadCodec("zlib", level,
+                        lambda data: zlib.compress(data, level),
+                        zlib.decompress,
+                        lambda size: zlib.compressobj(level))
+
+
+def _zstd_codec(level: Optional[int])->PayloadCodec:
+    if zstandard is None:
+        raise ValueError("The zstd codec needs the zstandard package")
+    level = 3 if level is None else level
+    # threads=-1 uses every core for big payloads
+    compressor = zstandard.ZstdCompressor(level=level, threads=-1)
+    decompressor = zstandard.ZstdDecompressor()
+    # The size goes in the frame header, decompress needs it there
+    return PayloadCodec("zstd", level, compressor.compress,
+                        decompressor.decompress,
+                        lambda size: compressor.compressobj(size=size))
+
+
+def _lz4_codec(level: Optional[int])->PayloadCodec:
+    if lz4_frame is None:
+        raise ValueError("The lz4 codec needs the lz4 package")
+    level = 0 if level is None else level
+    return PayloadCodec("lz4", level,
+                        lambda data: lz4_frame.compress(
+                            data, compression_level=level),
+                        lz4_frame.decompress,
+                        lambda size: _Lz4Stream(level, size))
+
+
+CODECS: dict[str, Callable[[Optional[int]], PayloadCodec]] = {
+    'none': _none_codec,
+    'zlib': _zlib_codec,
+    'zstd': _zstd_codec,
+    'lz4': _lz4_codec,
+}
+
+
+def available_codecs()->list[str]:
+    '''
+    Names of the codecs whose packages are installed
+    '''
+    available = ['none', 'zlib']
+    if zstandard is not None:
+        available.append('zstd')
+    if lz4_frame is not None:
+        available.append('lz4')
+    return available
+
+
+def get_codec(spec: str)->PayloadCodec:
+    '''
+    Get the codec for a spec, ie 'zstd:9' or 'lz4'
+    '''
+    name, _, level = spec.strip().partition(':')
+    if name not in CODECS:
+        raise ValueError(f"Unknown codec {name}, "
+                         f"expected one of {list(CODECS.keys())}")
+    if level != "" and not level.lstrip('-').isdigit():
+        raise ValueError(f"Bad level in codec spec {spec}")
+    return CODECS[name](int(level) if level != "" else None)
+
+
+def write_npc(out_file: Path, arrays: dict[str, np.ndarray],
+              codec: PayloadCodec)->None:
+    '''
+    Write the arrays to out_file, each compressed on its own with the
+    codec. The json header has the codec, dtype, shape and location of
+    every array
+    '''
+
+    header = {'codec': codec.spec, 'arrays': {}}
+    payloads = []
+    offset = 0
+    for key, array in arrays.items():
+        array = np.asarray(array, order='C')
+        # A byte view of the array, not a copy of it
+        payload = codec.compress(array.reshape(-1).view(np.uint8))
+        header['arrays'][key] = {
+            'dtype': np.lib.format.dtype_to_descr(array.dtype),
+            'shape': list(array.shape),
+            'offset': offset,
+            'length': len(payload),
+        }
+        payloads.append(payload)
+        offset += len(payload)
+
+    header_bytes = json.dumps(header).encode()
+    with open(out_file, 'wb') as f:
+        f.write(_NPC_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for payload in payloads:
+            f.write(payload)
+
+
+def write_npc_stream(out_file: Path, key: str, src: BinaryIO,
+                     dtype: np.dtype, shape: tuple,
+                     codec: PayloadCodec)->None:
+    '''
+    Write an npc of one array whose raw C order bytes are read from src,
+    compressed a block at a time so it is never all in memory
+    '''
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+    def header_bytes(length: int)->bytes:
+        header = {'codec': codec.spec, 'arrays': {key: {
+            'dtype': np.lib.format.dtype_to_descr(dtype),
+            'shape': list(shape),
+            'offset': 0,
+            'length': length,
+        }}}
+        return json.dumps(header).encode()
+
+    # The length isn't known until the payload is written, so keep room
+    # for the header and pad it with spaces, json ignores them
+    header_len = len(header_bytes(0)) + _HEADER_PAD
+
+    with open(out_file, 'wb') as f:
+        f.write(_NPC_MAGIC)
+        f.write(_HEADER_LEN.pack(header_len))
+        header_start = f.tell()
+        f.write(b" " * header_len)
+
+        compressor = codec.compressobj(size)
+        length = 0
+        remaining = size
+        while remaining > 0:
+            block = src.read(min(_STREAM_BLOCK_SIZE, remaining))
+            if block == b"":
+                raise ValueError(f"Stream ended {remaining} bytes short")
+            remaining -= len(block)
+            out = compressor.compress(block)
+            f.write(out)
+            length += len(out)
+        out = compressor.flush()
+        f.write(out)
+        length += len(out)
+
+        f.seek(header_start)
+        f.write(header_bytes(length).ljust(header_len))
+
+
+def read_npc_header(npc_file: Path)->tuple[dict, int]:
+    '''
+    Read the header of an npc file, returns the header and where the
+    payloads start
+    '''
+    with open(npc_file, 'rb') as f:
+        if f.read(len(_NPC_MAGIC)) != _NPC_MAGIC:
+            raise ValueError(f"{npc_file} is not an npc file")
+        header_len, = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        header = json.loads(f.read(header_len))
+        return header, f.tell()
+
+
+def read_npc(npc_file: Path)->dict[str, np.ndarray]:
+    '''
+    Read the arrays of an npc file. The arrays are read only views of
+    the decompressed bytes
+    '''
+    header, start = read_npc_header(npc_file)
+    codec = get_codec(header['codec'])
+
+    arrays = {}
+    with open(npc_file, 'rb') as f:
+        for key, spec in header['arrays'].items():
+            f.seek(start + spec['offset'])
+            raw = codec.decompress(f.read(spec['length']))
+            arrays[key] = np.frombuffer(raw, dtype=np.dtype(spec['dtype'])
+                                        ).reshape(tuple(spec['shape']))
+    return arrays
+
+
+@dataclass
+class CodecBenchmark:
+    codec: str
+    raw_bytes: int = 0
+    compressed_bytes: int = 0
+    compress_secs: float = 0
+    decompress_secs: float = 0
+
+    @property
+    def ratio(self)->float:
+        return self.raw_bytes / max(self.compressed_bytes, 1)
+
+    @property
+    def compress_mbps(self)->float:
+        return self.raw_bytes / (1024*1024) / max(self.compress_secs, 1e-9)
+
+    @property
+    def decompress_mbps(self)->float:
+        return self.raw_bytes / (1024*1024) / max(self.decompress_secs, 1e-9)
+
+
+def bench_codecs(payloads: Iterable[np.ndarray],
+                 specs: list[str])->list[CodecBenchmark]:
+    '''
+    Compress and decompress every payload with each codec. Throughput
+    is in MB of uncompressed data per second
+    '''
+    codecs = [get_codec(x) for x in specs]
+    results = [CodecBenchmark(x.spec) for x in codecs]
+
+    for array in payloads:
+        data = np.ascontiguousarray(array).tobytes()
+        for codec, res in zip(codecs, results):
+            start = time.perf_counter()
+            compressed = codec.compress(data)
+            res.compress_secs += time.perf_counter() - start
+
+            start = time.perf_counter()
+            codec.decompress(compressed)
+            res.decompress_secs += time.perf_counter() - start
+
+            res.raw_bytes += len(data)
+            res.compressed_bytes += len(compressed)
+    return results
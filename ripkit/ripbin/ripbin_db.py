@@ -8,8 +8,9 @@ the home directory:
 """
 
 from dataclasses import fields
-import hashlib
+from contextlib import contextmanager
 import shutil
+import sqlite3
 
 from alive_progress import alive_it
 
@@ -25,10 +26,21 @@ from .ripbin_exceptions import RipbinRegistryError, RipbinAnalysisError, RipbinD
 
 from .analyzer_types import Compiler, RustcOptimization, ProgLang, FileType, GoOptimization, AnalysisType, Coptimization
 
+from .analysis_io import write_generator_npz
+
+from .hashing import hash_file
+
+from .blob_store import BlobStore
+
+from .ripbin_deterministic_db import recover_once
+
 
 DB_PATH = Path("~/.ripbin/").expanduser().resolve()
+# Old csv registry, only read by import_csv_registry now
 RIPBIN_REG = DB_PATH.joinpath('ripped_bins_registry.csv')
+RIPBIN_REG_DB = DB_PATH.joinpath('ripped_bins_registry.sqlite')
 RIPBIN_BINS = DB_PATH.joinpath('ripped_bins')
+BLOBS = BlobStore(DB_PATH.joinpath('blobs'))
 
 
 def init()->None:
@@ -55,7 +67,7 @@ def init()->None:
     # Now I have
     # 
     #  ~/.ripbin
-    #       | ripped_bins_registry.csv
+    #       | ripped_bins_registry.sqlite
     #       | ripped_bins
     # 
     # :D 
@@ -68,7 +80,7 @@ def _init_registry()->None:
 
     '''
 
-    if RIPBIN_REG.exists():
+    if RIPBIN_REG_DB.exists():
         raise RipbinDbError("Registry path exists")
 
 
@@ -101,47 +113,131 @@ def _init_registry()->None:
     # functional") meaning can hold different values like"
     # "Oz" vs "RustcDebugStrip" "RustcFillStrip" "Strip" 
     # I need the types to all be strings 
-    columns = [
-        'package_path',
-        'binary_name',
-        'opt_level',
-        'prog_lang',
-        'compiler_name',
-        'compiler_version',
-        'file_type',
-        'is_stripped',    # Two flags for stripped related things
-        'stripped_level', # for easier quierying
-        'os',
-        'arch',
-        'analysis_type',
-        'analysis_path',
-        'bin_hash', # This is a hash that will identify 
-                    # the package
-    ]
-
-    # Init the df
-    registry_df = pd.DataFrame(columns=columns)
-
-    # Save empty registry file
-    registry_df.to_csv(RIPBIN_REG,index=False)
+    conn = _connect()
+    conn.executescript(_REGISTRY_SCHEMA)
+    conn.close()
     return
 
-def calculate_md5(file_path, buffer_size=8192):
-    md5_hash = hashlib.md5()
 
-    with open(file_path, 'rb') as file:
-        buffer = file.read(buffer_size)
-        while buffer:
-            md5_hash.update(buffer)
-            buffer = file.read(buffer_size)
+# The registry columns, all strings
+REGISTRY_COLUMNS = [
+    'package_path',
+    'binary_name',
+    'opt_level',
+    'prog_lang',
+    'compiler_name',
+    'compiler_version',
+    'file_type',
+    'is_stripped',    # Two flags for stripped related things
+    'stripped_level', # for easier quierying
+    'os',
+    'arch',
+    'analysis_type',
+    'analysis_path',
+    'bin_hash', # This is a hash that will identify 
+                # the package
+]
+
+# Rewriting a csv of every registered analysis on each save gets slow, 
+# and two writers lose each other's rows. The registry is an sqlite 
+# table instead, rows are appended in a transaction and looked up 
+# through the indexes
+_REGISTRY_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS registry (
+    {', '.join(f'{x} TEXT' for x in REGISTRY_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS registry_bin_hash ON registry(bin_hash);
+CREATE INDEX IF NOT EXISTS registry_package_path ON registry(package_path);
+"""
+
+
+def _connect()->sqlite3.Connection:
+    conn = sqlite3.connect(RIPBIN_REG_DB, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+@contextmanager
+def registry_transaction():
+    '''
+    Open the registry for a batch of changes that are committed 
+    together, or not at all if there is an exception. Pass the 
+    connection to save_and_register_analysis as registry to batch saves.
+    A db that only has the old csv registry has it imported first
+    '''
+    if not RIPBIN_REG_DB.exists() and RIPBIN_REG.exists():
+        import_csv_registry(RIPBIN_REG)
+    if not RIPBIN_REG_DB.exists():
+        raise RipbinRegistryError("Registry doesn't exist")
+
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def register_rows(rows: list[dict], registry=None)->None:
+    '''
+    Append rows to the registry
+    '''
+    if registry is None:
+        with registry_transaction() as conn:
+            return register_rows(rows, conn)
+
+    registry.executemany(
+        f"INSERT INTO registry ({', '.join(REGISTRY_COLUMNS)}) "
+        f"VALUES ({', '.join('?' for _ in REGISTRY_COLUMNS)})",
+        [[str(row.get(x, "")) for x in REGISTRY_COLUMNS] for row in rows])
+    return
+
+
+def lookup_by_hash(bin_hash: str, registry=None)->list[dict]:
+    '''
+    Registry rows of the binary with the hash
+    '''
+    if registry is None:
+        with registry_transaction() as conn:
+            return lookup_by_hash(bin_hash, conn)
+    return [dict(x) for x in registry.execute(
+                "SELECT * FROM registry WHERE bin_hash=?", (bin_hash,))]
+
+
+def lookup_by_package(package_path: Path, registry=None)->list[dict]:
+    '''
+    Registry rows of the package
+    '''
+    if registry is None:
+        with registry_transaction() as conn:
+            return lookup_by_package(package_path, conn)
+    return [dict(x) for x in registry.execute(
+                "SELECT * FROM registry WHERE package_path=?", 
+                (str(package_path),))]
+
 
-    return md5_hash.hexdigest()
+def import_csv_registry(csv_path: Path = RIPBIN_REG)->int:
+    '''
+    Import the rows of an old csv registry. Returns the number of rows
+    '''
+    if not RIPBIN_REG_DB.exists():
+        _init_registry()
+
+    old_reg = pd.read_csv(csv_path, index_col=False, dtype=str,
+                          keep_default_na=False)
+    rows = old_reg.to_dict('records')
+    register_rows(rows)
+    return len(rows)
+
+def calculate_md5(file_path, buffer_size=8192):
+    # Memoized on the file's stat, unchanged files aren't hashed again
+    return hash_file(file_path).md5
 
 def get_registry():
     '''Return dataframe of Registry'''
-    if not RIPBIN_REG.exists():
-        raise Exception("Error: registry already exists")
-    return pd.read_csv(RIPBIN_REG, index_col = False)
+    with registry_transaction() as conn:
+        return pd.read_sql_query("SELECT * FROM registry", conn)
 
 
 def _check_registry_key_values():
@@ -175,11 +271,24 @@ def save_and_register_analysis(bin_path:Path,
                   overwrite_existing=False,
                   copy_bin: bool = True,
                   compiler_version: str = "",
-                  binHash = None)->None:
+                  binHash = None,
+                  registry: Union[sqlite3.Connection, None] = None)->None:
     '''
     Save the passed generated or list or array to 
     analysis file and register and register anaylsis
+
+    registry can be a connection from registry_transaction() to commit
+    the registration of many analyses at once
     '''
+    if registry is None:
+        # Clear out what a crashed writer left, once per process
+        recover_once()
+        with registry_transaction() as conn:
+            return save_and_register_analysis(bin_path, analysis_data,
+                        analysis_type, progLang, compiler, fileType, 
+                        opt_lvl, os, arch, stripped_level, 
+                        overwrite_existing, copy_bin, compiler_version,
+                        binHash, conn)
 
     if binHash is None:
         binHash = calculate_md5(bin_path)
@@ -194,10 +303,9 @@ def save_and_register_analysis(bin_path:Path,
     # See if there are any existing analysis files for a binary 
     # with the same hash. If so expect the binaries to be the 
     # same
-    registered_bins = get_registry()
-    common_analysis = registered_bins[registered_bins['bin_hash'] == binHash]
+    common_analysis = lookup_by_hash(binHash, registry)
 
-    if common_analysis.empty:
+    if common_analysis == []:
         # Need to make a pkg_dir for this binary
         pkg_path = RIPBIN_BINS.joinpath(f"{bin_path.name}_{str(binHash)}")
     else:
@@ -205,7 +313,7 @@ def save_and_register_analysis(bin_path:Path,
         # Else there's an existing binary with the same hash 
         # - For now I am going to assume that the current binary 
         # - and the one saved are an exact match
-        pkg_path = Path(list(common_analysis['package_path'])[0])
+        pkg_path = Path(common_analysis[0]['package_path'])
 
         # The following is a check that should be redunant and 
         # removed in the future 
@@ -239,12 +347,6 @@ def save_and_register_analysis(bin_path:Path,
         'bin_hash'          : binHash,
     }
 
-    reg_row_dict = {k : [v] for k,v in reg_row_dict.items()}
-
-    row_df = pd.DataFrame.from_dict(reg_row_dict)
-    # Create a new DataFrame from the dictionary and concatenate with the existing DataFrame
-    new_reg = pd.concat([registered_bins, row_df], ignore_index=True)
-
 
 
     # Handle the different instances of analysis_data 
@@ -254,9 +356,8 @@ def save_and_register_analysis(bin_path:Path,
         # Save numpy analysis_data to npz
         analysis_data = analysis_data
     elif inspect.isgenerator(analysis_data):
-        # Load the lines from generator into numpy array 
-        #write_generator_to_parquet(analysis_data,analysis_file)
-        analysis_data = np.array(list(analysis_data))
+        # Stream the lines from generator to file in blocks 
+        write_generator_npz(analysis_data, analysis_file)
     elif isinstance(analysis_data, Path):
         # Assert it's an .npz file and save 
         if ".npz" not in analysis_data.name:
@@ -264,27 +365,32 @@ def save_and_register_analysis(bin_path:Path,
 
         # Copy the data, which in this case is another 
         # file to the destination, which is analysis file
-        shutil.copy2(analysis_data, analysis_file)
+        BLOBS.link(analysis_data, analysis_file)
 
     else:
         raise TypeError("Data is of unknown type")
 
-    if not isinstance(analysis_data, Path):
+    if not isinstance(analysis_data, Path) and \
+            not inspect.isgenerator(analysis_data):
+        # The old file may be a link into the blob store, don't write
+        # over its content. Renamed in once complete so a crash never 
+        # leaves a partial file
+        tmp_file = analysis_file.with_name(f".{analysis_file.name}.tmp")
         try:
-            np.savez_compressed(analysis_file, data=analysis_data)
+            with open(tmp_file, 'wb') as f:
+                np.savez_compressed(f, data=analysis_data)
+            tmp_file.replace(analysis_file)
         except Exception as e:
+            tmp_file.unlink(missing_ok=True)
             st = f"Np save error: {e}"
             raise Exception(st)
 
     # Update the reg once the file is successfully saved
-    new_reg.to_csv(RIPBIN_REG,index=False)
+    register_rows([reg_row_dict], registry)
 
     if copy_bin:
         bin_file = pkg_path.joinpath(bin_path.name).resolve()
-        with open(bin_path, 'rb') as f:
-            bin_data = f.read()
-        with open(bin_file, 'wb') as f:
-            f.write(bin_data)
+        BLOBS.link(bin_path, bin_file, binHash)
     return
 
 def get_enum_field(enum: Type[Enum], value):
@@ -392,6 +498,21 @@ def ___re_analyze_tmp(path, comp, lang, opt):
     return 
 
 
+def _move_pkg_rows(registry: sqlite3.Connection, old_pkg_path: Path,
+                   new_path: Path)->int:
+    '''
+    Point the registry rows of the old package at the new path, in the 
+    registry transaction. Returns the number of rows changed
+    '''
+    old = f"{old_pkg_path.resolve()}"
+    new = f"{new_path.resolve()}"
+    cur = registry.execute(
+        "UPDATE registry SET package_path = ?, "
+        "analysis_path = replace(analysis_path, ?, ?) "
+        "WHERE package_path = ?", (new, old, new, old))
+    return cur.rowcount
+
+
 def _update_pkg_in_reg(old_pkg_path, new_pkg_name):
     '''
     After _mv_package, some packages were moved on the file system 
@@ -400,174 +521,62 @@ def _update_pkg_in_reg(old_pkg_path, new_pkg_name):
     This is update the registry 
     '''
 
-    # Get the reg
-    reg = get_registry()
-
-    # Make sure the old_pkg_path is in the registry 
-    files_in_pkg = reg[
-                    reg['package_path'] == f"{old_pkg_path.resolve()}"
-                    ]
-
-    # Raise error if the pkg doesn't exist
-    if files_in_pkg.empty:
-        raise Exception("No files with pkg path {}".format(old_pkg_path))
+    with registry_transaction() as reg:
 
-    # There should only exist one package, go ahead and move that now 
-    old_abs =  Path(files_in_pkg.iloc[0]['package_path'])
-    new_path = old_abs.parent.joinpath(new_pkg_name).resolve()
+        # Make sure the old_pkg_path is in the registry 
+        files_in_pkg = lookup_by_package(old_pkg_path.resolve(), reg)
 
-    # analysis path
-    files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}", "analysis_path"]  = files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}",'analysis_path'].str.replace(f"{old_pkg_path.resolve()}", f"{new_path.resolve()}")
+        # Raise error if the pkg doesn't exist
+        if files_in_pkg == []:
+            raise Exception("No files with pkg path {}".format(old_pkg_path))
 
+        old_abs =  Path(files_in_pkg[0]['package_path'])
+        new_path = old_abs.parent.joinpath(new_pkg_name).resolve()
 
-    # package path
-    files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}", "package_path"]  = files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}","package_path"].str.replace(f"{old_pkg_path.resolve()}", f"{new_path.resolve()}")
-
-
-    # Get a reg without the old package paths
-    reg = reg[reg['package_path'] != f"{old_pkg_path.resolve()}"]
-
-    # Make sure the old_pkg_path is in the registry 
-    should_be_empty = reg[
-                    reg['package_path'] == f"{old_pkg_path.resolve()}"
-                    ]
-
-    # Raise error if the pkg doesn't exist
-    if not should_be_empty.empty:
-        raise Exception("Reg was unable to remove oldpkg path{}".format(old_pkg_path))
-
-
-
-    # Make the new reg and save
-    new_reg = pd.concat([reg,files_in_pkg], ignore_index=True)
-
-    print("This is what is going to happen")
-    print("Following should be empty")
-    print(should_be_empty[["package_path","analysis_path"]])
-    print("This is the new package path")
-    print("=============================")
-    print("This is the new package rows")
-    print(new_reg[new_reg['package_path'] ==  f"{new_path.resolve()}" ])
-    print("=============================")
-
-
-    cont = input("Continue (Y)")
-    if cont not in ['Y', 'y']:
-        return
- 
-    # Updat tne new reg
-    new_reg.to_csv(RIPBIN_REG,index=False)
+        print("This is what is going to happen")
+        for row in files_in_pkg:
+            print(f"{row['analysis_path']} -> {new_path}")
+        print("=============================")
 
+        cont = input("Continue (Y)")
+        if cont not in ['Y', 'y']:
+            return
 
+        # One update of the rows, commited when the transaction ends
+        _move_pkg_rows(reg, old_pkg_path, new_path)
 
     return
 
 def _mv_package(old_pkg_path, new_pkg_name):
 
-    # Get ripbin reg 
-    reg = get_registry()
-
-    # Make sure the old_pkg_path is in the registry 
-    files_in_pkg = reg[
-                    reg['package_path'] == f"{old_pkg_path.resolve()}"
-                    ]
-
-    # Raise error if the pkg doesn't exist
-    if files_in_pkg.empty:
-        raise Exception("No files with pkg path {}".format(old_pkg_path))
-
-    print("Found  the follow rows with pkg {old_pkg_path}")
-    print(files_in_pkg[["package_path","analysis_path"]])
-
-
-    # There should only exist one package, go ahead and move that now 
-    old_abs =  Path(files_in_pkg.iloc[0]['package_path'])
-    new_path = old_abs.parent.joinpath(new_pkg_name).resolve()
-
-
-    # List of things that will change for every row in files_in_pkg
-    # 1. package_path  (saved as absolute)
-    # 2. analysis_path (saved as absolute)
-
-    # analysis path
-    #files_in_pkg['analysis_path'].str.replace(f"{old_pkg_path.resolve()}", 
-                                                #f"{new_path.resolve()}")
-
-    # package path
-    #files_in_pkg['package_path'].str.replace(f"{old_pkg_path.resolve()}",
-                                             #f"{new_path.resolve()}"})
+    with registry_transaction() as reg:
 
-    # analysis path
-    files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}", "analysis_path"]  = files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}",'analysis_path'].str.replace(f"{old_pkg_path.resolve()}", f"{new_path.resolve()}")
+        # Make sure the old_pkg_path is in the registry 
+        files_in_pkg = lookup_by_package(old_pkg_path.resolve(), reg)
 
+        # Raise error if the pkg doesn't exist
+        if files_in_pkg == []:
+            raise Exception("No files with pkg path {}".format(old_pkg_path))
 
-    # package path
-    files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}", "package_path"]  = files_in_pkg.loc[files_in_pkg['package_path'] == f"{old_pkg_path.resolve()}","package_path"].str.replace(f"{old_pkg_path.resolve()}", f"{new_path.resolve()}")
+        print(f"Found  the follow rows with pkg {old_pkg_path}")
+        for row in files_in_pkg:
+            print(f"{row['package_path']} {row['analysis_path']}")
 
+        # There should only exist one package, go ahead and move that now 
+        old_abs =  Path(files_in_pkg[0]['package_path'])
+        new_path = old_abs.parent.joinpath(new_pkg_name).resolve()
 
-    # Get a reg without the old package paths
-    reg = reg[reg['package_path'] != f"{old_pkg_path.resolve()}"]
+        if new_path.exists():
+            raise Exception("New pkg path already exists: {}".format(new_path))
 
-    # Make sure the old_pkg_path is in the registry 
-    should_be_empty = reg[
-                    reg['package_path'] == f"{old_pkg_path.resolve()}"
-                    ]
+        # The rows are updated first, but only commited if the move 
+        # works, so the registry and the file system can't disagree
+        _move_pkg_rows(reg, old_pkg_path, new_path)
 
-    # Raise error if the pkg doesn't exist
-    if not should_be_empty.empty:
-        raise Exception("Reg was unable to remove oldpkg path{}".format(old_pkg_path))
+        print(f"Moving {old_abs} to {new_path}")
+        shutil.move(old_abs, new_path)
 
-
-
-    # Make the new reg and save
-    new_reg = pd.concat([reg,files_in_pkg], ignore_index=True)
-
-    print("This is what is going to happen")
-    print("Following should be empty")
-    print(should_be_empty[["package_path","analysis_path"]])
-    print("This is the new package path")
-    print("=============================")
-    print("This is the new package rows")
-    print(new_reg[new_reg['package_path'] ==  f"{new_path.resolve()}" ])
-    print("=============================")
-
-    # About to move 
-    print(f"Moving {old_abs} to {new_path}")
-
-    if new_path.exists():
-        raise Exception("New pkg path already exists: {}".format(new_path))
-
-    #cont = input("Continue (Y)?")
-    #if cont not in ["Y", 'y']:
-    #    return
-
-    shutil.copytree(old_abs, new_path)
-    new_reg.to_csv(RIPBIN_REG,index=False)
-    shutil.rmtree(old_abs)
-
-    #new_row_ent= reg[
-    #                reg['package_path'] == f"{old_pkg_path.resolve()}"
-    #                ]
-#df.loc[df["B"] == "HERE", "A"] = df.loc[df["B"] == "HERE", "A"].str.replace("THIS", "ANOTHERONE")
-
-
-
-
-    # Ability to change file name
-
-    # First copy the file to the new name 
-
-    # Delete the previous name 
-
-    # Edit the row in the registry
-
-    # copy old row 
-
-    # Remove old row 
-
-    # edit copy 
-
-    # add new row
+    return
 
 
 
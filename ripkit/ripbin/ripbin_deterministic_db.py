@@ -1,16 +1,18 @@
 
 
 
-import hashlib
 from enum import Enum 
 from dataclasses import dataclass
 import numpy as np
 from pathlib import Path
-import shutil
-from typing import Union, Generator
+from typing import Optional, Union, Generator
 import inspect
 import pandas as pd
 import json
+import os
+import shutil
+import tempfile
+from functools import cached_property
 
 # One file is going to be a dataclass 
 # the name of the file 
@@ -33,21 +35,69 @@ import json
 # | bin_info
 # | analysis...
 
+# With a lot of packages one flat directory gets slow to list and search,
+# so packages are sharded by the first two bytes of the hash and the
+# package dir is just the hash
+#
+# ripped_bins
+# | ab
+#   | cd
+#     | abcd<rest of hash>
+#       | exa_binary
+#       | info.json
+#       | analysis...
+
 # I'd like to have a register file that keeps track of all of this 
 # to make gathering binaries faster, but then I have to 
 # worry about keeping the two insync
 
 
-from .ripbin_exceptions import RipbinRegistryError, RipbinAnalysisError, RipbinDbError, AnalysisExistsError
+from .ripbin_exceptions import RipbinRegistryError, RipbinAnalysisError, RipbinDbError, AnalysisExistsError, LockUnavailableError
+
+from .analyzer_types import Compiler, RustcOptimization, ProgLang, FileType, GoOptimization, AnalysisType, Coptimization, AnalysisFormat
+
+from .binary_analyzer import get_functions, EXTRACTOR_VERSIONS
+
+from .binary_context import BinaryContext
+
+from .hashing import hash_file
+
+from .blob_store import BlobStore
+
+from .catalog import RipbinCatalog
 
-from .analyzer_types import Compiler, RustcOptimization, ProgLang, FileType, GoOptimization, AnalysisType, Coptimization
+from .store_lock import hash_lock
 
-from .binary_analyzer import get_functions
+from .payload_codecs import DEFAULT_CODEC
+
+from .analysis_io import write_generator_npz, write_generator_npy, \
+                    write_generator_npc, save_arrays, load_arrays, \
+                    analysis_file_path, remove_other_formats, \
+                    DEFAULT_CHUNK_ROWS
 
 DB_PATH = Path("~/.ripbin/").expanduser().resolve()
 #RIPBIN_REG = DB_PATH.joinpath('ripped_bins_registry.csv')
 RIPBIN_BINS = DB_PATH.joinpath('ripped_bins')
 
+# Per package record of the analyses it holds and the extractor version
+# that made them
+ANALYSIS_MANIFEST = "analyses.json"
+
+# Present when every package is in the sharded layout, without it 
+# lookups also check the old flat <name>_<hash> packages
+STORE_LAYOUT_FILE = RIPBIN_BINS.joinpath('.sharded')
+
+# Every binary and analysis file is stored once here, the package files
+# link to it, see blob_store.py
+BLOBS = BlobStore(DB_PATH.joinpath('blobs'))
+
+# Indexed copy of the info.json files, see catalog.py
+CATALOG_PATH = DB_PATH.joinpath('catalog.sqlite')
+
+# New packages are written here and renamed into ripped_bins when
+# complete, on the same filesystem so the rename is atomic
+STAGING_PATH = DB_PATH.joinpath('staging')
+
 @dataclass 
 class RustFileBundle:
     binary_name: str
@@ -58,6 +108,7 @@ class RustFileBundle:
     crate_name: str
     flag_list: str
     compile_command: str
+    strip_level: str = ""
 
 @dataclass 
 class RustBundleMetaData:
@@ -85,6 +136,9 @@ def init()->None:
     ripped_bins_store = DB_PATH.joinpath('ripped_bins')
     ripped_bins_store.mkdir()
 
+    # A new store is sharded from the start
+    STORE_LAYOUT_FILE.touch()
+
     # Now I have
     # 
     #  ~/.ripbin
@@ -100,50 +154,45 @@ def calculate_md5(file_path, buffer_size=8192):
     names that were compiled with different flags / for different OSs 
     '''
 
-    md5_hash = hashlib.md5()
+    # The context already has the file mapped, and caches the hash
+    if isinstance(file_path, BinaryContext):
+        return file_path.md5
 
-    # Open, read, and take hash of file iterating over the buffers until
-    # there's no more
-    with open(file_path, 'rb') as file:
-        buffer = file.read(buffer_size)
-        while buffer:
-            md5_hash.update(buffer)
-            buffer = file.read(buffer_size)
+    # Memoized on the file's stat, unchanged files aren't hashed again
+    return hash_file(file_path).md5
 
-    # Return the digest 
-    return md5_hash.hexdigest()
 
-def save_analysis(bin_path: Path, 
+def save_analysis(bin_path: Union[Path, BinaryContext], 
                 analysis_data: Union[pd.DataFrame,np.ndarray, 
                               Generator[np.ndarray,None,None],
-                               Path], 
+                               dict[str, np.ndarray], Path], 
                 analysis_type: AnalysisType,
                 file_info: RustFileBundle,
                 save_bin: bool = True,
-                overwrite_existing: bool = True):
-
-    # Calc the hash for the file
-    binHash = calculate_md5(bin_path)
+                overwrite_existing: bool = True,
+                chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                storage_format: AnalysisFormat = AnalysisFormat.NPZ,
+                codec: str = DEFAULT_CODEC,
+                encoder: Optional[str] = None):
+    '''
+    Save the analysis of the binary, and the binary, to the db
 
-    # See if the hash is present in any other pkg directory name
-    common_binary_hash = [x for x in RIPBIN_BINS.iterdir() 
-                          if binHash in x.name ]
+    storage_format AnalysisFormat.NPY saves uncompressed .npy files that
+    can be memory mapped with load_analysis instead of a compressed npz.
+    AnalysisFormat.NPC compresses with the codec spec, ie 'zstd:9'. 
+    encoder is the byte encoder the analysis was generated with, it is
+    recorded in the package's manifest
 
-    #if common_analysis.empty:
-    pkg_path = RIPBIN_BINS.joinpath(f"{bin_path.name}_{str(binHash)}")
+    Safe to call from many processes at once, writers of the same hash
+    wait on each other and a crash never leaves a partial package, see
+    recover_store for cleaning up after one
+    '''
 
-    if common_binary_hash != []:
-        if not overwrite_existing:
-            #print("Existing analysis, without overwrite_existing")
-            #print(f"Common binary hashes: {common_binary_hash}")
-            raise Exception
-    else:
-        # Need to make a pkg_dir for this binary
-        pkg_path.mkdir()
+    # Calc the hash for the file
+    binHash = calculate_md5(bin_path)
 
-    # Path for the info file
-    info_path = pkg_path.joinpath("info.json")
-    analysis_file = pkg_path.joinpath(f"{analysis_type.value}.npz")
+    if isinstance(bin_path, BinaryContext):
+        bin_path = bin_path.path
 
     # Handle the different instances of analysis_data 
     if isinstance(analysis_data, pd.DataFrame):
@@ -152,29 +201,453 @@ def save_analysis(bin_path: Path,
         # Save numpy analysis_data to npz
         analysis_data = analysis_data
     elif inspect.isgenerator(analysis_data):
-        # Load the lines from generator into numpy array 
-        analysis_data = np.array(list(analysis_data))
+        # Generators are streamed to file in blocks below
+        pass
+    elif isinstance(analysis_data, dict):
+        # Multiple named arrays, ie AnalysisType.BYTES_PLUS_FUNC_BOUNDS
+        pass
     else:
         raise TypeError("Data is of unknown type")
 
+    # Clear out what a crashed writer left, once per process
+    recover_once()
+
+    # Only one process writes the package of a hash at a time, so
+    # workers that got the same binary can't race
+    with hash_lock(binHash):
+
+        # See if there is already a package for the hash
+        existing_pkg = find_package(binHash)
+
+        if existing_pkg is not None:
+            # Add to the existing package, a stale or missing analysis 
+            # type isn't an existing analysis
+            pkg_path = existing_pkg
+            if not overwrite_existing and \
+                        is_analysis_cached(binHash, analysis_type, pkg_path):
+                raise AnalysisExistsError(f"Binary with hash {binHash} exists")
+        else:
+            pkg_path = package_path_for(binHash)
+
+        # The files are written in the staging dir. A new package is 
+        # renamed into place once it's complete, the files of an update
+        # are renamed into the package one at a time with the manifest
+        # last
+        work_path = _make_staging_dir(binHash)
+        try:
+            _write_package(work_path, pkg_path, bin_path, binHash, 
+                           analysis_data, analysis_type, file_info, 
+                           save_bin, chunk_rows, storage_format, codec, 
+                           encoder)
+            if existing_pkg is None:
+                pkg_path.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(work_path, pkg_path)
+            else:
+                _publish_update(work_path, pkg_path, analysis_type,
+                                storage_format)
+        finally:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+        # Keep the catalog in sync with the package
+        with get_catalog() as catalog:
+            catalog.add_binary(file_info.__dict__, pkg_path,
+                               pkg_path.joinpath(bin_path.name) 
+                                    if save_bin else None)
+            catalog.add_analysis(binHash, analysis_type.value,
+                                 EXTRACTOR_VERSIONS.get(analysis_type, 1),
+                                 storage_format.value,
+                                 analysis_file_path(pkg_path, analysis_type,
+                                                    storage_format))
+    return
+
+
+def _write_package(pkg_path: Path, dest_path: Path, bin_path: Path, 
+                   binHash: str, analysis_data, analysis_type: AnalysisType,
+                   file_info: RustFileBundle, save_bin: bool,
+                   chunk_rows: int, storage_format: AnalysisFormat,
+                   codec: str, encoder: Optional[str] = None)->None:
+    '''
+    Write the analysis, info, manifest and binary into the staging dir
+    pkg_path. dest_path is the package they are for, its info and
+    manifest are carried over when it exists. The caller holds the lock
+    of the hash
+    '''
+
+    # Path for the info file
+    info_path = pkg_path.joinpath("info.json")
+    analysis_file = analysis_file_path(pkg_path, analysis_type, 
+                                       storage_format)
+
     try:
         # Save the analysis to file 
-        np.savez_compressed(analysis_file, data=analysis_data)
-        # Save the info to file
-        with open(info_path.resolve(), "w") as json_file:
-            json.dump(file_info.__dict__, json_file, indent=4)
+        if inspect.isgenerator(analysis_data):
+            if storage_format == AnalysisFormat.NPY:
+                write_generator_npy(analysis_data, analysis_file,
+                                    chunk_rows=chunk_rows)
+            elif storage_format == AnalysisFormat.NPC:
+                write_generator_npc(analysis_data, analysis_file, codec,
+                                    chunk_rows=chunk_rows)
+            else:
+                write_generator_npz(analysis_data, analysis_file,
+                                    chunk_rows=chunk_rows)
+        elif isinstance(analysis_data, dict):
+            save_arrays(pkg_path, analysis_type, analysis_data, 
+                        storage_format, codec)
+        else:
+            save_arrays(pkg_path, analysis_type, {'data': analysis_data},
+                        storage_format, codec)
+        # Save the info to file, keeping what an earlier save knew
+        _write_json(info_path, merge_info(dest_path.joinpath("info.json"),
+                                          file_info.__dict__))
     except Exception as e:
         st = f"Np save error: {e}"
         raise Exception(st)
 
+    # Share any payload file identical to one that's already stored
+    for payload in pkg_path.glob(f"{analysis_type.value}.*"):
+        if payload.suffix in ['.npz', '.npy', '.npc']:
+            BLOBS.dedup(payload)
 
-    # Copy the binary
+    # Place the binary, a reflink or hard link when the filesystem 
+    # allows it instead of a copy
     if save_bin:
-        bin_file = pkg_path.joinpath(bin_path.name).resolve()
-        shutil.copy(bin_path,bin_file)
+        BLOBS.link(bin_path, pkg_path.joinpath(bin_path.name), binHash)
+
+    # Record the extractor version that made the analysis. This is
+    # what is_analysis_cached checks so it goes last
+    manifest = read_analysis_manifest(dest_path)
+    manifest[analysis_type.value] = {
+        'extractor_version': EXTRACTOR_VERSIONS.get(analysis_type, 1),
+        'format': storage_format.value,
+    }
+    if storage_format == AnalysisFormat.NPC:
+        manifest[analysis_type.value]['codec'] = codec
+    if encoder is not None:
+        manifest[analysis_type.value]['encoder'] = encoder
+    _write_json(pkg_path.joinpath(ANALYSIS_MANIFEST), manifest)
     return
 
 
+def _publish_update(work_path: Path, pkg_path: Path,
+                    analysis_type: AnalysisType,
+                    storage_format: AnalysisFormat)->None:
+    '''
+    Move the files written in work_path into the existing package. The
+    analysis is marked pending in the manifest first and the new
+    manifest is renamed in last, a crash in between leaves an analysis
+    that is_analysis_cached says to generate again
+    '''
+    manifest = read_analysis_manifest(pkg_path)
+    if analysis_type.value in manifest:
+        manifest[analysis_type.value] = dict(manifest[analysis_type.value],
+                                             extractor_version=None)
+        _write_json(pkg_path.joinpath(ANALYSIS_MANIFEST), manifest)
+
+    remove_other_formats(pkg_path, analysis_type, storage_format)
+    for path in work_path.iterdir():
+        if path.name != ANALYSIS_MANIFEST:
+            os.replace(path, pkg_path.joinpath(path.name))
+    os.replace(work_path.joinpath(ANALYSIS_MANIFEST),
+               pkg_path.joinpath(ANALYSIS_MANIFEST))
+
+
+def merge_info(info_path: Path, info: dict)->dict:
+    '''
+    The info to save over info_path, its empty fields filled in from the
+    info.json already there. A save without the build metadata, ie an
+    ingest without --opt-lvl, doesn't blank what a build recorded
+    '''
+    try:
+        with open(info_path, 'r') as f:
+            old = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict(info)
+    merged = dict(old)
+    merged.update({k: v for k, v in info.items()
+                   if v != "" or k not in old})
+    return merged
+
+
+def _write_json(path: Path, obj)->None:
+    '''
+    Write the json to a temp file and rename it over path, readers see
+    the old or the new file but never part of one
+    '''
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as json_file:
+            json.dump(obj, json_file, indent=4)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _make_staging_dir(bin_hash: str)->Path:
+    '''
+    Make a temp dir to build the package of the hash in. Its name starts
+    with the hash so recover_store knows which lock guards it
+    '''
+    STAGING_PATH.mkdir(parents=True, exist_ok=True)
+    work_path = Path(tempfile.mkdtemp(prefix=f"{bin_hash}.", 
+                                      dir=STAGING_PATH))
+    # mkdtemp makes it 0700, packages are readable like any other dir
+    work_path.chmod(0o755)
+    return work_path
+
+
+def _is_temp_file(path: Path)->bool:
+    # The temp names of analysis_io, _write_json and BlobStore.link
+    return path.name.startswith(".") and \
+                path.suffix in ['.tmp', '.rows', '.link']
+
+
+def recover_store(deep: bool = False)->int:
+    '''
+    Remove what crashed writers left behind, the staging dirs of new 
+    packages and, with deep, the temp files in every package and in the
+    blob store. Anything a running writer still holds the lock of is 
+    left alone, so this is safe to run while ingesting.
+
+    Returns the number of dirs and files removed
+    '''
+
+    removed = 0
+    if STAGING_PATH.exists():
+        for work_path in STAGING_PATH.iterdir():
+            try:
+                with hash_lock(work_path.name.split('.')[0], blocking=False):
+                    shutil.rmtree(work_path, ignore_errors=True)
+                    removed += 1
+            except LockUnavailableError:
+                continue
+
+    if not deep:
+        return removed
+
+    for pkg in iter_packages():
+        temp_files = [x for x in pkg.iterdir() if _is_temp_file(x)]
+        if temp_files == []:
+            continue
+        try:
+            with hash_lock(package_hash(pkg), blocking=False):
+                for temp_file in temp_files:
+                    temp_file.unlink(missing_ok=True)
+                    removed += 1
+        except LockUnavailableError:
+            continue
+
+    removed += BLOBS.remove_stale_temp()
+    return removed
+
+
+_recovered = False
+
+
+def recover_once()->None:
+    '''
+    Run the recover_store sweep, and drop the stale blob temp files, the
+    first time this process uses the store
+    '''
+    global _recovered
+    if _recovered or not DB_PATH.exists():
+        return
+    _recovered = True
+    recover_store()
+    BLOBS.remove_stale_temp()
+
+
+def package_path_for(bin_hash: str)->Path:
+    '''
+    Path of the package for the hash in the sharded layout, 
+    ripped_bins/ab/cd/abcd...
+    '''
+    return RIPBIN_BINS.joinpath(bin_hash[:2], bin_hash[2:4], bin_hash)
+
+
+def package_hash(pkg_path: Path)->str:
+    '''
+    The binary hash of a package dir, in either layout
+    '''
+    return pkg_path.name.split('_')[-1]
+
+
+def _is_legacy_package(path: Path)->bool:
+    # Shard dirs are 2 hex chars, old packages are <name>_<hash>
+    return path.is_dir() and len(path.name) != 2
+
+
+# The old flat packages by hash, and the mtime of ripped_bins they were
+# listed at
+_legacy_index: Optional[tuple[int, dict[str, Path]]] = None
+
+
+def _legacy_packages()->dict[str, Path]:
+    '''
+    The old flat packages by hash. Listed once and again only when 
+    ripped_bins changes, adding or moving a package changes its mtime
+    '''
+    global _legacy_index
+    mtime = RIPBIN_BINS.stat().st_mtime_ns
+    if _legacy_index is None or _legacy_index[0] != mtime:
+        _legacy_index = (mtime, {package_hash(x): x 
+                                 for x in RIPBIN_BINS.iterdir()
+                                 if _is_legacy_package(x)})
+    return _legacy_index[1]
+
+
+def find_package(bin_hash: str)->Union[Path, None]:
+    '''
+    Get the package dir of the hash or None. This is one stat in a 
+    sharded store, stores with old flat packages also look it up in the
+    index of those
+    '''
+    pkg = package_path_for(bin_hash)
+    if pkg.is_dir():
+        return pkg
+
+    if not STORE_LAYOUT_FILE.exists():
+        pkg = _legacy_packages().get(bin_hash)
+        if pkg is not None and pkg.is_dir():
+            return pkg
+    return None
+
+
+def iter_packages()->Generator[Path, None, None]:
+    '''
+    Iterate over the package dirs in the db
+    '''
+    for top in RIPBIN_BINS.iterdir():
+        if _is_legacy_package(top):
+            yield top
+        elif top.is_dir():
+            for shard in top.iterdir():
+                for pkg in shard.iterdir():
+                    if pkg.is_dir():
+                        yield pkg
+
+
+def get_package_path(bin_hash: str)->Path:
+    '''
+    Get the package dir of the binary with the passed hash
+    '''
+    pkg = find_package(bin_hash)
+    if pkg is None:
+        raise RipbinDbError(f"No package for hash {bin_hash}")
+    return pkg
+
+
+def migrate_store()->tuple[int, int]:
+    '''
+    Move the flat <name>_<hash> packages into the sharded layout and 
+    rebuild the catalog. 
+
+    Packages whose hash is already in the sharded layout are left where
+    they are. Returns (number moved, number left)
+    '''
+
+    moved = 0
+    left = 0
+    for pkg in [x for x in RIPBIN_BINS.iterdir() if _is_legacy_package(x)]:
+        dest = package_path_for(package_hash(pkg))
+        # Hold the lock so a writer doesn't make the package meanwhile
+        with hash_lock(package_hash(pkg)):
+            if dest.exists():
+                print(f"Package {pkg.name} is already at {dest}, not moving")
+                left += 1
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            # Same filesystem, so this is a rename and not a copy
+            pkg.rename(dest)
+        moved += 1
+
+    if left == 0:
+        STORE_LAYOUT_FILE.touch()
+    rebuild_catalog()
+    return moved, left
+
+
+def get_catalog()->RipbinCatalog:
+    '''
+    Open the catalog of the db, use it as a context manager so its 
+    closed. An empty catalog of a store that has packages, ie one made
+    before there was a catalog, is rebuilt first
+    '''
+    recover_once()
+    catalog = RipbinCatalog(CATALOG_PATH)
+    if catalog.is_empty() and RIPBIN_BINS.exists() and \
+            next(iter_packages(), None) is not None:
+        catalog.rebuild(iter_packages())
+    return catalog
+
+
+def rebuild_catalog()->int:
+    '''
+    Rebuild the catalog from the info.json files of the packages. 
+    Returns the number of binaries in the catalog
+    '''
+    with get_catalog() as catalog:
+        return catalog.rebuild(iter_packages())
+
+
+def read_analysis_manifest(pkg_path: Path)->dict:
+    '''
+    Read the manifest of the analyses in the package, 
+    {analysis_type: {'extractor_version': int, 'format': str}}, npc
+    analyses also have the 'codec' spec
+    '''
+    try:
+        with open(pkg_path.joinpath(ANALYSIS_MANIFEST), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def is_analysis_cached(bin_hash: str, analysis_type: AnalysisType,
+                       pkg_path: Union[Path, None] = None)->bool:
+    '''
+    Check if the db has the analysis of the binary made by the current 
+    version of the extractor, so it doesn't need to be generated again.
+
+    Analyses saved before the manifest existed count as version 1
+    '''
+
+    if pkg_path is None:
+        try:
+            pkg_path = get_package_path(bin_hash)
+        except RipbinDbError:
+            return False
+
+    version = EXTRACTOR_VERSIONS.get(analysis_type, 1)
+    entry = read_analysis_manifest(pkg_path).get(analysis_type.value)
+    if entry is not None:
+        return entry['extractor_version'] == version
+
+    has_file = any(x.name.startswith(f"{analysis_type.value}.") 
+                   for x in pkg_path.iterdir())
+    return has_file and version == 1
+
+
+def load_analysis(bin_hash: str, analysis_type: AnalysisType,
+                  mmap_mode: Union[str, None] = 'r'
+                  )->Union[np.ndarray, dict[str, np.ndarray]]:
+    '''
+    Load the analysis of the binary with the passed hash
+
+    Analyses saved with AnalysisFormat.NPY come back as read only memory 
+    maps, so many readers share the one page cached copy. Analyses with 
+    a single array return that array, otherwise a dict of the arrays
+    '''
+
+    arrays = load_arrays(get_package_path(bin_hash), analysis_type, 
+                         mmap_mode)
+    if list(arrays.keys()) == ['data']:
+        return arrays['data']
+    return arrays
+
+
 #TODO: The following 2 functions are sort of redunant because the npz file 
 #       already has all of these. The npz file would be more annoying to work 
 #       with. Might be nice to have a file of all the function addrs listed
@@ -212,13 +685,151 @@ def save_lief_ground_truth(bin_path: Path):
 
 
 
-def get_ripped_bins(db_loc: Path = DB_PATH, opt_lvl = None, target = None):
+class RippedBinary():
     '''
-    Get a list of the ripped binaries and their analysis
+    Handle to a binary in the db. Only the catalog row is loaded, the 
+    binary, ground truth and analyses are read when they are asked for
     '''
 
-    # This is the directory for each file 
-    file_dirs = DB_PATH.iterdir() 
+    def __init__(self, row: dict):
+        self.row = row
+
+    def __repr__(self):
+        return f"RippedBinary({self.binary_name}, {self.bin_hash})"
+
+    @property
+    def bin_hash(self)->str:
+        return self.row['bin_hash']
+
+    @property
+    def binary_name(self)->str:
+        return self.row['binary_name']
+
+    @property
+    def crate_name(self)->str:
+        return self.row['crate_name']
+
+    @property
+    def target(self)->str:
+        return self.row['target']
+
+    @property
+    def filetype(self)->str:
+        return self.row['filetype']
+
+    @property
+    def optimization(self)->str:
+        return self.row['optimization']
+
+    @property
+    def strip_level(self)->str:
+        return self.row['strip_level']
+
+    @property
+    def pkg_path(self)->Path:
+        return Path(self.row['pkg_path'])
+
+    @property
+    def path(self)->Path:
+        '''
+        Path of the binary in the package
+        '''
+        if self.row['bin_path'] != "":
+            return Path(self.row['bin_path'])
+        return self.pkg_path.joinpath(self.binary_name)
+
+    @cached_property
+    def info(self)->dict:
+        '''
+        The full info.json of the package
+        '''
+        with open(self.pkg_path.joinpath("info.json"), 'r') as f:
+            return json.load(f)
+
+    def context(self)->BinaryContext:
+        return BinaryContext(self.path)
+
+    def read_binary(self)->bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def analysis_types(self)->list[str]:
+        return list(read_analysis_manifest(self.pkg_path).keys())
+
+    def analysis(self, analysis_type: AnalysisType,
+                 mmap_mode: Union[str, None] = 'r'
+                 )->Union[np.ndarray, dict[str, np.ndarray]]:
+        '''
+        Load the analysis, see load_analysis
+        '''
+        arrays = load_arrays(self.pkg_path, analysis_type, mmap_mode)
+        if list(arrays.keys()) == ['data']:
+            return arrays['data']
+        return arrays
+
+    def ground_truth(self)->dict[int, str]:
+        '''
+        Function start address to name, from the saved lief ground truth
+        when there is one, otherwise from the binary's symbols
+        '''
+        gt_file = self.pkg_path.joinpath("lief_ground_truth.txt")
+        if gt_file.exists():
+            with open(gt_file, 'r') as f:
+                return {int(addr, 16): name.strip() for addr, name in 
+                        (x.split(':', 1) for x in f if ':' in x)}
+        return {x.addr: x.name for x in get_functions(self.path)}
+
+
+def _query_catalog(db_loc: Path)->RipbinCatalog:
+    if Path(db_loc).resolve() == DB_PATH.resolve():
+        return get_catalog()
+    catalog = RipbinCatalog(Path(db_loc).joinpath(CATALOG_PATH.name))
+    if catalog.is_empty() and any(Path(db_loc).joinpath(
+                                RIPBIN_BINS.name).glob("*")):
+        print(f"Warning: the catalog of {db_loc} is empty but it has "
+              f"packages, rebuild the catalog")
+    return catalog
+
+
+def get_ripped_bins(db_loc: Path = DB_PATH, opt_lvl = None, target = None,
+                    filetype = None, crate = None, 
+                    analysis_type: Union[AnalysisType, None] = None,
+                    limit: Union[int, None] = None,
+                    offset: int = 0)->list[RippedBinary]:
+    '''
+    Get a list of the ripped binaries matching the filters, ordered by 
+    hash. limit and offset page through the results. 
 
+    This only reads the catalog, see RippedBinary for loading the 
+    binaries and their analyses
+    '''
 
-    return
+    with _query_catalog(db_loc) as catalog:
+        rows = catalog.find(
+                analysis_type=analysis_type.value if analysis_type else None,
+                limit=limit, offset=offset,
+                optimization=_enum_value(opt_lvl),
+                target=_enum_value(target),
+                filetype=_enum_value(filetype),
+                crate_name=crate)
+    return [RippedBinary(x) for x in rows]
+
+
+def count_ripped_bins(db_loc: Path = DB_PATH, opt_lvl = None, target = None,
+                      filetype = None, crate = None,
+                      analysis_type: Union[AnalysisType, None] = None)->int:
+    '''
+    Number of ripped binaries matching the filters of get_ripped_bins
+    '''
+    with _query_catalog(db_loc) as catalog:
+        return catalog.count(
+                analysis_type=analysis_type.value if analysis_type else None,
+                optimization=_enum_value(opt_lvl),
+                target=_enum_value(target),
+                filetype=_enum_value(filetype),
+                crate_name=crate)
+
+
+def _enum_value(val):
+    # Filters can be passed as the enums or their values
+    return val.value if isinstance(val, Enum) else val
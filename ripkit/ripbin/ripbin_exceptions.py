@@ -25,3 +25,6 @@ class AnalysisExistsError(RipbinAnalysisError):
     """Existing Analysis file exists"""
 
 
+
+class LockUnavailableError(RipbinDbError):
+    """Another writer holds the lock"""
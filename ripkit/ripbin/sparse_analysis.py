@@ -0,0 +1,102 @@
+"""
+Reader for the sparse analysis type AnalysisType.BYTES_PLUS_FUNC_BOUNDS
+
+The sparse analysis only stores the raw .text bytes and the sorted
+function start and end offsets. The one hot and decimal matrices that
+the other analysis types store are rebuilt here only when they are
+asked for, either for the whole binary or for a slice of it.
+"""
+
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+from .analyzer_types import AnalysisType
+from .binary_analyzer import labeled_features_from_bounds
+
+
+class SparseFuncBoundsAnalysis():
+    '''
+    Bytes plus function bounds, expanded lazily
+    '''
+
+    def __init__(self, text_bytes: np.ndarray, func_starts: np.ndarray,
+                 func_ends: np.ndarray, text_base: int = 0):
+        self.bytes = text_bytes
+        self.func_starts = func_starts.astype(np.int64)
+        self.func_ends = func_ends.astype(np.int64)
+        # NOTICE: np.load memory maps a 0-d array as shape (1,)
+        self.text_base = int(np.asarray(text_base).item())
+
+    @classmethod
+    def load(cls, analysis_file: Path):
+        '''
+        Load the analysis from a saved bytes_plus_func_bounds.npz
+        '''
+        with np.load(analysis_file) as data:
+            return cls.from_arrays(data)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        Make the analysis from the saved arrays, ie from load_analysis.
+        Memory mapped bytes stay memory mapped
+        '''
+        return cls(arrays['bytes'], arrays['func_starts'],
+                   arrays['func_ends'], arrays['text_base'])
+
+    def __len__(self):
+        return self.bytes.shape[0]
+
+    def _slice(self, start: int, stop: Optional[int]):
+        '''
+        Get the bytes and the function bounds, shifted to be relative to
+        start, for the slice [start, stop)
+        '''
+        stop = len(self) if stop is None else min(stop, len(self))
+
+        # The bounds are sorted so the ones in the slice are contiguous
+        s_lo, s_hi = np.searchsorted(self.func_starts, [start, stop])
+        e_lo, e_hi = np.searchsorted(self.func_ends, [start, stop])
+
+        return (self.bytes[start:stop],
+                self.func_starts[s_lo:s_hi] - start,
+                self.func_ends[e_lo:e_hi] - start)
+
+    def onehot(self, start: int = 0, stop: Optional[int] = None,
+               legacy_one_hot=True)->np.ndarray:
+        '''
+        Rebuild the ONEHOT_PLUS_FUNC_LABELS matrix for [start, stop)
+        '''
+        return labeled_features_from_bounds(*self._slice(start, stop),
+                                            True, legacy_one_hot)
+
+    def decimal(self, start: int = 0,
+                stop: Optional[int] = None)->np.ndarray:
+        '''
+        Rebuild the DEC_REPR_BYTE_PLUS_FUNC_LABELS matrix for [start, stop)
+        '''
+        return labeled_features_from_bounds(*self._slice(start, stop),
+                                            False)
+
+    def encode(self, encoder: str, start: int = 0,
+               stop: Optional[int] = None)->np.ndarray:
+        '''
+        Rebuild the labeled matrix for [start, stop) with the byte 
+        encoded by the named encoder from byte_encoders
+        '''
+        return labeled_features_from_bounds(*self._slice(start, stop),
+                                            encoder=encoder)
+
+    def as_analysis(self, analysis_type: AnalysisType, start: int = 0,
+                    stop: Optional[int] = None)->np.ndarray:
+        '''
+        Get the matrix the passed analysis type would have saved
+        '''
+        match analysis_type:
+            case AnalysisType.ONEHOT_PLUS_FUNC_LABELS:
+                return self.onehot(start, stop)
+            case AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS:
+                return self.decimal(start, stop)
+            case _:
+                raise Exception(f"Cannot expand to {analysis_type}")
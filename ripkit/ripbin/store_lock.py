@@ -0,0 +1,56 @@
+"""
+Advisory locks for writing to the ripbin db
+
+Any number of processes can ingest at once, but only one may write the
+package of a given hash at a time. The locks are flock()s on a fixed set
+of lock files picked by the first characters of the hash, so the lock
+files never have to be cleaned up and two writers only wait on each
+other when their hashes share a stripe.
+
+flock is released by the kernel when the process dies, so a lock that
+can be taken is never held by a crashed writer.
+"""
+
+import fcntl
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Generator
+
+from .ripbin_exceptions import LockUnavailableError
+
+
+LOCKS_PATH = Path("~/.ripbin/locks").expanduser()
+
+# Number of hex chars of the hash that pick the lock file, 4096 stripes
+_STRIPE_CHARS = 3
+
+
+def lock_path(bin_hash: str)->Path:
+    return LOCKS_PATH.joinpath(f"{bin_hash[:_STRIPE_CHARS]}.lock")
+
+
+@contextmanager
+def hash_lock(bin_hash: str,
+              blocking: bool = True)->Generator[None, None, None]:
+    '''
+    Hold the write lock of the hash. Without blocking raise
+    LockUnavailableError instead of waiting for it.
+
+    The locks aren't reentrant and hashes share them, so never take a
+    lock while holding another
+    '''
+    path = lock_path(bin_hash)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError as e:
+            raise LockUnavailableError(f"Lock for {bin_hash} is held") from e
+        yield
+    finally:
+        # Closing the fd releases the lock
+        os.close(fd)
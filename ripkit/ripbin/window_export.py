@@ -0,0 +1,173 @@
+"""
+Export stored analyses as fixed length windows for sequence models
+
+Windows of length L every S rows are cut from each analysis as a
+strided view, no window is copied until it is written into a shard.
+Shards are plain .npy files of shape (windows, L, features) so they can
+be memory mapped and batched directly, and an index.json records which
+windows came from which binary.
+"""
+
+import json
+import numpy as np
+from pathlib import Path
+from typing import Generator, Iterable, Optional
+
+from .analyzer_types import AnalysisType
+from .analysis_io import load_arrays
+from .sparse_analysis import SparseFuncBoundsAnalysis
+from .ripbin_deterministic_db import iter_packages, package_hash
+
+
+def strided_windows(data: np.ndarray, length: int,
+                    stride: int)->np.ndarray:
+    '''
+    Read only view of the windows of data with shape
+    (num_windows, length, *data.shape[1:]). Only windows that fit
+    completely are included, see padded_tail_window for the rest
+    '''
+
+    if length <= 0 or stride <= 0:
+        raise ValueError("Window length and stride must be positive")
+
+    num_rows = data.shape[0]
+    num_windows = 0 if num_rows < length else (num_rows - length)//stride + 1
+
+    return np.lib.stride_tricks.as_strided(
+                data,
+                shape=(num_windows, length, *data.shape[1:]),
+                strides=(stride*data.strides[0], *data.strides),
+                writeable=False)
+
+
+def padded_tail_window(data: np.ndarray, length: int, stride: int,
+                       pad_value=0)->Optional[np.ndarray]:
+    '''
+    The window starting where the next full window would start, padded
+    with pad_value. None if there are no rows left over
+    '''
+
+    num_rows = data.shape[0]
+    num_windows = 0 if num_rows < length else (num_rows - length)//stride + 1
+    start = num_windows * stride
+
+    if start >= num_rows:
+        return None
+
+    tail = np.full((length, *data.shape[1:]), pad_value, dtype=data.dtype)
+    tail[:num_rows - start] = data[start:]
+    return tail
+
+
+def iter_stored_analyses(analysis_type: AnalysisType,
+                         encoder: Optional[str] = None
+                         )->Generator[tuple[str, np.ndarray], None, None]:
+    '''
+    Iterate over (bin_hash, array) for every package with the analysis.
+
+    One hot and decimal analyses are rebuilt from the sparse
+    BYTES_PLUS_FUNC_BOUNDS analysis when a package only has that. When
+    an encoder is passed the matrices are always built from the sparse
+    analysis with that byte encoder, and analysis_type is ignored
+    '''
+
+    for pkg in iter_packages():
+        bin_hash = package_hash(pkg)
+        if encoder is None:
+            try:
+                yield bin_hash, load_arrays(pkg, analysis_type)['data']
+                continue
+            except FileNotFoundError:
+                pass
+
+        try:
+            arrays = load_arrays(pkg, AnalysisType.BYTES_PLUS_FUNC_BOUNDS)
+        except FileNotFoundError:
+            continue
+        sparse = SparseFuncBoundsAnalysis.from_arrays(arrays)
+        if encoder is None:
+            yield bin_hash, sparse.as_analysis(analysis_type)
+        else:
+            yield bin_hash, sparse.encode(encoder)
+
+
+def export_windows(analyses: Iterable[tuple[str, np.ndarray]],
+                   out_dir: Path, length: int, stride: int,
+                   pad_tail: bool = False, pad_value=0,
+                   shard_bytes: int = 256 * (1 << 20))->dict:
+    '''
+    Write the windows of the analyses to contiguous shards in out_dir
+
+    Each shard holds as many windows as fit in shard_bytes. Returns the
+    index that is also saved to out_dir/index.json
+    '''
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    index = {
+        'length': length,
+        'stride': stride,
+        'pad_tail': pad_tail,
+        'shards': [],
+        'binaries': [],
+    }
+
+    shard = None
+    filled = 0
+
+    def flush():
+        nonlocal filled
+        if filled == 0:
+            return
+        shard_file = out_dir.joinpath(f"windows_{len(index['shards']):05d}.npy")
+        np.save(shard_file, shard[:filled])
+        index['shards'].append({'file': shard_file.name, 'windows': filled})
+        filled = 0
+
+    for bin_hash, data in analyses:
+        windows = strided_windows(data, length, stride)
+        tail = padded_tail_window(data, length, stride, pad_value) \
+                    if pad_tail else None
+
+        # The first analysis decides the shape of the shards
+        if shard is None:
+            window_nbytes = length * data.dtype.itemsize * \
+                                int(np.prod(data.shape[1:]))
+            shard_windows = max(shard_bytes // window_nbytes, 1)
+            shard = np.empty((shard_windows, length, *data.shape[1:]),
+                             dtype=data.dtype)
+
+        if shard.shape[2:] != data.shape[1:]:
+            raise ValueError(f"Analysis of {bin_hash} has shape {data.shape} "
+                             f"but the shards hold {shard.shape[2:]}")
+
+        index['binaries'].append({
+            'bin_hash': bin_hash,
+            'shard': len(index['shards']),
+            'window': filled,
+            'windows': len(windows) + (tail is not None),
+        })
+
+        # Copy the windows from the strided view into the shard in as
+        # big of slices as fit
+        pos = 0
+        while pos < len(windows):
+            take = min(len(windows) - pos, len(shard) - filled)
+            shard[filled:filled+take] = windows[pos:pos+take]
+            filled += take
+            pos += take
+            if filled == len(shard):
+                flush()
+
+        if tail is not None:
+            shard[filled] = tail
+            filled += 1
+            if filled == len(shard):
+                flush()
+
+    flush()
+
+    with open(out_dir.joinpath("index.json"), 'w') as f:
+        json.dump(index, f, indent=4)
+    return index
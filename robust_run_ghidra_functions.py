@@ -15,6 +15,7 @@ from ripkit.cargo_picky import (
 )
 from ripkit.ripbin import (
     get_functions,
+    get_catalog,
 )
 import typer
 app = typer.Typer()
@@ -581,28 +582,9 @@ def bench(
         LOG_FILE = Path(f"GHIDRA_RUN_{opt_lvl}_rev{count}.json")
         count+=1
 
-    bins = []
-    for parent in Path("/home/ryan/.ripbin/ripped_bins/").iterdir():
-        info_file = parent / 'info.json'
-        info = {}
-        try:
-            with open(info_file, 'r') as f:
-                info = json.load(f)
-        except FileNotFoundError:
-            print(f"File not found: {info_file}")
-            continue
-        except json.JSONDecodeError as e:
-            print(f"JSON decoding error: {e}")
-            continue
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            continue
-
-        if info['optimization'] == opt_lvl[1]:
-            #npz_file = parent / "onehot_plus_func_labels.npz"
-            bin = [x for x in parent.iterdir() 
-                if ".npz" not in x.name and ".json" not in x.name][0]
-            bins.append(bin)
+    with get_catalog() as catalog:
+        bins = [Path(x['bin_path']) for x in catalog.find(optimization=opt_lvl)
+                    if x['bin_path'] != ""]
 
     # Only run on the last 30 files
     bins = bins[31:]
@@ -729,34 +711,13 @@ def timed_bench_all(
     # The base output dir
     OUT_DIR = Path(output_dir)
 
+    # One catalog query per opt lvl instead of reading every info.json
     bins_per_opt_lvl = {}
-    for opt_lvl in opt_lvls:
-        bins = []
-        for parent in Path("/home/ryan/.ripbin/ripped_bins/").iterdir():
-            info_file = parent / 'info.json'
-            info = {}
-            try:
-                with open(info_file, 'r') as f:
-                    info = json.load(f)
-            except FileNotFoundError:
-                print(f"File not found: {info_file}")
-                continue
-            except json.JSONDecodeError as e:
-                print(f"JSON decoding error: {e}")
-                continue
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                continue
-
-            if info['optimization'].upper() == opt_lvl[1]:
-                #npz_file = parent / "onehot_plus_func_labels.npz"
-                bin = [x for x in parent.iterdir() 
-                    if ".npz" not in x.name and ".json" not in x.name][0]
-                bins.append(bin)
-
-        # Add this list of binary files to the bins_per_opt_lvl with the 
-        # opt lvl as keey
-        bins_per_opt_lvl[opt_lvl] = bins
+    with get_catalog() as catalog:
+        for opt_lvl in opt_lvls:
+            bins_per_opt_lvl[opt_lvl] = [Path(x['bin_path']) for x in 
+                                         catalog.find(optimization=opt_lvl)
+                                            if x['bin_path'] != ""]
 
 
     # Need a set of all binaries in the dictionary
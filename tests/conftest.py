@@ -0,0 +1,70 @@
+"""
+Shared fixtures
+
+The ripbin db and the crates dir live under ~ and their paths are set
+when ripkit is imported, so HOME points to a temp dir for the whole
+session before any test imports ripkit. The tests never touch a real db
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+_HOME = tempfile.mkdtemp(prefix="ripkit-tests-")
+os.environ['HOME'] = _HOME
+
+# Two functions besides main so the binary has function bounds to label
+_HELLO_C = """
+#include <stdio.h>
+
+int add(int a, int b) { return a + b; }
+
+int mul(int a, int b) { return a * b; }
+
+int main(void) {
+    printf("%d\\n", add(2, mul(3, 4)));
+    return 0;
+}
+"""
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_HOME, ignore_errors=True)
+
+
+@pytest.fixture
+def ripbin_store():
+    '''
+    A new empty ripbin db, the ripbin_deterministic_db module is yielded
+    '''
+    from ripkit.ripbin import ripbin_deterministic_db as db
+
+    shutil.rmtree(db.DB_PATH, ignore_errors=True)
+    # Per process state of the store that the last test's db set
+    db._recovered = False
+    db._legacy_index = None
+    db.init()
+    yield db
+    shutil.rmtree(db.DB_PATH, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def elf_binary(tmp_path_factory)->Path:
+    '''
+    A small ELF with a symbol table, built with the host's C compiler
+    '''
+    cc = shutil.which("cc")
+    if cc is None:
+        pytest.skip("No C compiler to build the test binary")
+
+    build_dir = tmp_path_factory.mktemp("elf")
+    src = build_dir.joinpath("hello.c")
+    src.write_text(_HELLO_C)
+    out = build_dir.joinpath("hello")
+    subprocess.run([cc, "-O0", "-o", str(out), str(src)], check=True)
+    return out
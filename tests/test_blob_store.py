@@ -0,0 +1,70 @@
+import os
+
+from ripkit.ripbin.blob_store import BlobStore, reflink
+
+
+def _can_reflink(tmp_path)->bool:
+    src = tmp_path.joinpath("probe")
+    src.write_bytes(b"probe")
+    cloned = reflink(src, tmp_path.joinpath("probe.clone"))
+    tmp_path.joinpath("probe.clone").unlink(missing_ok=True)
+    src.unlink()
+    return cloned
+
+
+def test_add_never_links_the_source(tmp_path):
+    store = BlobStore(tmp_path.joinpath("blobs"))
+    src = tmp_path.joinpath("binary")
+    src.write_bytes(b"first" * 100)
+
+    blob = store.add(src)
+    assert blob.read_bytes() == b"first" * 100
+    assert not os.path.samefile(src, blob)
+
+    # Changing the caller's file doesn't change the stored content
+    src.write_bytes(b"second")
+    assert blob.read_bytes() == b"first" * 100
+
+
+def test_link_shares_one_blob(tmp_path):
+    store = BlobStore(tmp_path.joinpath("blobs"))
+    src = tmp_path.joinpath("binary")
+    src.write_bytes(b"content" * 100)
+    for pkg in ["a", "b"]:
+        tmp_path.joinpath(pkg).mkdir()
+        store.link(src, tmp_path.joinpath(pkg, "binary"))
+
+    blobs = list(store.root.glob("*/*"))
+    assert len(blobs) == 1
+    for pkg in ["a", "b"]:
+        dest = tmp_path.joinpath(pkg, "binary")
+        assert dest.read_bytes() == b"content" * 100
+        if not _can_reflink(tmp_path):
+            assert os.path.samefile(dest, blobs[0])
+
+    # Linking again is a no-op that leaves no temp file
+    store.link(src, tmp_path.joinpath("a", "binary"))
+    assert sorted(x.name for x in tmp_path.joinpath("a").iterdir()) == \
+            ["binary"]
+
+
+def test_dedup_and_gc(tmp_path):
+    store = BlobStore(tmp_path.joinpath("blobs"))
+    payloads = []
+    for pkg in ["a", "b"]:
+        tmp_path.joinpath(pkg).mkdir()
+        payload = tmp_path.joinpath(pkg, "analysis.npz")
+        payload.write_bytes(b"payload" * 100)
+        store.dedup(payload)
+        payloads.append(payload)
+
+    blob, = list(store.root.glob("*/*"))
+    # The first payload the store wrote becomes the blob
+    assert os.path.samefile(payloads[0], blob)
+    assert payloads[1].read_bytes() == b"payload" * 100
+
+    assert store.gc() == 0
+    for payload in payloads:
+        payload.unlink()
+    assert store.gc() == 1
+    assert list(store.root.glob("*/*")) == []
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ripkit.ripbin import byte_encoders
+from ripkit.ripbin.byte_encoders import BYTE_ENCODERS, get_byte_encoder
+from ripkit.ripbin.binary_analyzer import one_hot_encoding, \
+        generate_minimal_labeled_features, \
+        generate_minimal_labeled_features_array
+
+
+def test_onehot_legacy_matches_one_hot_encoding():
+    table = get_byte_encoder("onehot_legacy").table
+    for byte in range(256):
+        assert table[byte].tolist() == [bool(x) for x in
+                                        one_hot_encoding(byte)]
+
+
+def test_decimal_is_the_byte_value():
+    data = np.arange(256, dtype=np.uint8)
+    assert get_byte_encoder("decimal").encode(data)[:, 0].tolist() == \
+            list(range(256))
+
+
+@pytest.mark.parametrize("name", list(BYTE_ENCODERS))
+def test_encode_into_out(name, monkeypatch):
+    # Small blocks so a column slice out is filled over several blocks
+    monkeypatch.setattr(byte_encoders, "_ENCODE_BLOCK_ROWS", 64)
+    encoder = get_byte_encoder(name)
+    data = np.random.default_rng(0).integers(0, 256, 1000, dtype=np.uint8)
+    expected = encoder.table[data]
+
+    out = np.zeros((len(data), encoder.width), dtype=encoder.dtype)
+    assert np.array_equal(encoder.encode(data, out=out), expected)
+
+    matrix = np.zeros((len(data), 3 + encoder.width), dtype=encoder.dtype)
+    encoder.encode(data, out=matrix[:, 3:])
+    assert np.array_equal(matrix[:, 3:], expected)
+    assert not matrix[:, :3].any()
+
+
+def test_get_unknown_encoder():
+    with pytest.raises(ValueError):
+        get_byte_encoder("not_an_encoder")
+
+
+@pytest.mark.parametrize("use_one_hot", [True, False])
+def test_array_matches_generator(elf_binary, use_one_hot):
+    rows = np.array(list(generate_minimal_labeled_features(elf_binary,
+                                                           use_one_hot)))
+    matrix = generate_minimal_labeled_features_array(elf_binary, use_one_hot)
+    assert matrix.dtype == rows.dtype
+    assert np.array_equal(matrix, rows)
+    # The binary has functions, so there are labels to compare
+    assert matrix[:, 0].any()
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+from ripkit.ripbin.analyzer_types import AnalysisType
+from ripkit.ripbin.catalog import RipbinCatalog, normalize_opt_lvl
+from ripkit.ripbin.ingest import ingest_files
+
+
+def _info(**values)->dict:
+    info = {'binary_hash': "ab" * 16, 'binary_name': "exa",
+            'crate_name': "exa", 'target': "x86_64-unknown-linux-gnu",
+            'filetype': "elf", 'optimization': "2", 'strip_level': ""}
+    info.update(values)
+    return info
+
+
+def test_normalize_opt_lvl():
+    assert [normalize_opt_lvl(x) for x in ["O2", "o3", " Oz ", "s", "2", ""]] \
+            == ["2", "3", "z", "s", "2", ""]
+
+
+def test_upsert_keeps_recorded_values(tmp_path):
+    with RipbinCatalog(tmp_path.joinpath("catalog.sqlite")) as catalog:
+        catalog.add_binary(_info(), tmp_path, tmp_path.joinpath("exa"))
+        # A later save without the build metadata or the binary
+        catalog.add_binary(_info(target="", optimization="", crate_name=""),
+                           tmp_path)
+        row, = catalog.find()
+        assert row['optimization'] == "2"
+        assert row['target'] == "x86_64-unknown-linux-gnu"
+        assert row['crate_name'] == "exa"
+        assert row['bin_path'] == str(tmp_path.joinpath("exa"))
+        assert catalog.count(optimization="O2") == 1
+
+        # Values that are given still win
+        catalog.add_binary(_info(optimization="3"), tmp_path)
+        assert catalog.find()[0]['optimization'] == "3"
+
+
+def test_save_without_metadata_keeps_it(ripbin_store, tmp_path):
+    db = ripbin_store
+    binary = tmp_path.joinpath("exa")
+    binary.write_bytes(b"\x7fELF" + bytes(range(256)))
+    bin_hash = db.calculate_md5(binary)
+    data = np.arange(12, dtype=np.uint8).reshape(4, 3)
+
+    db.save_analysis(binary, data, AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS,
+                     db.RustFileBundle("exa", bin_hash, "x86_64-unknown-linux-gnu",
+                                       "elf", "2", "exa", "", ""))
+    db.save_analysis(binary, data, AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS,
+                     db.RustFileBundle("exa", bin_hash, "", "elf", "", "exa",
+                                       "", ""),
+                     save_bin=False)
+
+    pkg = db.find_package(bin_hash)
+    with open(pkg.joinpath("info.json"), 'r') as f:
+        info = json.load(f)
+    assert info['optimization'] == "2"
+    assert info['target'] == "x86_64-unknown-linux-gnu"
+
+    with db.get_catalog() as catalog:
+        row, = catalog.find(optimization="O2")
+    assert row['bin_path'] == str(pkg.joinpath("exa"))
+    assert np.array_equal(db.load_analysis(
+        bin_hash, AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS), data)
+    # Nothing left in staging
+    assert list(db.STAGING_PATH.iterdir()) == []
+
+
+def test_ingest_saves_the_normalized_opt_lvl(ripbin_store, elf_binary):
+    db = ripbin_store
+    summary = ingest_files([elf_binary], AnalysisType.BYTES_PLUS_FUNC_BOUNDS,
+                           workers=1, optimization="O2", show_bar=False)
+    assert summary.count('ok') == 1, summary.failures
+
+    pkg = db.find_package(db.calculate_md5(elf_binary))
+    with open(pkg.joinpath("info.json"), 'r') as f:
+        assert json.load(f)['optimization'] == "2"
+    with db.get_catalog() as catalog:
+        assert catalog.count(optimization="O2") == 1
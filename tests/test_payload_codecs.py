@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pytest
+
+from ripkit.ripbin import payload_codecs
+from ripkit.ripbin.payload_codecs import available_codecs, get_codec, \
+        write_npc, write_npc_stream, read_npc
+from ripkit.ripbin.analysis_io import write_generator_npc
+
+
+def _arrays():
+    return {
+        'matrix': np.arange(3000, dtype=np.int32).reshape(1000, 3),
+        'flags': np.arange(100) % 3 == 0,
+        'scalar': np.array(0x401000, dtype=np.int64),
+        'empty': np.zeros((0, 4), dtype=np.uint16),
+    }
+
+
+def _assert_same(read, arrays):
+    assert list(read) == list(arrays)
+    for key, array in arrays.items():
+        assert read[key].dtype == array.dtype
+        assert read[key].shape == array.shape
+        assert np.array_equal(read[key], array)
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_npc_round_trip(tmp_path, codec):
+    npc = tmp_path.joinpath("a.npc")
+    write_npc(npc, _arrays(), get_codec(codec))
+    _assert_same(read_npc(npc), _arrays())
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_npc_stream_round_trip(tmp_path, codec, monkeypatch):
+    # Small blocks so the stream is compressed in more than one
+    monkeypatch.setattr(payload_codecs, "_STREAM_BLOCK_SIZE", 1000)
+    array = np.random.default_rng(0).integers(0, 256, (5000, 7),
+                                              dtype=np.uint8)
+    npc = tmp_path.joinpath("a.npc")
+    write_npc_stream(npc, 'data', io.BytesIO(array.tobytes()), array.dtype,
+                     array.shape, get_codec(codec))
+    _assert_same(read_npc(npc), {'data': array})
+
+
+def test_npc_stream_short_source(tmp_path):
+    with pytest.raises(ValueError):
+        write_npc_stream(tmp_path.joinpath("a.npc"), 'data',
+                         io.BytesIO(b"\0" * 10), np.dtype(np.uint8), (20,),
+                         get_codec("zlib"))
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_generator_npc(tmp_path, codec):
+    rows = [np.array([x % 2, x % 3, x], dtype=np.uint16) for x in range(500)]
+    npc = tmp_path.joinpath("a.npc")
+    assert write_generator_npc(iter(rows), npc, codec, chunk_rows=64) == 500
+    _assert_same(read_npc(npc), {'data': np.array(rows)})
+    # Only the finished file is left behind
+    assert [x.name for x in tmp_path.iterdir()] == ["a.npc"]
+
+
+@pytest.mark.parametrize("spec", ["brotli", "zlib:fast"])
+def test_bad_codec_spec(spec):
+    with pytest.raises(ValueError):
+        get_codec(spec)
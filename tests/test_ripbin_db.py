@@ -0,0 +1,34 @@
+import pandas as pd
+
+from ripkit.ripbin import ripbin_db
+from ripkit.ripbin.ripbin_db import REGISTRY_COLUMNS
+
+
+def _row(bin_hash: str, analysis_type: str)->dict:
+    row = {x: "" for x in REGISTRY_COLUMNS}
+    row.update({'bin_hash': bin_hash, 'binary_name': "exa",
+                'analysis_type': analysis_type,
+                'package_path': f"/ripped_bins/exa_{bin_hash}"})
+    return row
+
+
+def test_csv_registry_is_imported_on_first_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(ripbin_db, "RIPBIN_REG",
+                        tmp_path.joinpath("ripped_bins_registry.csv"))
+    monkeypatch.setattr(ripbin_db, "RIPBIN_REG_DB",
+                        tmp_path.joinpath("ripped_bins_registry.sqlite"))
+    pd.DataFrame([_row("h1", "onehot_plus_func_labels"),
+                  _row("h1", "bytes_plus_func_bounds"),
+                  _row("h2", "onehot_plus_func_labels")]
+                 ).to_csv(ripbin_db.RIPBIN_REG, index=False)
+
+    rows = ripbin_db.lookup_by_hash("h1")
+    assert sorted(x['analysis_type'] for x in rows) == \
+            ["bytes_plus_func_bounds", "onehot_plus_func_labels"]
+    assert ripbin_db.RIPBIN_REG_DB.exists()
+
+    # Imported once, not again on the next use
+    ripbin_db.register_rows([_row("h3", "onehot_plus_func_labels")])
+    registry = ripbin_db.get_registry()
+    assert registry.shape == (4, len(REGISTRY_COLUMNS))
+    assert len(ripbin_db.lookup_by_package("/ripped_bins/exa_h2")) == 1
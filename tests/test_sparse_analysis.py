@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ripkit.ripbin.analyzer_types import AnalysisType
+from ripkit.ripbin.binary_analyzer import labeled_features_from_bounds
+from ripkit.ripbin.sparse_analysis import SparseFuncBoundsAnalysis
+
+
+def _analysis():
+    text_bytes = np.random.default_rng(0).integers(0, 256, 500,
+                                                   dtype=np.uint8)
+    starts = np.array([0, 37, 120, 121, 300, 499])
+    ends = np.array([36, 119, 250, 480])
+    return SparseFuncBoundsAnalysis(text_bytes, starts, ends, 0x1000)
+
+
+@pytest.mark.parametrize("start,stop", [(0, None), (0, 500), (37, 121),
+                                        (38, 119), (250, 251), (490, 900),
+                                        (100, 100)])
+def test_slice_matches_full_matrix(start, stop):
+    sparse = _analysis()
+    full_onehot = labeled_features_from_bounds(sparse.bytes,
+                                               sparse.func_starts,
+                                               sparse.func_ends, True)
+    full_decimal = labeled_features_from_bounds(sparse.bytes,
+                                                sparse.func_starts,
+                                                sparse.func_ends, False)
+    assert np.array_equal(sparse.onehot(start, stop),
+                          full_onehot[start:stop])
+    assert np.array_equal(sparse.decimal(start, stop),
+                          full_decimal[start:stop])
+
+
+def test_encode_slice():
+    sparse = _analysis()
+    matrix = sparse.encode("nibble", 30, 40)
+    assert matrix.shape == (10, 5)
+    assert np.array_equal(matrix[:, 3], sparse.bytes[30:40] >> 4)
+    # 37 is a start and 36 an end
+    assert matrix[7, 0] == 1 and matrix[6, 2] == 1
+
+
+def test_as_analysis():
+    sparse = _analysis()
+    assert np.array_equal(
+        sparse.as_analysis(AnalysisType.DEC_REPR_BYTE_PLUS_FUNC_LABELS, 5, 9),
+        sparse.decimal(5, 9))
+    with pytest.raises(Exception):
+        sparse.as_analysis(AnalysisType.BYTES_PLUS_FUNC_BOUNDS)
+
+
+def test_from_saved_arrays():
+    sparse = SparseFuncBoundsAnalysis.from_arrays({
+        'bytes': np.zeros(4, dtype=np.uint8),
+        'func_starts': np.array([0]),
+        'func_ends': np.array([3]),
+        # np.load maps a 0-d array as shape (1,)
+        'text_base': np.array([0x1000]),
+    })
+    assert len(sparse) == 4
+    assert sparse.text_base == 0x1000